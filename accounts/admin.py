@@ -1,5 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from companies.counters import recount_companies
 from .models import User, OTPVerification
 
 
@@ -7,6 +8,7 @@ from .models import User, OTPVerification
 class UserAdmin(BaseUserAdmin):
     list_display = ['email', 'first_name', 'last_name', 'company', 'status', 'email_verified', 'date_joined']
     list_filter = ['status', 'email_verified', 'is_staff', 'is_active', 'date_joined']
+    list_select_related = ['company']
     search_fields = ['email', 'first_name', 'last_name', 'username']
     ordering = ['-date_joined']
     
@@ -27,18 +29,24 @@ class UserAdmin(BaseUserAdmin):
     
     actions = ['approve_users', 'waitlist_users', 'suspend_users']
     
+    def _update_status(self, queryset, **values):
+        """Bulk status change; update() bypasses User.save(), so recount the affected companies"""
+        company_ids = set(queryset.exclude(company__isnull=True).values_list('company_id', flat=True))
+        queryset.update(**values)
+        recount_companies(company_ids)
+    
     def approve_users(self, request, queryset):
-        queryset.update(status='approved')
+        self._update_status(queryset, status='approved')
         self.message_user(request, f"{queryset.count()} users approved successfully.")
     approve_users.short_description = "Approve selected users"
     
     def waitlist_users(self, request, queryset):
-        queryset.update(status='waitlist')
+        self._update_status(queryset, status='waitlist')
         self.message_user(request, f"{queryset.count()} users moved to waitlist.")
     waitlist_users.short_description = "Move selected users to waitlist"
     
     def suspend_users(self, request, queryset):
-        queryset.update(status='suspended', is_active=False)
+        self._update_status(queryset, status='suspended', is_active=False)
         self.message_user(request, f"{queryset.count()} users suspended.")
     suspend_users.short_description = "Suspend selected users"
 
@@ -46,6 +54,7 @@ class UserAdmin(BaseUserAdmin):
 @admin.register(OTPVerification)
 class OTPVerificationAdmin(admin.ModelAdmin):
     list_display = ['user', 'otp_code', 'created_at', 'expires_at', 'is_used']
+    list_select_related = ['user']
     list_filter = ['is_used', 'created_at']
     search_fields = ['user__email', 'otp_code']
     readonly_fields = ['created_at']
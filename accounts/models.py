@@ -1,5 +1,5 @@
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import models, transaction
 from django.core.validators import EmailValidator
 import logging
 
@@ -83,6 +83,26 @@ class User(AbstractUser):
     def __str__(self):
         return f"{self.email} ({self.get_full_name() or 'No Name'})"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember loaded values so company counters can be adjusted on save
+        instance._loaded_status = instance.__dict__.get('status')
+        instance._loaded_company_id = instance.__dict__.get('company_id')
+        return instance
+    
+    def save(self, *args, **kwargs):
+        from companies.counters import COUNTED_FIELDS, sync_user_counters
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and not COUNTED_FIELDS.intersection(update_fields):
+            # e.g. last_login updates on every login
+            super().save(*args, **kwargs)
+            return
+        
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            sync_user_counters(self)
+    
     def get_display_name(self):
         """Get the name to display in listings"""
         if self.show_real_name:
@@ -100,14 +120,14 @@ class User(AbstractUser):
     def is_verified(self):
         """Check if user is fully verified and approved"""
         is_verified = self.email_verified and self.status == 'approved'
-        logger.debug(f"User {self.email} is_verified: email_verified={self.email_verified}, status={self.status}, result={is_verified}")
+        logger.debug("User %s is_verified: email_verified=%s, status=%s, result=%s", self.email, self.email_verified, self.status, is_verified)
         return is_verified
     
     def can_create_listing(self):
         """Check if user can create listings"""
         verified = self.is_verified()
         can_create = verified and self.is_active
-        logger.debug(f"User {self.email} can_create_listing: is_verified={verified}, is_active={self.is_active}, result={can_create}")
+        logger.debug("User %s can_create_listing: is_verified=%s, is_active=%s, result=%s", self.email, verified, self.is_active, can_create)
         return can_create
 
 
@@ -359,3 +359,68 @@ class EmailAsyncTests(TestCase):
         
         # Should complete successfully
         self.assertIn(response.status_code, [200, 302])
+
+
+class SignupCompanyLookupTests(TestCase):
+    """Tests for signup's company resolution."""
+    
+    def setUp(self):
+        """Set up test data."""
+        from django.core.cache import cache
+        cache.clear()
+        self.client = Client()
+        self.company = Company.objects.create(
+            name="Test Corp",
+            domain="testcorp.com",
+            status='approved'
+        )
+    
+    def _signup(self, email):
+        return self.client.post(reverse('accounts:signup'), {
+            'email': email,
+            'personal_email': 'me@gmail.com',
+            'password': 'TestPass123!',
+            'first_name': 'New',
+            'last_name': 'User',
+            'city': 'Pune',
+        })
+    
+    def test_signup_with_approved_domain_sets_pending(self):
+        """Test that approved-company users start as pending verification."""
+        response = self._signup('new@testcorp.com')
+        self.assertEqual(response.status_code, 302)
+        user = User.objects.get(email='new@testcorp.com')
+        self.assertEqual(user.status, 'pending')
+        self.assertEqual(user.company, self.company)
+    
+    def test_signups_from_unknown_domain_share_one_waitlist_company(self):
+        """Test that an unknown domain is waitlisted once and reused."""
+        self._signup('a@startup.io')
+        self._signup('b@startup.io')
+        self.assertEqual(Company.objects.filter(domain='startup.io', status='waitlist').count(), 1)
+        self.assertEqual(User.objects.filter(company__domain='startup.io', status='waitlist').count(), 2)
+    
+    def test_signup_with_rejected_domain_does_not_crash(self):
+        """Test that a rejected company's domain yields a rejected user instead of an error."""
+        Company.objects.create(name="Bad Corp", domain="bad.com", status='rejected')
+        response = self._signup('x@bad.com')
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(User.objects.get(email='x@bad.com').status, 'rejected')
+    
+    def test_stale_directory_entry_does_not_waitlist_approved_company(self):
+        """Test that signup uses the company's current status, not another worker's stale cache."""
+        from companies.directory import resolve_domain
+        Company.objects.create(name="Late Corp", domain="late.com", status='waitlist')
+        self.assertEqual(resolve_domain('late.com')['status'], 'waitlist')
+        # Approved elsewhere: this process's directory still says waitlist
+        Company.objects.filter(domain='late.com').update(status='approved')
+        self._signup('x@late.com')
+        self.assertEqual(User.objects.get(email='x@late.com').status, 'pending')
+    
+    def test_duplicate_email_is_rejected(self):
+        """Test that a second signup with the same email shows an error."""
+        self._signup('new@testcorp.com')
+        response = self._signup('new@testcorp.com')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Email already registered.')
+        self.assertEqual(User.objects.filter(email='new@testcorp.com').count(), 1)
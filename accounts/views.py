@@ -5,21 +5,30 @@ from django.contrib import messages
 from django.utils import timezone
 from django.conf import settings
 from django.core.mail import send_mail
+from django.db import IntegrityError, transaction
 from datetime import timedelta
 import random
 import logging
 from django_ratelimit.decorators import ratelimit
+from companies.directory import resolve_domain, get_or_create_waitlist_company
+from companies.models import Company
+from credmarket.background import enqueue
 from .models import User, OTPVerification
 
 logger = logging.getLogger(__name__)
 
+# Starting user status for each company status at signup
+SIGNUP_STATUS_BY_COMPANY_STATUS = {
+    'approved': 'pending',
+    'waitlist': 'waitlist',
+    'rejected': 'rejected',
+}
+
 
 def send_otp_email(user, otp_code):
     """Helper function to send OTP email with timeout protection"""
-    import threading
-    
     # ALWAYS log OTP to admin logs for testing/debugging
-    logger.warning(f"🔐 OTP GENERATED for {user.email}: {otp_code} (expires in 10 minutes)")
+    logger.warning("🔐 OTP GENERATED for %s: %s (expires in 10 minutes)", user.email, otp_code)
     
     def _send_email():
         try:
@@ -46,13 +55,12 @@ The CredMarket Team
                 fail_silently=True,  # Don't crash if email fails
                 timeout=10,  # 10 second timeout
             )
-            logger.info(f"OTP email sent successfully to {user.email}")
+            logger.info("OTP email sent successfully to %s", user.email)
         except Exception as e:
-            logger.error(f"Failed to send OTP email to {user.email}: {str(e)}")
+            logger.error("Failed to send OTP email to %s: %s", user.email, e)
     
-    # Send email in background thread to avoid blocking
-    email_thread = threading.Thread(target=_send_email, daemon=True)
-    email_thread.start()
+    # Send email on the background worker to avoid blocking
+    enqueue(_send_email)
     
     # Always return True immediately - email sends in background
     return True
@@ -64,7 +72,7 @@ def signup(request):
     """Handle user signup with email verification"""
     if request.method == 'POST':
         email = request.POST.get('email')
-        logger.info(f"Signup attempt for email: {email}")
+        logger.info("Signup attempt for email: %s", email)
         personal_email = request.POST.get('personal_email')
         first_name = request.POST.get('first_name')
         last_name = request.POST.get('last_name')
@@ -88,54 +96,54 @@ def signup(request):
             return render(request, 'accounts/signup.html')
         
         # Extract domain from email
-        domain = email.split('@')[1] if '@' in email else None
-        
-        # Check if email already exists
-        if User.objects.filter(email=email).exists():
-            messages.error(request, 'Email already registered.')
+        domain = email.split('@')[1] if email and '@' in email else None
+        if not domain:
+            messages.error(request, 'Please enter a valid corporate email address.')
             return render(request, 'accounts/signup.html')
         
-        # Check if domain is in whitelist
-        from companies.models import Company
-        try:
-            company = Company.objects.get(domain=domain, status='approved')
-            user_status = 'pending'
-            logger.info(f"User {email} matched to approved company: {company.name}")
-        except Company.DoesNotExist:
-            # Check if domain is already in waitlist
-            if Company.objects.filter(domain=domain, status='waitlist').exists():
-                user_status = 'waitlist'
-                company = Company.objects.get(domain=domain)
-                logger.info(f"User {email} matched to waitlist company: {company.name}")
-            else:
-                logger.warning(f"User {email} attempting signup with unknown domain: {domain}")
-                # Create new waitlist entry
-                company = Company.objects.create(
-                    domain=domain,
-                    name=domain.split('.')[0].title(),
-                    status='waitlist'
-                )
-                user_status = 'waitlist'
+        # One directory lookup decides the company and the user's starting status
+        company = resolve_domain(domain)
+        if company is None:
+            logger.warning("User %s attempting signup with unknown domain: %s", email, domain)
+            # Create new waitlist entry (race-safe for concurrent signups from the same domain)
+            company, _ = get_or_create_waitlist_company(domain)
         
-        # Create user
+        # Create user - the unique email constraint catches duplicates without a separate lookup
         username = email.split('@')[0] + str(random.randint(1000, 9999))
-        user = User.objects.create_user(
-            username=username,
-            email=email,
-            personal_email=personal_email,
-            first_name=first_name,
-            last_name=last_name,
-            password=password,
-            phone=phone if phone else None,
-            location=city,
-            area=area if area else '',
-            latitude=float(latitude) if latitude else None,
-            longitude=float(longitude) if longitude else None,
-            display_name=display_name if display_name else '',
-            show_real_name=show_real_name,
-            company=company,
-            status=user_status
-        )
+        try:
+            with transaction.atomic():
+                # The directory may be stale in this process (other workers approve
+                # companies too), so decide the status from the locked row; an
+                # approval running right now finishes first and is seen here
+                company_status = (
+                    Company.objects.select_for_update().filter(pk=company['id'])
+                    .values_list('status', flat=True).first()
+                ) or company['status']
+                user_status = SIGNUP_STATUS_BY_COMPANY_STATUS.get(company_status, 'waitlist')
+                user = User.objects.create_user(
+                    username=username,
+                    email=email,
+                    personal_email=personal_email,
+                    first_name=first_name,
+                    last_name=last_name,
+                    password=password,
+                    phone=phone if phone else None,
+                    location=city,
+                    area=area if area else '',
+                    latitude=float(latitude) if latitude else None,
+                    longitude=float(longitude) if longitude else None,
+                    display_name=display_name if display_name else '',
+                    show_real_name=show_real_name,
+                    company_id=company['id'],
+                    status=user_status
+                )
+        except IntegrityError:
+            if User.objects.filter(email=email).exists():
+                messages.error(request, 'Email already registered.')
+            else:
+                messages.error(request, 'Could not create your account. Please try again.')
+            return render(request, 'accounts/signup.html')
+        logger.info("User %s matched to %s company: %s", email, company_status, company['name'])
         
         # Generate and send OTP for all users (including waitlisted)
         otp_code = str(random.randint(100000, 999999))
@@ -244,7 +252,7 @@ def login_view(request):
         email = request.POST.get('email')
         password = request.POST.get('password')
         
-        logger.info(f"Login attempt for email: {email}")
+        logger.info("Login attempt for email: %s", email)
         
         user = authenticate(request, username=email, password=password)
         
@@ -254,7 +262,7 @@ def login_view(request):
                 return redirect('accounts:verify_otp')
             
             if user.status == 'waitlist':
-                messages.warning(request, f'Your company ({user.company.domain if user.company else "domain"}) is being reviewed by our team. You\'ll receive an email once approved (usually within 1-2 business days).')
+                messages.warning(request, f'Your company ({user.get_company_domain() or "domain"}) is being reviewed by our team. You\'ll receive an email once approved (usually within 1-2 business days).')
                 return render(request, 'accounts/login.html', {'debug': settings.DEBUG})
             
             if user.status == 'suspended':
@@ -1,11 +1,13 @@
 from django.contrib import admin
 from django.urls import path
 from django.shortcuts import render
-from django.db.models import Count, Avg, Sum
+from django.db.models import Count, Avg, Sum, Max, Q
 from django.utils import timezone
 from datetime import timedelta
-from .models import UserActivity, PlatformMetrics
+from .models import UserActivity, PlatformMetrics, SearchQueryLog
+from .search_log import flush_search_log
 from accounts.models import User
+from credmarket.db_router import use_read_replica
 from listings.models import Listing
 from messaging.models import Message
 
@@ -14,6 +16,7 @@ from messaging.models import Message
 class UserActivityAdmin(admin.ModelAdmin):
     list_display = ['user', 'session_start', 'session_end', 'page_views', 'duration_minutes']
     list_filter = ['session_start']
+    list_select_related = ['user']
     search_fields = ['user__email', 'user__first_name', 'user__last_name']
     readonly_fields = ['session_start', 'session_end', 'page_views', 'actions_performed']
     date_hierarchy = 'session_start'
@@ -43,7 +46,7 @@ class PlatformMetricsAdmin(admin.ModelAdmin):
     def get_urls(self):
         urls = super().get_urls()
         custom_urls = [
-            path('dashboard/', self.admin_site.admin_view(self.dashboard_view), name='analytics_dashboard'),
+            path('dashboard/', self.admin_site.admin_view(use_read_replica(self.dashboard_view)), name='analytics_dashboard'),
         ]
         return custom_urls + urls
     
@@ -171,3 +174,66 @@ class PlatformMetricsAdmin(admin.ModelAdmin):
         }
         
         return render(request, 'admin/analytics_dashboard.html', context)
+
+
+@admin.register(SearchQueryLog)
+class SearchQueryLogAdmin(admin.ModelAdmin):
+    list_display = ['query', 'result_count', 'latency_ms', 'source', 'created_at']
+    list_filter = ['source', 'created_at']
+    search_fields = ['query']
+    readonly_fields = ['query', 'filters', 'result_count', 'latency_ms', 'source', 'created_at']
+    date_hierarchy = 'created_at'
+    
+    REPORT_ROWS = 20
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def get_urls(self):
+        urls = super().get_urls()
+        custom_urls = [
+            path('report/', self.admin_site.admin_view(self.report_view), name='analytics_search_report'),
+        ]
+        return custom_urls + urls
+    
+    def report_view(self, request):
+        """Top, zero-result and slowest searches over the selected window"""
+        # Make sure the numbers include this process's unflushed searches
+        flush_search_log()
+        
+        try:
+            days = max(1, int(request.GET.get('days', 7)))
+        except ValueError:
+            days = 7
+        since = timezone.now() - timedelta(days=days)
+        
+        per_query = SearchQueryLog.objects.filter(created_at__gte=since).values('query').annotate(
+            searches=Count('id'),
+            avg_results=Avg('result_count'),
+            avg_latency=Avg('latency_ms'),
+            max_latency=Max('latency_ms'),
+            last_searched=Max('created_at'),
+        )
+        
+        top_queries = per_query.order_by('-searches')[:self.REPORT_ROWS]
+        zero_result_queries = per_query.filter(result_count=0).order_by('-searches')[:self.REPORT_ROWS]
+        slowest_queries = per_query.order_by('-avg_latency')[:self.REPORT_ROWS]
+        
+        totals = SearchQueryLog.objects.filter(created_at__gte=since).aggregate(
+            total=Count('id'),
+            zero_results=Count('id', filter=Q(result_count=0)),
+            avg_latency=Avg('latency_ms'),
+        )
+        
+        context = {
+            **self.admin_site.each_context(request),
+            'title': 'Search Report',
+            'days': days,
+            'total_searches': totals['total'],
+            'zero_result_searches': totals['zero_results'],
+            'avg_latency': round(totals['avg_latency'] or 0, 1),
+            'top_queries': top_queries,
+            'zero_result_queries': zero_result_queries,
+            'slowest_queries': slowest_queries,
+        }
+        return render(request, 'admin/search_report.html', context)
@@ -0,0 +1,31 @@
+# Generated by Django 5.0.1 on 2026-10-19 05:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchQueryLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('query', models.CharField(blank=True, help_text='Normalized search text', max_length=200)),
+                ('filters', models.JSONField(blank=True, default=dict)),
+                ('result_count', models.IntegerField(default=0)),
+                ('latency_ms', models.FloatField(default=0)),
+                ('source', models.CharField(blank=True, help_text='URL name of the view that ran the search', max_length=50)),
+                ('created_at', models.DateTimeField(db_index=True)),
+            ],
+            options={
+                'verbose_name': 'Search Query',
+                'verbose_name_plural': 'Search Queries',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['query', '-created_at'], name='analytics_s_query_42cd09_idx'), models.Index(fields=['result_count', '-created_at'], name='analytics_s_result__d8b50f_idx')],
+            },
+        ),
+    ]
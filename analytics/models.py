@@ -66,3 +66,28 @@ class PlatformMetrics(models.Model):
     
     def __str__(self):
         return f"Metrics for {self.date}"
+
+
+class SearchQueryLog(models.Model):
+    """
+    One row per search on the listing browse pages.
+    Rows are buffered in-process and written in batches (see analytics.search_log).
+    """
+    query = models.CharField(max_length=200, blank=True, help_text='Normalized search text')
+    filters = models.JSONField(default=dict, blank=True)
+    result_count = models.IntegerField(default=0)
+    latency_ms = models.FloatField(default=0)
+    source = models.CharField(max_length=50, blank=True, help_text='URL name of the view that ran the search')
+    created_at = models.DateTimeField(db_index=True)
+    
+    class Meta:
+        verbose_name = 'Search Query'
+        verbose_name_plural = 'Search Queries'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['query', '-created_at']),
+            models.Index(fields=['result_count', '-created_at']),
+        ]
+    
+    def __str__(self):
+        return f"'{self.query}' ({self.result_count} results, {self.latency_ms:.0f}ms)"
@@ -0,0 +1,116 @@
+"""
+Buffered search-query logging.
+
+Browse views call record_search() once per search. Entries are kept in a
+per-process buffer, and once the buffer is full or the flush interval has
+passed, a single bulk_create is queued on the background worker, so a
+search never costs a query on the request path.
+
+A process that has buffered searches also flushes what is left when it
+exits, provided the database can still be reached then. Processes that
+never record a search (most management commands) register nothing.
+"""
+import atexit
+import logging
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+from credmarket.background import enqueue
+
+logger = logging.getLogger(__name__)
+
+_buffer = []
+_lock = threading.Lock()
+_last_flush = time.monotonic()
+_flush_queued = False
+_exit_flush_registered = False
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def normalize_query(query):
+    """Lowercase and collapse whitespace so equivalent searches group together"""
+    if not query:
+        return ''
+    return _WHITESPACE_RE.sub(' ', query).strip().lower()[:200]
+
+
+def record_search(query, filters, result_count, latency_ms, source=''):
+    """Buffer one search; queues a flush to the database when the buffer is due"""
+    global _flush_queued, _exit_flush_registered
+    
+    if not getattr(settings, 'SEARCH_LOG_ENABLED', True):
+        return
+    
+    from .models import SearchQueryLog
+    
+    entry = SearchQueryLog(
+        query=normalize_query(query),
+        filters={key: value for key, value in filters.items() if value},
+        result_count=result_count,
+        latency_ms=round(latency_ms, 2),
+        source=source,
+        created_at=timezone.now(),
+    )
+    
+    buffer_size = getattr(settings, 'SEARCH_LOG_BUFFER_SIZE', 50)
+    flush_interval = getattr(settings, 'SEARCH_LOG_FLUSH_INTERVAL', 30)
+    
+    with _lock:
+        _buffer.append(entry)
+        due = not _flush_queued and (len(_buffer) >= buffer_size or time.monotonic() - _last_flush >= flush_interval)
+        if due:
+            _flush_queued = True
+        register_exit_flush = not _exit_flush_registered
+        _exit_flush_registered = True
+    
+    if register_exit_flush:
+        atexit.register(_flush_at_exit)
+    if due:
+        enqueue(flush_search_log)
+
+
+def flush_search_log():
+    """Write all buffered searches in one INSERT. Returns the number written."""
+    global _last_flush, _flush_queued
+    
+    from .models import SearchQueryLog
+    
+    with _lock:
+        entries = _buffer[:]
+        _buffer.clear()
+        _last_flush = time.monotonic()
+        _flush_queued = False
+    
+    if not entries:
+        return 0
+    
+    try:
+        SearchQueryLog.objects.bulk_create(entries)
+    except Exception as e:
+        # Search analytics must never break browsing
+        logger.error("Failed to flush %s search log entries: %s", len(entries), e)
+        return 0
+    return len(entries)
+
+
+def pending_count():
+    """Number of searches waiting in the buffer"""
+    with _lock:
+        return len(_buffer)
+
+
+def _flush_at_exit():
+    if not pending_count():
+        return
+    try:
+        connections['default'].ensure_connection()
+    except Exception as e:
+        logger.warning("Dropping %s buffered searches at exit, no database connection: %s", pending_count(), e)
+        return
+    flush_search_log()
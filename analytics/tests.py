@@ -0,0 +1,122 @@
+"""
+Tests for the analytics app.
+"""
+from django.test import TestCase, Client, override_settings
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+from analytics.models import SearchQueryLog
+from analytics.search_log import normalize_query, record_search, flush_search_log, pending_count
+from companies.models import Company
+from listings.models import Category, Listing
+
+User = get_user_model()
+
+
+class SearchLogTests(TestCase):
+    """Tests for the buffered search-query log."""
+    
+    def setUp(self):
+        """Start every test with an empty buffer."""
+        flush_search_log()
+        SearchQueryLog.objects.all().delete()
+    
+    def test_normalize_query(self):
+        """Test that queries are lowercased and whitespace-collapsed."""
+        self.assertEqual(normalize_query('  iPhone   15  Pro '), 'iphone 15 pro')
+        self.assertEqual(normalize_query(None), '')
+    
+    @override_settings(SEARCH_LOG_BUFFER_SIZE=3, SEARCH_LOG_FLUSH_INTERVAL=3600)
+    def test_searches_are_buffered_until_batch_is_full(self):
+        """Test that entries are written in one batch once the buffer fills."""
+        record_search('sofa', {'city': 'Pune'}, 4, 12.5)
+        record_search('sofa', {}, 0, 8.0)
+        self.assertEqual(pending_count(), 2)
+        self.assertEqual(SearchQueryLog.objects.count(), 0)
+        
+        record_search('desk', {'city': ''}, 1, 5.0)
+        self.assertEqual(pending_count(), 0)
+        self.assertEqual(SearchQueryLog.objects.count(), 3)
+        
+        # Empty filter values are dropped
+        self.assertEqual(SearchQueryLog.objects.get(query='desk').filters, {})
+    
+    @override_settings(SEARCH_LOG_ENABLED=False)
+    def test_disabled_search_log_records_nothing(self):
+        """Test that the log can be switched off."""
+        record_search('sofa', {}, 1, 1.0)
+        self.assertEqual(pending_count(), 0)
+    
+    @override_settings(SEARCH_LOG_BUFFER_SIZE=1)
+    def test_listing_list_records_search(self):
+        """Test that listing_list records query, filters and result count."""
+        company = Company.objects.create(name="Test Corp", domain="testcorp.com", status='approved')
+        user = User.objects.create_user(
+            username='seller', email='seller@testcorp.com', password='TestPass123!', company=company
+        )
+        category = Category.objects.create(name="Electronics", slug="electronics")
+        Listing.objects.create(
+            seller=user, title="iPhone 15", description="Phone", category=category,
+            price=500, condition='new', location='Andheri', city='Mumbai', state='MH'
+        )
+        
+        self.client.get(reverse('listings:listing_list'), {'q': 'IPhone', 'city': 'Mumbai'})
+        self.client.get(reverse('listings:listing_list'), {'q': 'nokia'})
+        
+        hit = SearchQueryLog.objects.get(query='iphone')
+        self.assertEqual(hit.result_count, 1)
+        self.assertEqual(hit.filters, {'city': 'Mumbai'})
+        self.assertEqual(hit.source, 'listing_list')
+        self.assertEqual(SearchQueryLog.objects.get(query='nokia').result_count, 0)
+    
+    def test_exit_flush_skips_without_database(self):
+        """Test that the flush at exit gives up quietly when the database can't be reached."""
+        from unittest import mock
+        from analytics import search_log
+        
+        record_search('sofa', {}, 1, 1.0)
+        with mock.patch('django.db.backends.base.base.BaseDatabaseWrapper.ensure_connection', side_effect=RuntimeError('no db')):
+            with self.assertLogs('analytics.search_log', 'WARNING'):
+                search_log._flush_at_exit()
+        self.assertEqual(pending_count(), 1)
+        search_log._flush_at_exit()
+        self.assertEqual(pending_count(), 0)
+        self.assertEqual(SearchQueryLog.objects.count(), 1)
+    
+    def test_plain_browse_is_not_logged(self):
+        """Test that visiting the list without a query or filter is not a search."""
+        self.client.get(reverse('listings:listing_list'))
+        self.assertEqual(pending_count(), 0)
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class SearchReportTests(TestCase):
+    """Tests for the admin search report."""
+    
+    def setUp(self):
+        """Set up an admin user and some logged searches."""
+        flush_search_log()
+        self.client = Client()
+        self.admin = User.objects.create_superuser(
+            username='admin', email='admin@testcorp.com', password='AdminPass123!'
+        )
+        self.client.force_login(self.admin)
+        record_search('sofa', {}, 0, 40.0)
+        record_search('sofa', {}, 0, 60.0)
+        record_search('laptop', {}, 7, 5.0)
+    
+    def test_report_lists_top_zero_result_and_slow_queries(self):
+        """Test that the report aggregates per normalized query."""
+        response = self.client.get(reverse('admin:analytics_search_report'))
+        self.assertEqual(response.status_code, 200)
+        
+        top = list(response.context['top_queries'])
+        self.assertEqual(top[0]['query'], 'sofa')
+        self.assertEqual(top[0]['searches'], 2)
+        
+        zero = [row['query'] for row in response.context['zero_result_queries']]
+        self.assertEqual(zero, ['sofa'])
+        
+        slowest = list(response.context['slowest_queries'])
+        self.assertEqual(slowest[0]['query'], 'sofa')
+        self.assertEqual(slowest[0]['avg_latency'], 50.0)
+        self.assertEqual(response.context['total_searches'], 3)
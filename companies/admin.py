@@ -1,14 +1,16 @@
 from django.contrib import admin
 from django.utils import timezone
 from .models import Company
+from .directory import invalidate_domains
+from .services import approve_companies
 
 
 @admin.register(Company)
 class CompanyAdmin(admin.ModelAdmin):
-    list_display = ['name', 'domain', 'status', 'employee_count', 'created_at', 'approved_at']
+    list_display = ['name', 'domain', 'status', 'approved_employee_count', 'created_at', 'approved_at']
     list_filter = ['status', 'created_at']
     search_fields = ['name', 'domain']
-    readonly_fields = ['created_at', 'updated_at', 'approved_at', 'employee_count']
+    readonly_fields = ['created_at', 'updated_at', 'approved_at', 'approved_employee_count']
     ordering = ['-created_at']
     
     fieldsets = (
@@ -19,7 +21,7 @@ class CompanyAdmin(admin.ModelAdmin):
             'fields': ('status', 'added_by', 'approved_by', 'approved_at')
         }),
         ('Metadata', {
-            'fields': ('created_at', 'updated_at', 'employee_count'),
+            'fields': ('created_at', 'updated_at', 'approved_employee_count'),
             'classes': ('collapse',)
         }),
     )
@@ -28,27 +30,26 @@ class CompanyAdmin(admin.ModelAdmin):
     
     def approve_companies(self, request, queryset):
         """Approve selected companies"""
-        for company in queryset:
-            company.status = 'approved'
-            company.approved_by = request.user
-            company.approved_at = timezone.now()
-            company.save()
-            
-            # Update all employees of this company
-            company.employees.filter(status='waitlist').update(status='approved')
-        
-        self.message_user(request, f"{queryset.count()} companies approved successfully.")
+        approved, promoted = approve_companies(
+            queryset.values_list('id', flat=True),
+            approved_by=request.user,
+        )
+        self.message_user(request, f"{approved} companies approved successfully, {promoted} waitlisted users promoted.")
     approve_companies.short_description = "Approve selected companies"
     
     def reject_companies(self, request, queryset):
         """Reject selected companies"""
+        domains = list(queryset.values_list('domain', flat=True))
         queryset.update(status='rejected')
+        invalidate_domains(domains)
         self.message_user(request, f"{queryset.count()} companies rejected.")
     reject_companies.short_description = "Reject selected companies"
     
     def move_to_waitlist(self, request, queryset):
         """Move selected companies to waitlist"""
+        domains = list(queryset.values_list('domain', flat=True))
         queryset.update(status='waitlist', approved_at=None, approved_by=None)
+        invalidate_domains(domains)
         self.message_user(request, f"{queryset.count()} companies moved to waitlist.")
     move_to_waitlist.short_description = "Move to waitlist"
     
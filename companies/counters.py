@@ -0,0 +1,72 @@
+"""
+Maintained company counters.
+
+Company.approved_employee_count holds the number of approved users of a
+company. User.save() adjusts it with F() expressions in the same
+transaction as the status/company change; bulk paths (company approval,
+admin actions) adjust or recount explicitly, and `manage.py recount`
+rebuilds it from scratch.
+"""
+from django.db.models import Count, F
+
+# Saving any of these can move a user in or out of a company's count
+COUNTED_FIELDS = {'status', 'company', 'company_id'}
+
+
+def adjust_company_count(company_id, delta):
+    """Add delta to a company's approved employee count"""
+    from .models import Company
+    
+    if company_id is None or not delta:
+        return
+    Company.objects.filter(id=company_id).update(
+        approved_employee_count=F('approved_employee_count') + delta
+    )
+
+
+def sync_user_counters(user, deleted=False):
+    """
+    Apply the counter change implied by a user's save or delete.
+    Compares against the status/company the instance was loaded with.
+    """
+    loaded_status = getattr(user, '_loaded_status', None)
+    loaded_company_id = getattr(user, '_loaded_company_id', None)
+    
+    was_approved = loaded_status == 'approved'
+    is_approved = user.status == 'approved' and not deleted
+    moved = loaded_company_id != user.company_id
+    
+    if was_approved and (not is_approved or moved):
+        adjust_company_count(loaded_company_id, -1)
+    if is_approved and (not was_approved or moved):
+        adjust_company_count(user.company_id, 1)
+    
+    user._loaded_status = None if deleted else user.status
+    user._loaded_company_id = None if deleted else user.company_id
+
+
+def recount_companies(company_ids=None):
+    """
+    Rebuild approved employee counts from the users table, for all companies
+    or just the given ones. Returns the number of companies that were wrong.
+    """
+    from accounts.models import User
+    from .models import Company
+    
+    companies = Company.objects.only('id', 'approved_employee_count')
+    users = User.objects.filter(status='approved', company__isnull=False)
+    if company_ids is not None:
+        company_ids = list(company_ids)
+        companies = companies.filter(id__in=company_ids)
+        users = users.filter(company_id__in=company_ids)
+    
+    counts = dict(users.values_list('company_id').annotate(count=Count('id')).order_by())
+    
+    stale = []
+    for company in companies:
+        actual = counts.get(company.id, 0)
+        if company.approved_employee_count != actual:
+            company.approved_employee_count = actual
+            stale.append(company)
+    Company.objects.bulk_update(stale, ['approved_employee_count'], batch_size=500)
+    return len(stale)
@@ -0,0 +1,99 @@
+"""
+Domain -> company lookup for signup and login.
+
+Lookups go through a short-lived in-process map, then the shared cache, then
+the database, and return a small dict rather than a model instance so the
+result is cheap to cache. Unknown domains are cached too (as None).
+companies.signals invalidates both layers whenever a company is saved or
+deleted; bulk queryset updates must call invalidate_domains() themselves.
+
+Invalidation only reaches this process's map (and the cache, when CACHES is
+per-process), so other workers can hold a stale status until their entries
+expire. Treat the status as a hint: signup re-reads it from the company row
+before deciding the user's status.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Company
+
+CACHE_KEY_PREFIX = 'company-domain:'
+LOCAL_MAX_ENTRIES = 1000
+DIRECTORY_FIELDS = ('id', 'name', 'domain', 'status')
+
+_MISSING = object()
+_local = {}
+_lock = threading.Lock()
+
+
+def _cache_key(domain):
+    return f'{CACHE_KEY_PREFIX}{domain}'
+
+
+def _remember_locally(domain, record):
+    ttl = getattr(settings, 'COMPANY_DIRECTORY_LOCAL_TTL', 30)
+    with _lock:
+        if len(_local) >= LOCAL_MAX_ENTRIES:
+            _local.clear()
+        _local[domain] = (time.monotonic() + ttl, record)
+
+
+def resolve_domain(domain):
+    """
+    Get the company registered for an email domain.
+    Returns a dict with id, name, domain and status, or None if unknown.
+    """
+    if not domain:
+        return None
+    
+    entry = _local.get(domain)
+    if entry is not None and entry[0] > time.monotonic():
+        return entry[1]
+    
+    record = cache.get(_cache_key(domain), _MISSING)
+    if record is _MISSING:
+        record = Company.objects.filter(domain=domain).values(*DIRECTORY_FIELDS).first()
+        cache.set(_cache_key(domain), record, getattr(settings, 'COMPANY_DIRECTORY_CACHE_TIMEOUT', 3600))
+    
+    _remember_locally(domain, record)
+    return record
+
+
+def get_or_create_waitlist_company(domain):
+    """
+    Get the company for a domain, creating a waitlist entry if it is new.
+    Safe under concurrent signups from the same unknown domain: the unique
+    constraint on Company.domain decides the winner and get_or_create falls
+    back to reading the winner's row.
+    """
+    company, created = Company.objects.get_or_create(
+        domain=domain,
+        defaults={
+            'name': domain.split('.')[0].title(),
+            'status': 'waitlist',
+        }
+    )
+    record = {field: getattr(company, field) for field in DIRECTORY_FIELDS}
+    # Overwrite any negative entry cached before the row existed
+    cache.set(_cache_key(domain), record, getattr(settings, 'COMPANY_DIRECTORY_CACHE_TIMEOUT', 3600))
+    _remember_locally(domain, record)
+    return record, created
+
+
+def invalidate_domain(domain):
+    """Drop a domain from both the in-process map and the shared cache"""
+    with _lock:
+        _local.pop(domain, None)
+    cache.delete(_cache_key(domain))
+
+
+def invalidate_domains(domains):
+    """Invalidate several domains, e.g. after a bulk queryset update"""
+    domains = list(domains)
+    with _lock:
+        for domain in domains:
+            _local.pop(domain, None)
+    cache.delete_many([_cache_key(domain) for domain in domains])
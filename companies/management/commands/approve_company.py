@@ -1,7 +1,8 @@
+from django.conf import settings
 from django.core.management.base import BaseCommand
 from companies.models import Company
-from accounts.models import User
-from companies.signals import send_approval_email
+from companies.services import approve_companies
+from credmarket.background import drain
 
 
 class Command(BaseCommand):
@@ -25,40 +26,22 @@ class Command(BaseCommand):
         
         if company.status == 'approved':
             self.stdout.write(self.style.WARNING(f'Company "{company.name}" is already approved'))
+            return
+        
+        self.stdout.write(self.style.NOTICE(f'Approving company: {company.name} ({domain})'))
+        self.stdout.write(self.style.NOTICE(f'Previous status: {company.status}'))
+        
+        # Approval, user promotion and the notification job happen in one transaction
+        _, promoted = approve_companies([company.id])
+        
+        if promoted == 0:
+            self.stdout.write(self.style.WARNING('No waitlisted users to notify'))
+        
+        self.stdout.write(self.style.SUCCESS(f'\n✓ Company approved!'))
+        self.stdout.write(self.style.SUCCESS(f'✓ Promoted {promoted} waitlisted users'))
+        
+        # The emails go out on the background worker; don't exit before it's done
+        if drain(timeout=settings.BACKGROUND_DRAIN_SECONDS):
+            self.stdout.write(self.style.SUCCESS('✓ Approval emails sent to verified users'))
         else:
-            self.stdout.write(self.style.NOTICE(f'Approving company: {company.name} ({domain})'))
-            self.stdout.write(self.style.NOTICE(f'Previous status: {company.status}'))
-            
-            # Get waitlisted users before changing status
-            waitlisted_users = User.objects.filter(
-                company=company,
-                status='waitlist',
-                email_verified=True
-            )
-            
-            user_count = waitlisted_users.count()
-            self.stdout.write(self.style.NOTICE(f'Found {user_count} waitlisted users'))
-            
-            if user_count == 0:
-                self.stdout.write(self.style.WARNING('No waitlisted users to notify'))
-            
-            # Update company status
-            company.status = 'approved'
-            company.save()
-            
-            # Update users and send emails
-            success_count = 0
-            for user in waitlisted_users:
-                user.status = 'approved'
-                user.save()
-                
-                # Send email
-                if send_approval_email(user, company):
-                    success_count += 1
-                    self.stdout.write(self.style.SUCCESS(f'  ✓ Sent email to {user.email}'))
-                else:
-                    self.stdout.write(self.style.ERROR(f'  ✗ Failed to send email to {user.email}'))
-            
-            self.stdout.write(self.style.SUCCESS(f'\n✓ Company approved!'))
-            self.stdout.write(self.style.SUCCESS(f'✓ Updated {user_count} users to approved status'))
-            self.stdout.write(self.style.SUCCESS(f'✓ Sent {success_count}/{user_count} approval emails'))
+            self.stdout.write(self.style.ERROR('Timed out waiting for approval emails to send'))
@@ -0,0 +1,34 @@
+# Generated by Django 5.0.1 on 2026-10-19 05:42
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_approved_employee_count(apps, schema_editor):
+    Company = apps.get_model('companies', 'Company')
+    User = apps.get_model('accounts', 'User')
+    counts = (
+        User.objects.filter(status='approved', company__isnull=False)
+        .values_list('company_id')
+        .annotate(count=Count('id'))
+        .order_by()
+    )
+    for company_id, count in counts:
+        Company.objects.filter(id=company_id).update(approved_employee_count=count)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('companies', '0001_initial'),
+        ('accounts', '0006_add_email_preferences'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='company',
+            name='approved_employee_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='approved employees'),
+        ),
+        migrations.RunPython(backfill_approved_employee_count, migrations.RunPython.noop),
+    ]
@@ -27,6 +27,9 @@ class Company(models.Model):
     website = models.URLField(blank=True, null=True)
     logo = models.ImageField(upload_to='companies/', blank=True, null=True)
     
+    # Maintained by companies.counters
+    approved_employee_count = models.IntegerField('approved employees', default=0, editable=False)
+    
     # Admin tracking
     added_by = models.ForeignKey(
         'accounts.User',
@@ -56,6 +59,24 @@ class Company(models.Model):
     def __str__(self):
         return f"{self.name} ({self.domain}) - {self.status}"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember loaded values so signals can detect status/domain changes without re-reading the row
+        instance._loaded_status = instance.__dict__.get('status')
+        instance._loaded_domain = instance.__dict__.get('domain')
+        return instance
+    
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            # Never write back a possibly stale counter from this instance
+            skip = self.get_deferred_fields() | {'approved_employee_count'}
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.attname not in skip and field.name not in skip
+            ]
+        super().save(*args, **kwargs)
+    
     def employee_count(self):
         """Get number of registered employees"""
         return self.employees.count()
@@ -0,0 +1,96 @@
+"""
+Company approval workflow.
+
+Approving a company promotes its waitlisted users with a single UPDATE and
+queues one batched job that emails every promoted user over a single SMTP
+connection. The ids of the users to notify are captured *before* the
+update, since afterwards they no longer match status='waitlist'.
+"""
+from django.db import transaction
+from django.db.models import Case, When, Value, Count
+from django.utils import timezone
+from accounts.models import User
+from credmarket.background import enqueue
+from .models import Company
+from .counters import adjust_company_count
+from .directory import invalidate_domains
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def promote_waitlisted_users(company_ids):
+    """
+    Promote waitlisted users of the given companies.
+    Verified users become approved and are notified; users who haven't
+    verified their email yet become pending, so OTP verification approves them.
+    Returns the number of users promoted.
+    """
+    waitlisted = User.objects.filter(company_id__in=company_ids, status='waitlist')
+    verified = waitlisted.filter(email_verified=True)
+    notify_ids = list(verified.values_list('id', flat=True))
+    approved_per_company = list(verified.values_list('company_id').annotate(count=Count('id')).order_by())
+    
+    with transaction.atomic():
+        promoted = waitlisted.update(
+            status=Case(
+                When(email_verified=True, then=Value('approved')),
+                default=Value('pending'),
+            )
+        )
+        for company_id, count in approved_per_company:
+            adjust_company_count(company_id, count)
+    
+    if notify_ids:
+        # Send only once the promotion is committed
+        transaction.on_commit(lambda: enqueue(send_approval_emails, notify_ids))
+    
+    logger.info("Promoted %s waitlisted users for companies %s", promoted, list(company_ids))
+    return promoted
+
+
+def approve_companies(company_ids, approved_by=None):
+    """
+    Approve companies and promote their waitlisted users in one transaction.
+    Companies that are already approved are left untouched.
+    Returns (approved_company_count, promoted_user_count).
+    """
+    with transaction.atomic():
+        companies = list(
+            Company.objects.select_for_update()
+            .filter(id__in=list(company_ids))
+            .exclude(status='approved')
+            .values_list('id', 'domain')
+        )
+        if not companies:
+            return 0, 0
+        
+        ids = [company_id for company_id, _ in companies]
+        Company.objects.filter(id__in=ids).update(
+            status='approved',
+            approved_by=approved_by,
+            approved_at=timezone.now(),
+        )
+        promoted = promote_waitlisted_users(ids)
+        
+        # queryset.update() skips post_save, so refresh the domain cache ourselves
+        domains = [domain for _, domain in companies]
+        transaction.on_commit(lambda: invalidate_domains(domains))
+    
+    return len(ids), promoted
+
+
+def send_approval_emails(user_ids):
+    """Background job: email every promoted user over one SMTP connection"""
+    from django.core.mail import get_connection
+    from .signals import build_approval_email
+    
+    users = User.objects.filter(id__in=user_ids).select_related('company')
+    emails = [build_approval_email(user, user.company) for user in users if user.company]
+    if not emails:
+        return 0
+    
+    connection = get_connection(fail_silently=True, timeout=10)
+    sent = connection.send_messages(emails) or 0
+    logger.info("Sent %s/%s company approval emails", sent, len(emails))
+    return sent
@@ -1,57 +1,54 @@
-from django.db.models.signals import post_save, pre_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from django.core.mail import send_mail
+from django.core.mail import EmailMultiAlternatives
 from django.conf import settings
-from .models import Company
 from accounts.models import User
+from .models import Company
+from .directory import invalidate_domain
+import logging
+
+logger = logging.getLogger(__name__)
 
 
-@receiver(pre_save, sender=Company)
-def track_company_status_change(sender, instance, **kwargs):
-    """Track the previous status before save"""
-    if instance.pk:
-        try:
-            old_instance = Company.objects.get(pk=instance.pk)
-            instance._previous_status = old_instance.status
-        except Company.DoesNotExist:
-            instance._previous_status = None
-    else:
-        instance._previous_status = None
+@receiver(post_save, sender=Company)
+@receiver(post_delete, sender=Company)
+def invalidate_company_directory(sender, instance, **kwargs):
+    """Keep the cached domain -> company lookup in sync with the table"""
+    invalidate_domain(instance.domain)
+    loaded_domain = getattr(instance, '_loaded_domain', None)
+    if loaded_domain and loaded_domain != instance.domain:
+        invalidate_domain(loaded_domain)
+
+
+@receiver(post_delete, sender=User)
+def release_employee_counter(sender, instance, **kwargs):
+    """Deleting an approved user takes them out of their company's count"""
+    from .counters import sync_user_counters
+    sync_user_counters(instance, deleted=True)
 
 
 @receiver(post_save, sender=Company)
 def notify_waitlisted_users_on_approval(sender, instance, created, **kwargs):
     """
-    When a company status changes from 'waitlist' to 'approved',
-    notify all waitlisted users and update their status.
+    When a company becomes approved, promote its waitlisted users and
+    queue one batched approval email for them.
+    The previous status comes from Company.from_db, so no extra query is needed.
     """
-    # Only process if company status changed from waitlist to approved
-    if not created and instance.status == 'approved':
-        previous_status = getattr(instance, '_previous_status', None)
-        
-        # Only proceed if status changed from waitlist to approved
-        if previous_status == 'waitlist':
-            # Find all waitlisted users for this company
-            waitlisted_users = User.objects.filter(
-                company=instance,
-                status='waitlist',
-                email_verified=True
-            )
-            
-            if waitlisted_users.exists():
-                print(f"Found {waitlisted_users.count()} waitlisted users for {instance.domain}")
-                
-                # Update all users to approved status
-                waitlisted_users.update(status='approved')
-                
-                # Send email to each user
-                for user in waitlisted_users:
-                    send_approval_email(user, instance)
-                    print(f"Sent approval email to {user.email}")
+    loaded_status = getattr(instance, '_loaded_status', None)
+    
+    # Subsequent saves of this instance compare against what was just written
+    instance._loaded_status = instance.status
+    instance._loaded_domain = instance.domain
+    
+    if created or instance.status != 'approved' or loaded_status in (None, 'approved'):
+        return
+    
+    from .services import promote_waitlisted_users
+    promote_waitlisted_users([instance.pk])
 
 
-def send_approval_email(user, company):
-    """Send approval notification email to user"""
+def build_approval_email(user, company):
+    """Build the approval notification email for a user"""
     subject = f'🎉 Your Company Has Been Approved on CredMarket!'
     
     message = f"""Hi {user.first_name},
@@ -136,23 +133,20 @@ Questions? Reply to this email or contact support@credmarket.com
     </html>
     """
     
-    # Send email async to avoid blocking
-    import threading
-    
-    def _send():
-        try:
-            send_mail(
-                subject=subject,
-                message=message,
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[user.personal_email],
-                html_message=html_message,
-                fail_silently=True,
-                timeout=10,
-            )
-            logger.info(f"Company approval email sent to {user.personal_email}")
-        except Exception as e:
-            logger.error(f"Error sending email to {user.personal_email}: {str(e)}")
+    email = EmailMultiAlternatives(
+        subject=subject,
+        body=message,
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[user.personal_email],
+    )
+    email.attach_alternative(html_message, 'text/html')
+    return email
+
+
+def send_approval_email(user, company):
+    """Queue an approval notification email for a single user"""
+    from credmarket.background import enqueue
+    from .services import send_approval_emails
     
-    threading.Thread(target=_send, daemon=True).start()
+    enqueue(send_approval_emails, [user.id])
     return True  # Return immediately
@@ -1,7 +1,7 @@
 """
 Tests for the companies app.
 """
-from django.test import TestCase, Client
+from django.test import TestCase, Client, override_settings
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 from companies.models import Company
@@ -145,3 +145,229 @@ class AdminDashboardTests(TestCase):
     
 
 
+
+
+class CompanyDirectoryTests(TestCase):
+    """Tests for the cached domain -> company lookup."""
+    
+    def setUp(self):
+        """Set up test data."""
+        from django.core.cache import cache
+        cache.clear()
+        self.company = Company.objects.create(
+            name="Test Corp",
+            domain="testcorp.com",
+            status='approved'
+        )
+    
+    def test_resolve_domain_hits_database_once(self):
+        """Test that repeated lookups are served from cache."""
+        from companies.directory import resolve_domain
+        
+        with self.assertNumQueries(1):
+            record = resolve_domain('testcorp.com')
+        self.assertEqual(record['id'], self.company.id)
+        self.assertEqual(record['status'], 'approved')
+        
+        with self.assertNumQueries(0):
+            self.assertEqual(resolve_domain('testcorp.com'), record)
+    
+    def test_unknown_domain_is_cached(self):
+        """Test that unknown domains are negatively cached."""
+        from companies.directory import resolve_domain
+        
+        self.assertIsNone(resolve_domain('unknown.com'))
+        with self.assertNumQueries(0):
+            self.assertIsNone(resolve_domain('unknown.com'))
+    
+    def test_status_change_invalidates_lookup(self):
+        """Test that saving a company refreshes its cached record."""
+        from companies.directory import resolve_domain
+        
+        resolve_domain('testcorp.com')
+        self.company.status = 'rejected'
+        self.company.save()
+        self.assertEqual(resolve_domain('testcorp.com')['status'], 'rejected')
+    
+    def test_new_company_replaces_negative_entry(self):
+        """Test that creating a company clears a cached 'unknown domain'."""
+        from companies.directory import resolve_domain
+        
+        self.assertIsNone(resolve_domain('newcorp.com'))
+        Company.objects.create(name="New Corp", domain="newcorp.com", status='waitlist')
+        self.assertEqual(resolve_domain('newcorp.com')['status'], 'waitlist')
+    
+    def test_get_or_create_waitlist_company_is_idempotent(self):
+        """Test that repeated waitlist creation for a domain reuses one row."""
+        from companies.directory import get_or_create_waitlist_company
+        
+        first, created = get_or_create_waitlist_company('startup.io')
+        self.assertTrue(created)
+        self.assertEqual(first['status'], 'waitlist')
+        self.assertEqual(first['name'], 'Startup')
+        
+        second, created = get_or_create_waitlist_company('startup.io')
+        self.assertFalse(created)
+        self.assertEqual(second['id'], first['id'])
+        self.assertEqual(Company.objects.filter(domain='startup.io').count(), 1)
+
+
+@override_settings(BACKGROUND_JOBS_EAGER=True)
+class CompanyApprovalTests(TestCase):
+    """Tests for set-based company approval and batched notification."""
+    
+    def setUp(self):
+        """Set up two waitlisted companies with users."""
+        self.acme = Company.objects.create(name="Acme", domain="acme.com", status='waitlist')
+        self.globex = Company.objects.create(name="Globex", domain="globex.com", status='waitlist')
+        for i, company in enumerate([self.acme, self.acme, self.globex]):
+            User.objects.create_user(
+                username=f'verified{i}',
+                email=f'verified{i}@{company.domain}',
+                personal_email=f'verified{i}@gmail.com',
+                password='TestPass123!',
+                company=company,
+                status='waitlist',
+                email_verified=True
+            )
+        User.objects.create_user(
+            username='unverified',
+            email='unverified@acme.com',
+            password='TestPass123!',
+            company=self.acme,
+            status='waitlist',
+            email_verified=False
+        )
+    
+    def test_saving_approved_status_promotes_and_notifies(self):
+        """Test that approving via save promotes users and sends one batch."""
+        from django.core import mail
+        
+        company = Company.objects.get(pk=self.acme.pk)
+        company.status = 'approved'
+        with self.captureOnCommitCallbacks(execute=True):
+            company.save()
+        
+        self.assertEqual(User.objects.filter(company=self.acme, status='approved').count(), 2)
+        # Unverified users still need OTP verification before being approved
+        self.assertEqual(User.objects.get(email='unverified@acme.com').status, 'pending')
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox), ['verified0@gmail.com', 'verified1@gmail.com'])
+    
+    def test_save_does_not_reload_company(self):
+        """Test that saving a loaded company needs no extra SELECT to track status."""
+        company = Company.objects.get(pk=self.acme.pk)
+        company.description = 'Updated'
+        with self.assertNumQueries(1):
+            company.save()
+    
+    def test_approve_companies_handles_many_in_one_transaction(self):
+        """Test bulk approval of several companies."""
+        from django.core import mail
+        from companies.services import approve_companies
+        
+        admin = User.objects.create_superuser(username='admin', email='admin@example.com', password='AdminPass123!')
+        with self.captureOnCommitCallbacks(execute=True):
+            approved, promoted = approve_companies([self.acme.id, self.globex.id], approved_by=admin)
+        
+        self.assertEqual((approved, promoted), (2, 4))
+        self.assertEqual(Company.objects.filter(status='approved', approved_by=admin).count(), 2)
+        self.assertEqual(User.objects.filter(status='waitlist').count(), 0)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(
+            dict(Company.objects.values_list('domain', 'approved_employee_count')),
+            {'acme.com': 2, 'globex.com': 1}
+        )
+    
+    def test_approve_companies_skips_already_approved(self):
+        """Test that re-approving is a no-op."""
+        from companies.services import approve_companies
+        
+        approve_companies([self.acme.id])
+        self.assertEqual(approve_companies([self.acme.id]), (0, 0))
+    
+    def test_admin_action_uses_bulk_service(self):
+        """Test the admin approve action approves all selected companies."""
+        admin = User.objects.create_superuser(username='admin', email='admin@example.com', password='AdminPass123!')
+        self.client.force_login(admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('admin:companies_company_changelist'), {
+                'action': 'approve_companies',
+                '_selected_action': [self.acme.id, self.globex.id],
+            })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Company.objects.filter(status='approved').count(), 2)
+        self.assertEqual(User.objects.filter(status='approved').count(), 3)
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class CompanyCounterTests(TestCase):
+    """Tests for the maintained Company.approved_employee_count."""
+    
+    def setUp(self):
+        """Set up a company with one pending user."""
+        self.company = Company.objects.create(name="Acme", domain="acme.com", status='approved')
+        self.user = User.objects.create_user(username='jane', email='jane@acme.com', password='x', company=self.company)
+    
+    def _count(self):
+        return Company.objects.get(pk=self.company.pk).approved_employee_count
+    
+    def test_status_transitions_adjust_count(self):
+        """Test that approving, suspending and deleting a user moves the count."""
+        user = User.objects.get(pk=self.user.pk)
+        user.status = 'approved'
+        user.save()
+        self.assertEqual(self._count(), 1)
+        
+        user.save()
+        self.assertEqual(self._count(), 1)
+        
+        user.status = 'suspended'
+        user.save()
+        self.assertEqual(self._count(), 0)
+        
+        user.status = 'approved'
+        user.save()
+        User.objects.get(pk=user.pk).delete()
+        self.assertEqual(self._count(), 0)
+    
+    def test_admin_bulk_actions_recount(self):
+        """Test that admin actions using update() leave the count accurate."""
+        admin = User.objects.create_superuser(username='admin', email='admin@example.com', password='AdminPass123!')
+        self.client.force_login(admin)
+        self.client.post(reverse('admin:accounts_user_changelist'), {
+            'action': 'approve_users',
+            '_selected_action': [self.user.id],
+        })
+        self.assertEqual(self._count(), 1)
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class CompanyAdminQueryTests(TestCase):
+    """Tests that the company changelist doesn't query per row."""
+    
+    def setUp(self):
+        """Set up an admin user."""
+        self.admin = User.objects.create_superuser(username='admin', email='admin@example.com', password='AdminPass123!')
+        self.client.force_login(self.admin)
+    
+    def _changelist_queries(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('admin:companies_company_changelist'))
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+    
+    def test_employee_count_needs_no_query_per_row(self):
+        """Test that query count doesn't grow with the number of companies."""
+        Company.objects.create(name="Acme", domain="acme.com", status='approved')
+        baseline = self._changelist_queries()
+        
+        for i in range(20):
+            company = Company.objects.create(name=f"Corp {i}", domain=f"corp{i}.com", status='approved')
+            User.objects.create_user(username=f'u{i}', email=f'u{i}@corp{i}.com', password='x', company=company, status='approved')
+        self.assertEqual(self._changelist_queries(), baseline)
+        
+        response = self.client.get(reverse('admin:companies_company_changelist'))
+        self.assertEqual(response.context['cl'].result_list[0].approved_employee_count, 1)
@@ -2,12 +2,28 @@
 Pytest configuration and fixtures for CredMarket tests.
 """
 import pytest
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.db import connections
 from companies.models import Company
 
 User = get_user_model()
 
 
+def pytest_configure(config):
+    """Test-only settings: a stand-in replica for the routing tests (a second
+    SQLite database, only used by tests that override REPLICA_DATABASES),
+    and background jobs run inline."""
+    settings.DATABASES.setdefault('replica', {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': settings.BASE_DIR / 'replica.sqlite3',
+    })
+    # Rebuild the connection settings if they were read before this ran
+    connections.__dict__.pop('settings', None)
+    # Run background jobs (emails, search log flushes) inline, inside the test's transaction
+    settings.BACKGROUND_JOBS_EAGER = True
+
+
 @pytest.fixture
 def approved_company(db):
     """Create an approved company."""
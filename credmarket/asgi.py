@@ -1,5 +1,17 @@
 """
 ASGI config for credmarket project.
+
+Run with uvicorn workers (as the Procfile and render.yaml do) to serve the
+async views (health checks, category fields API, message polling) without
+tying up a worker per request:
+
+    gunicorn credmarket.asgi:application -k uvicorn.workers.UvicornWorker
+
+Message long-polling stays off unless MESSAGE_LONG_POLL is set, and
+persistent database connections default to off (DB_CONN_MAX_AGE); see
+settings.
+
+Compare against the WSGI deployment with loadtest.py.
 """
 
 import os
@@ -7,5 +19,6 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'credmarket.settings')
+os.environ.setdefault('ASGI', 'true')  # read by settings, e.g. for DB_CONN_MAX_AGE
 
 application = get_asgi_application()
@@ -0,0 +1,95 @@
+"""
+In-process background job queue.
+
+Jobs run one at a time on a single daemon worker thread, so slow work such
+as SMTP never blocks a request and a burst of notifications doesn't spawn a
+thread per recipient. Set BACKGROUND_JOBS_EAGER = True to run jobs inline
+(used by tests).
+
+Jobs still queued when the process exits are waited for (up to
+BACKGROUND_DRAIN_SECONDS), so short-lived processes such as management
+commands don't exit before their emails are sent. Commands can also call
+drain() themselves to report the outcome.
+
+A job queued during a traced request is recorded as a span of that trace
+(see credmarket.tracing).
+"""
+import atexit
+import logging
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+
+from . import tracing
+
+logger = logging.getLogger(__name__)
+
+_queue = queue.Queue()
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def enqueue(func, *args, **kwargs):
+    """Schedule func(*args, **kwargs) to run on the background worker"""
+    if getattr(settings, 'BACKGROUND_JOBS_EAGER', False):
+        _run(func, args, kwargs)
+        return
+    _ensure_worker()
+    _queue.put((func, args, kwargs, tracing.current_span()))
+
+
+def queue_depth():
+    """Number of jobs waiting to run"""
+    return _queue.qsize()
+
+
+def drain(timeout=None):
+    """Wait until every queued job has run; returns False if timeout seconds passed first"""
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while _queue.unfinished_tasks:
+        if deadline is not None and time.monotonic() >= deadline:
+            return False
+        _ensure_worker()
+        time.sleep(0.05)
+    return True
+
+
+def _drain_at_exit():
+    if _queue.unfinished_tasks and not drain(getattr(settings, 'BACKGROUND_DRAIN_SECONDS', 30)):
+        logger.error("Exiting with %s background jobs still queued", _queue.unfinished_tasks)
+
+
+def _run(func, args, kwargs, parent=None):
+    name = getattr(func, '__name__', func)
+    try:
+        with tracing.resume(parent), tracing.span(f'job {name}'):
+            func(*args, **kwargs)
+    except Exception as e:
+        logger.error("Background job %s failed: %s", name, e, exc_info=True)
+
+
+def _ensure_worker():
+    global _worker
+    if _worker is not None and _worker.is_alive():
+        return
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_work, name='credmarket-background', daemon=True)
+            _worker.start()
+
+
+def _work():
+    while True:
+        func, args, kwargs, parent = _queue.get()
+        try:
+            _run(func, args, kwargs, parent)
+        finally:
+            # Don't keep this thread's database connections open between jobs
+            connections.close_all()
+            _queue.task_done()
+
+
+atexit.register(_drain_at_exit)
@@ -0,0 +1,61 @@
+"""
+Read-replica routing.
+
+Views decorated with @use_read_replica run their reads against one of the
+REPLICA_DATABASES; everything else, and every write, uses 'default'. A
+request that writes (any non-GET/HEAD request) gets a short-lived cookie
+from PrimaryPinMiddleware, and while it is present that browser's reads stay
+on the primary, so users see their own changes despite replication lag.
+
+The chosen alias lives in a ContextVar, so it is per request (and per task
+under ASGI) and never leaks into background jobs.
+"""
+import random
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+
+PIN_COOKIE = 'db_pin'
+
+_read_alias = ContextVar('db_read_alias', default=None)
+
+
+def replica_aliases():
+    return getattr(settings, 'REPLICA_DATABASES', [])
+
+
+def is_pinned(request):
+    return bool(request.COOKIES.get(PIN_COOKIE))
+
+
+def use_read_replica(view):
+    """Route the view's reads to a replica unless the request is pinned to the primary"""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        aliases = replica_aliases()
+        if not aliases or request.method not in ('GET', 'HEAD') or is_pinned(request):
+            return view(request, *args, **kwargs)
+        token = _read_alias.set(random.choice(aliases))
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _read_alias.reset(token)
+    return wrapper
+
+
+class ReplicaRouter:
+    """Send reads to the request's replica, if one was chosen, and all writes to the primary"""
+
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        databases = {'default', *replica_aliases()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
@@ -1,51 +1,197 @@
 """
 Health check views for monitoring
+
+/alive/ and /healthz are liveness probes: a constant response that never
+touches the database or logs. /ready/ and /health/ run the component checks
+(databases, cache, background email queue, file storage) and report each
+one's status and latency. /health/ is public, so its connection stats and
+middleware profile are only shown to callers /metrics would accept (the
+METRICS_TOKEN bearer, or DEBUG); everyone else gets the overall status. The checks run at most once per
+HEALTH_CHECK_CACHE_SECONDS per process, however often probes arrive, and
+only state changes are logged.
 """
-from django.http import JsonResponse
-from django.db import connection
+import threading
+import time
+from datetime import datetime, timezone
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.http import HttpResponse, JsonResponse
+from django.db import connection, connections
 from django.conf import settings
-import sys
+from .background import queue_depth
+from .db_router import replica_aliases
+from .metrics import metrics_authorized
+from .profiling import middleware_profile
 import logging
 
 logger = logging.getLogger(__name__)
 
+ALIVE_BODY = b'{"status": "alive"}'
+
+_lock = threading.Lock()
+_last = {'result': None, 'at': 0.0, 'status': 'ok'}
+
 
-def health_check(request):
+def connection_stats():
     """
-    Health check endpoint for monitoring services.
-    Returns 200 OK if application is healthy.
+    Database connection state: this process's connection per alias, and on
+    PostgreSQL the server's connection counts against max_connections (behind
+    a pooler these are the pooler's server connections).
     """
-    health_status = {
-        'status': 'healthy',
-        'debug': settings.DEBUG,
-        'python_version': sys.version,
-        'database': 'disconnected'
+    stats = {
+        'pooler': getattr(settings, 'DB_POOLER', '') or None,
+        'background_queue': queue_depth(),
+        'databases': {},
     }
-    
-    # Check database connection
-    try:
+    for alias in connections:
+        conn = connections[alias]
+        stats['databases'][alias] = {
+            'vendor': conn.vendor,
+            'open': conn.connection is not None,
+            'conn_max_age': conn.settings_dict.get('CONN_MAX_AGE'),
+        }
+
+    if connection.vendor == 'postgresql':
         with connection.cursor() as cursor:
-            cursor.execute('SELECT 1')
-        health_status['database'] = 'connected'
-        logger.info("Health check passed - database connected")
-    except Exception as e:
-        health_status['status'] = 'unhealthy'
-        health_status['database'] = f'error: {str(e)}'
-        logger.error(f"Health check failed - database error: {str(e)}", exc_info=True)
-        return JsonResponse(health_status, status=503)
-    
-    return JsonResponse(health_status)
+            cursor.execute(
+                "SELECT count(*), count(*) FILTER (WHERE state = 'active'), "
+                "count(*) FILTER (WHERE state IN ('idle', 'idle in transaction')), current_setting('max_connections')::int "
+                "FROM pg_stat_activity WHERE datname = current_database()"
+            )
+            total, active, idle, max_connections = cursor.fetchone()
+        stats['server'] = {
+            'connections': total,
+            'active': active,
+            'idle': idle,
+            'max_connections': max_connections,
+            'saturation': round(total / max_connections, 3) if max_connections else None,
+        }
+    return stats
+
+
+def _check_database(alias):
+    with connections[alias].cursor() as cursor:
+        cursor.execute('SELECT 1')
+
+
+def _check_cache():
+    token = str(time.monotonic())
+    cache.set('health-check', token, 30)
+    if cache.get('health-check') != token:
+        raise RuntimeError('cache did not return the value just written')
+
+
+def _check_queue():
+    depth = queue_depth()
+    limit = getattr(settings, 'HEALTH_MAX_QUEUE_DEPTH', 1000)
+    if depth > limit:
+        raise RuntimeError(f'{depth} jobs waiting (limit {limit})')
+    return {'depth': depth}
+
+
+def _check_storage():
+    default_storage.exists('health-check')
+
+
+def _components():
+    """(name, check, critical) for every component; a failing critical one means 503"""
+    components = [('database', lambda: _check_database('default'), True)]
+    for alias in replica_aliases():
+        components.append((f'database:{alias}', lambda alias=alias: _check_database(alias), False))
+    components += [
+        ('cache', _check_cache, True),
+        ('email_queue', _check_queue, False),
+        ('storage', _check_storage, False),
+    ]
+    return components
+
+
+def run_checks():
+    """Run every component check and time it"""
+    results = {}
+    status = 'ok'
+    for name, check, critical in _components():
+        started = time.perf_counter()
+        try:
+            result = {'status': 'ok', **(check() or {})}
+        except Exception as e:
+            result = {'status': 'error', 'error': str(e)}
+            if critical:
+                status = 'error'
+            elif status == 'ok':
+                status = 'degraded'
+        result['latency_ms'] = round((time.perf_counter() - started) * 1000, 2)
+        results[name] = result
+    return {
+        'status': status,
+        'checked_at': datetime.now(timezone.utc).isoformat(),
+        'components': results,
+        'connections': connection_stats() if results['database']['status'] == 'ok' else None,
+    }
+
+
+def cached_checks():
+    """(results, age in seconds); the checks rerun once results are HEALTH_CHECK_CACHE_SECONDS old"""
+    max_age = getattr(settings, 'HEALTH_CHECK_CACHE_SECONDS', 5)
+    with _lock:
+        if _last['result'] is None or time.monotonic() - _last['at'] >= max_age:
+            result = run_checks()
+            if result['status'] != _last['status']:
+                failing = [name for name, check in result['components'].items() if check['status'] != 'ok']
+                logger.log(
+                    logging.INFO if result['status'] == 'ok' else logging.ERROR,
+                    "Health changed from %s to %s; failing: %s", _last['status'], result['status'], failing or 'none',
+                )
+            _last.update(result=result, at=time.monotonic(), status=result['status'])
+        return _last['result'], time.monotonic() - _last['at']
+
+
+def reset_checks():
+    """Forget the cached results, so the next probe checks again"""
+    with _lock:
+        _last.update(result=None, at=0.0, status='ok')
+
+
+async def health_check(request):
+    """
+    Health check endpoint for monitoring services: the overall status, plus
+    component checks and connection stats for authorized callers. Returns
+    503 if a critical component is failing.
+    """
+    result, age = await sync_to_async(cached_checks)()
+    health_status = {
+        'status': result['status'],
+        'checked_at': result['checked_at'],
+    }
+    status = 503 if result['status'] == 'error' else 200
+    if not metrics_authorized(request):
+        return JsonResponse(health_status, status=status)
+    health_status.update({
+        'debug': settings.DEBUG,
+        'age_seconds': round(age, 2),
+        'components': result['components'],
+        'connections': result['connections'],
+    })
+    if getattr(settings, 'MIDDLEWARE_PROFILING', False):
+        health_status['middleware'] = middleware_profile()
+    return JsonResponse(health_status, status=status)
 
 
-def readiness_check(request):
+async def readiness_check(request):
     """
     Readiness check - returns 200 when app is ready to serve traffic
     """
-    return JsonResponse({'status': 'ready'})
+    result, age = await sync_to_async(cached_checks)()
+    return JsonResponse(
+        {'status': result['status'], 'age_seconds': round(age, 2), 'components': result['components']},
+        status=503 if result['status'] == 'error' else 200,
+    )
 
 
-def liveness_check(request):
+async def liveness_check(request):
     """
     Liveness check - returns 200 if app is running
     """
-    return JsonResponse({'status': 'alive'})
+    return HttpResponse(ALIVE_BODY, content_type='application/json')
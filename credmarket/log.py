@@ -0,0 +1,178 @@
+"""
+Logging pipeline: Django's LOGGING_CONFIG points at configure() below.
+
+After the usual dictConfig, every logger's handlers are moved behind a
+QueueHandler, and a QueueListener thread does the formatting and the writes.
+A request thread runs the logger's level check and the filters, merges the
+message with its arguments (as the stdlib QueueHandler does, so the listener
+never touches model instances or other mutable arguments), and enqueues the
+record. Pass values as %-style arguments (logger.info("Sent %s", count))
+rather than f-strings, so filtered-out records are never formatted. When a
+queue is full the record is dropped and counted (dropped_records()) rather
+than blocking the request.
+
+JsonFormatter writes one JSON object per line, including any `extra`
+fields. SamplingFilter keeps only a fraction of DEBUG/INFO records from the
+loggers in LOG_SAMPLING. Warnings and errors are never sampled.
+"""
+import atexit
+import copy
+import json
+import logging
+import logging.config
+import os
+import queue
+import random
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+# Attributes every LogRecord has; anything else came from `extra`
+_RECORD_FIELDS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_listeners = []
+_dropped = [0]
+_dropped_lock = threading.Lock()
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, with `extra` fields as top-level keys"""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'module': record.module,
+            'function': record.funcName,
+            'line': record.lineno,
+            'process': record.process,
+            'thread': record.threadName,
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:  # formatted before the record was queued
+            entry['exception'] = record.exc_text
+        if record.stack_info:
+            entry['stack'] = self.formatStack(record.stack_info)
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep a fraction of DEBUG/INFO records per logger: rates maps a logger
+    name (or a parent's) to the fraction to keep. Kept records carry
+    `sample_rate` so counts can be scaled back up.
+    """
+
+    def __init__(self, rates=None):
+        super().__init__()
+        self.rates = dict(rates or {})
+        self._cache = {}
+
+    def _rate(self, name):
+        rate = self._cache.get(name)
+        if rate is None:
+            rate, logger_name = 1.0, name
+            while logger_name:
+                if logger_name in self.rates:
+                    rate = self.rates[logger_name]
+                    break
+                logger_name = logger_name.rpartition('.')[0]
+            self._cache[name] = rate
+        return rate
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self._rate(record.name)
+        if rate >= 1.0:
+            return True
+        if random.random() >= rate:
+            return False
+        record.sample_rate = rate
+        return True
+
+
+class BoundedQueueHandler(QueueHandler):
+    """QueueHandler that merges the arguments before queuing and drops records when the queue is full"""
+
+    def prepare(self, record):
+        # Like QueueHandler.prepare, but leaves the formatting (JSON, time
+        # stamps) to the listener's handlers, and keeps `extra` fields
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _exception_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with _dropped_lock:
+                _dropped[0] += 1
+
+
+_exception_formatter = logging.Formatter()
+
+
+def dropped_records():
+    """Log records dropped by this process because a queue was full"""
+    return _dropped[0]
+
+
+def _start(listener):
+    listener.start()
+    _listeners.append(listener)
+
+
+def stop_listeners():
+    """Flush and stop the listener threads"""
+    while _listeners:
+        _listeners.pop().stop()
+
+
+def configure(config, queue_size=10000, sample_rates=None):
+    """
+    dictConfig, then route each distinct set of handlers through its own
+    queue and listener thread. Used as LOGGING_CONFIG.
+    """
+    from django.conf import settings
+
+    stop_listeners()
+    logging.config.dictConfig(config)
+    if not getattr(settings, 'LOG_QUEUE', True):
+        return
+
+    sampling = SamplingFilter(getattr(settings, 'LOG_SAMPLING', {}) if sample_rates is None else sample_rates)
+    queue_handlers = {}
+    loggers = [logging.getLogger()] + [logging.getLogger(name) for name in config.get('loggers', {})]
+    for logger in loggers:
+        handlers = tuple(logger.handlers)
+        if not handlers:
+            continue
+        if handlers not in queue_handlers:
+            handler = BoundedQueueHandler(queue.Queue(queue_size))
+            handler.addFilter(sampling)
+            _start(QueueListener(handler.queue, *handlers, respect_handler_level=True))
+            queue_handlers[handlers] = handler
+        logger.handlers = [queue_handlers[handlers]]
+
+
+def _restart_after_fork():
+    # Threads don't survive fork (e.g. gunicorn --preload); the queues do
+    for listener in _listeners:
+        listener._thread = None
+        listener.start()
+
+
+atexit.register(stop_listeners)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_restart_after_fork)
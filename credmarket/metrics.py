@@ -0,0 +1,380 @@
+"""
+Prometheus metrics at /metrics, and Server-Timing headers.
+
+MetricsMiddleware times every request and counts it per URL name (never per
+raw path, which would make a series per listing). The database time and
+query count come from an execute_wrapper on each connection, and the render
+time is spent in the outermost template render. They are reported per view
+and also sent to the browser as a Server-Timing header (SERVER_TIMING,
+on by default only with DEBUG); the header shows in the browser devtools'
+timing tab.
+Cache gets are counted as hits or misses per cache alias.
+
+Gunicorn runs several worker processes, and a scrape only reaches one of
+them. With METRICS_DIR set, each worker writes its totals to
+METRICS_DIR/<pid>.json at most every METRICS_FLUSH_SECONDS, and /metrics
+adds up every worker's file. Counters from workers that have exited are
+kept, so totals never go backwards. Gauges (queue depth, threads) come only
+from live workers. Empty METRICS_DIR on deploy, as with prometheus_client's
+multiprocess mode.
+
+/metrics requires "Authorization: Bearer <METRICS_TOKEN>". Without a
+METRICS_TOKEN it is only served with DEBUG, and is a 404 otherwise. The
+detailed /health/ report uses the same check (metrics_authorized).
+"""
+import json
+import os
+import re
+import threading
+import time
+from contextvars import ContextVar
+from functools import wraps
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.utils.crypto import constant_time_compare
+
+from .background import queue_depth
+from .log import dropped_records
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+METRICS = {
+    'credmarket_http_requests_total': ('counter', 'Requests by URL name, method and status'),
+    'credmarket_http_request_duration_seconds': ('histogram', 'Request latency by URL name'),
+    'credmarket_db_queries_total': ('counter', 'Database queries run by requests, by URL name'),
+    'credmarket_db_query_seconds_total': ('counter', 'Time requests spent in database queries, by URL name'),
+    'credmarket_cache_requests_total': ('counter', 'Cache gets by cache alias and result (hit or miss)'),
+    'credmarket_log_records_dropped_total': ('counter', 'Log records dropped because the log queue was full'),
+    'credmarket_background_queue_depth': ('gauge', 'Background jobs (mostly email) waiting to run'),
+    'credmarket_threads': ('gauge', 'Live threads by name'),
+}
+
+_lock = threading.Lock()
+_counters = {}  # (name, labels) -> value
+_histograms = {}  # (name, labels) -> [count per bucket..., +Inf count, sum]
+_last_flush = [0.0]
+_installed = False
+
+_stats = ContextVar('request_stats', default=None)
+
+
+class RequestStats:
+    """Database and template time of the current request"""
+    __slots__ = ('queries', 'db_seconds', 'render_seconds', 'render_depth')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.render_seconds = 0.0
+        self.render_depth = 0
+
+
+def inc(name, labels, value=1):
+    key = (name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name, labels, value):
+    key = (name, labels)
+    with _lock:
+        row = _histograms.get(key)
+        if row is None:
+            row = _histograms[key] = [0] * (len(BUCKETS) + 2)
+        for index, bound in enumerate(BUCKETS):
+            if value <= bound:
+                row[index] += 1
+                break
+        else:
+            row[len(BUCKETS)] += 1
+        row[-1] += value
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+
+# Instrumentation
+
+def _time_query(execute, sql, params, many, context):
+    """Database execute_wrapper: count and time the current request's queries"""
+    stats = _stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.db_seconds += time.perf_counter() - started
+
+
+def _add_query_wrapper(sender=None, connection=None, **kwargs):
+    if _time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_time_query)
+
+
+def _timed_render(render):
+    @wraps(render)
+    def wrapper(self, context):
+        stats = _stats.get()
+        if stats is None or stats.render_depth:
+            return render(self, context)
+        # Only the outermost render is timed; includes and extends run inside it
+        stats.render_depth += 1
+        started = time.perf_counter()
+        try:
+            return render(self, context)
+        finally:
+            stats.render_depth -= 1
+            stats.render_seconds += time.perf_counter() - started
+    return wrapper
+
+
+def _counted_get(get):
+    @wraps(get)
+    def wrapper(self, key, default=None, version=None):
+        value = get(self, key, default, version)
+        alias = getattr(self, '_metrics_alias', 'other')
+        inc('credmarket_cache_requests_total', (('cache', alias), ('result', 'miss' if value is default else 'hit')))
+        return value
+    return wrapper
+
+
+def _counted_get_many(get_many):
+    @wraps(get_many)
+    def wrapper(self, keys, version=None):
+        keys = list(keys)
+        found = get_many(self, keys, version)
+        alias = getattr(self, '_metrics_alias', 'other')
+        if found:
+            inc('credmarket_cache_requests_total', (('cache', alias), ('result', 'hit')), len(found))
+        if len(keys) > len(found):
+            inc('credmarket_cache_requests_total', (('cache', alias), ('result', 'miss')), len(keys) - len(found))
+        return found
+    return wrapper
+
+
+def install():
+    """Install the timing and counting hooks (once per process)"""
+    global _installed
+    if _installed:
+        return
+    _installed = True
+
+    from django.core.cache import caches
+    from django.core.cache.backends.base import BaseCache
+    from django.db import connections
+    from django.db.backends.signals import connection_created
+    from django.template.base import Template
+
+    connection_created.connect(_add_query_wrapper, dispatch_uid='credmarket.metrics')
+    for conn in connections.all(initialized_only=True):
+        _add_query_wrapper(connection=conn)
+
+    Template.render = _timed_render(Template.render)
+
+    # Backends are created per thread; label each with its alias
+    create_connection = caches.create_connection
+
+    def create_labelled(alias):
+        backend = create_connection(alias)
+        backend._metrics_alias = alias
+        return backend
+    caches.create_connection = create_labelled
+
+    patched = set()
+    for alias in settings.CACHES:
+        backend = caches[alias]
+        backend._metrics_alias = alias
+        cls = type(backend)
+        if cls not in patched:
+            patched.add(cls)
+            cls.get = _counted_get(cls.get)
+            if cls.get_many is not BaseCache.get_many:  # the default get_many calls get per key
+                cls.get_many = _counted_get_many(cls.get_many)
+
+
+class MetricsMiddleware:
+    """Count and time each request, and add its Server-Timing header (see module docstring)"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.server_timing = getattr(settings, 'SERVER_TIMING', settings.DEBUG)
+        install()
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = _stats.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _stats.reset(token)
+        return self._finish(request, response, stats, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = _stats.set(stats)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _stats.reset(token)
+        return self._finish(request, response, stats, time.perf_counter() - started)
+
+    def _finish(self, request, response, stats, elapsed):
+        match = getattr(request, 'resolver_match', None)
+        view = (match.view_name or match._func_path) if match is not None else 'unmatched'
+        inc('credmarket_http_requests_total', (('view', view), ('method', request.method), ('status', str(response.status_code))))
+        observe('credmarket_http_request_duration_seconds', (('view', view),), elapsed)
+        if stats.queries:
+            inc('credmarket_db_queries_total', (('view', view),), stats.queries)
+            inc('credmarket_db_query_seconds_total', (('view', view),), stats.db_seconds)
+
+        if self.server_timing:
+            response.headers['Server-Timing'] = (
+                f'db;dur={stats.db_seconds * 1000:.1f};desc="{stats.queries} queries", '
+                f'render;dur={stats.render_seconds * 1000:.1f}, '
+                f'app;dur={elapsed * 1000:.1f}'
+            )
+        maybe_flush()
+        return response
+
+
+# Export
+
+def _gauges():
+    threads = {}
+    for thread in threading.enumerate():
+        name = re.sub(r'-\d+', '', thread.name)  # Thread-12 (_monitor) -> Thread (_monitor)
+        threads[name] = threads.get(name, 0) + 1
+    gauges = [('credmarket_background_queue_depth', (), queue_depth())]
+    gauges += [('credmarket_threads', (('name', name),), count) for name, count in sorted(threads.items())]
+    return gauges
+
+
+def snapshot():
+    """This process's metrics, in the form written to METRICS_DIR"""
+    with _lock:
+        counters = [[name, list(labels), value] for (name, labels), value in _counters.items()]
+        histograms = [[name, list(labels), list(row)] for (name, labels), row in _histograms.items()]
+    counters.append(['credmarket_log_records_dropped_total', [], dropped_records()])
+    gauges = [[name, list(labels), value] for name, labels, value in _gauges()]
+    return {'pid': os.getpid(), 'counters': counters, 'histograms': histograms, 'gauges': gauges}
+
+
+def flush():
+    """Write this process's snapshot to METRICS_DIR"""
+    directory = getattr(settings, 'METRICS_DIR', '')
+    if not directory:
+        return
+    _last_flush[0] = time.monotonic()
+    path = Path(directory)
+    path.mkdir(parents=True, exist_ok=True)
+    tmp = path / f'.{os.getpid()}.tmp'
+    tmp.write_text(json.dumps(snapshot()))
+    os.replace(tmp, path / f'{os.getpid()}.json')
+
+
+def maybe_flush():
+    if getattr(settings, 'METRICS_DIR', '') and time.monotonic() - _last_flush[0] >= getattr(settings, 'METRICS_FLUSH_SECONDS', 5):
+        flush()
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def collect():
+    """Snapshots of every worker: this one live, the others from METRICS_DIR"""
+    own = snapshot()
+    snapshots = [own]
+    directory = getattr(settings, 'METRICS_DIR', '')
+    if directory:
+        for file in Path(directory).glob('*.json'):
+            try:
+                data = json.loads(file.read_text())
+            except (OSError, ValueError):
+                continue  # removed or being replaced
+            if data['pid'] == own['pid']:
+                continue
+            if not _alive(data['pid']):
+                data['gauges'] = []
+            snapshots.append(data)
+    return snapshots
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('%s="%s"' % (key, str(value).replace('\\', r'\\').replace('"', r'\"')) for key, value in labels) + '}'
+
+
+def render(snapshots):
+    """Prometheus text exposition of the summed snapshots"""
+    values = {}
+    for data in snapshots:
+        for kind in ('counters', 'gauges'):
+            for name, labels, value in data[kind]:
+                key = (name, tuple(sorted(map(tuple, labels))))
+                values[key] = values.get(key, 0) + value
+        for name, labels, row in data['histograms']:
+            key = (name, tuple(sorted(map(tuple, labels))))
+            total = values.setdefault(key, [0] * len(row))
+            for index, value in enumerate(row):
+                total[index] += value
+
+    lines = []
+    for name, (kind, help_text) in METRICS.items():
+        series = sorted((labels, value) for (metric, labels), value in values.items() if metric == name)
+        if not series:
+            continue
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+        for labels, value in series:
+            if kind != 'histogram':
+                lines.append(f'{name}{_labels(labels)} {value}')
+                continue
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ('+Inf',), value):
+                cumulative += count
+                lines.append(f'{name}_bucket{_labels(labels + (("le", str(bound)),))} {cumulative}')
+            lines.append(f'{name}_sum{_labels(labels)} {value[-1]}')
+            lines.append(f'{name}_count{_labels(labels)} {cumulative}')
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_authorized(request):
+    """Whether the request may see operational detail: the METRICS_TOKEN bearer, or DEBUG when no token is set"""
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if not token:
+        return settings.DEBUG
+    return constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}')
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint"""
+    if not metrics_authorized(request):
+        if not getattr(settings, 'METRICS_TOKEN', ''):
+            raise Http404
+        return HttpResponse(status=401)
+    flush()
+    return HttpResponse(render(collect()), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -2,28 +2,52 @@
 Custom middleware for error logging and debugging
 """
 import logging
-import traceback
+
+from asgiref.sync import async_to_sync, iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.urls import Resolver404, resolve
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.functional import empty
+
+from .db_router import PIN_COOKIE, replica_aliases
 
 logger = logging.getLogger(__name__)
 
+CONTENT_SECURITY_POLICY = '; '.join([
+    "default-src 'self'",
+    "script-src 'self' 'unsafe-inline' https://cdn.tailwindcss.com https://unpkg.com",
+    "style-src 'self' 'unsafe-inline' https://cdn.tailwindcss.com",
+    "img-src 'self' data: https://res.cloudinary.com",
+    "font-src 'self'",
+    "connect-src 'self'",
+    "frame-ancestors 'none'",
+]) + ';'
+
+
+def _user_label(request):
+    """The request's user if something already loaded it; never triggers a session/user lookup"""
+    user = getattr(request, 'user', None)
+    if user is None:
+        return 'Unknown'
+    wrapped = getattr(user, '_wrapped', user)  # request.user is a lazy object until first use
+    return 'Not loaded' if wrapped is empty else str(wrapped)
 
-class ErrorLoggingMiddleware:
+
+class ErrorLoggingMiddleware(MiddlewareMixin):
     """
-    Middleware to log all exceptions with full tracebacks
+    Middleware to log all exceptions with full tracebacks, tagged with the
+    request's trace id (see credmarket.tracing)
     """
-    def __init__(self, get_response):
-        self.get_response = get_response
-
-    def __call__(self, request):
-        response = self.get_response(request)
-        
+    def process_response(self, request, response):
         # Log all 500 errors
         if response.status_code == 500:
+            trace_id = getattr(request, 'trace_id', None)
             logger.error(
-                f"500 Error on {request.method} {request.path}\n"
-                f"User: {request.user if hasattr(request, 'user') else 'Unknown'}\n"
-                f"IP: {self.get_client_ip(request)}\n"
-                f"User-Agent: {request.META.get('HTTP_USER_AGENT', 'Unknown')}"
+                "500 Error on %s %s\nUser: %s\nIP: %s\nUser-Agent: %s\nTrace: %s",
+                request.method, request.path, _user_label(request), self.get_client_ip(request),
+                request.META.get('HTTP_USER_AGENT', 'Unknown'), trace_id,
+                extra={'trace_id': trace_id},
             )
         
         return response
@@ -32,12 +56,13 @@ class ErrorLoggingMiddleware:
         """
         Log all exceptions with full traceback
         """
+        trace_id = getattr(request, 'trace_id', None)
         logger.error(
-            f"EXCEPTION CAUGHT: {type(exception).__name__}: {str(exception)}\n"
-            f"Path: {request.method} {request.path}\n"
-            f"User: {request.user if hasattr(request, 'user') else 'Unknown'}\n"
-            f"IP: {self.get_client_ip(request)}\n"
-            f"Full traceback:\n{traceback.format_exc()}"
+            "EXCEPTION CAUGHT: %s: %s\nPath: %s %s\nUser: %s\nIP: %s\nTrace: %s",
+            type(exception).__name__, exception, request.method, request.path,
+            _user_label(request), self.get_client_ip(request), trace_id,
+            exc_info=(type(exception), exception, exception.__traceback__),
+            extra={'trace_id': trace_id},
         )
         # Return None to let Django's default error handling proceed
         return None
@@ -53,30 +78,83 @@ class ErrorLoggingMiddleware:
         return ip
 
 
-class SecurityHeadersMiddleware:
+class SecurityHeadersMiddleware(MiddlewareMixin):
     """
     Middleware to add security headers including Content Security Policy
     """
+    # Built once; only assigned per response
+    HEADERS = (
+        ('Content-Security-Policy', CONTENT_SECURITY_POLICY),  # Prevent XSS attacks
+        ('X-Frame-Options', 'DENY'),
+        ('X-Content-Type-Options', 'nosniff'),
+        ('X-XSS-Protection', '1; mode=block'),
+    )
+
+    def process_response(self, request, response):
+        headers = response.headers
+        for name, value in self.HEADERS:
+            headers[name] = value
+        return response
+
+
+class PrimaryPinMiddleware(MiddlewareMixin):
+    """
+    Pin a browser's reads to the primary database for a few seconds after it
+    writes, so replica lag can't hide the user's own changes (see credmarket.db_router)
+    """
+    def process_response(self, request, response):
+        if request.method not in ('GET', 'HEAD', 'OPTIONS') and replica_aliases() and response.status_code < 500:
+            response.set_cookie(
+                PIN_COOKIE, '1',
+                max_age=getattr(settings, 'REPLICA_PIN_SECONDS', 10),
+                httponly=True,
+                samesite='Lax',
+                secure=request.is_secure(),
+            )
+        
+        return response
+
+
+class FastPathMiddleware:
+    """
+    Serve anonymous GET endpoints that need no session (health probes, public
+    JSON) straight from their view, skipping every middleware below this one:
+    sessions, CSRF, auth, OTP, messages. Paths are MIDDLEWARE_BYPASS_PATHS
+    prefixes; anything else goes down the normal chain.
+    """
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        self.prefixes = tuple(getattr(settings, 'MIDDLEWARE_BYPASS_PATHS', ()))
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def _match(self, request):
+        if not self.prefixes or request.method not in ('GET', 'HEAD') or not request.path_info.startswith(self.prefixes):
+            return None
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return None
+        request.resolver_match = match
+        request.user = AnonymousUser()
+        return match
 
     def __call__(self, request):
-        response = self.get_response(request)
-        
-        # Add Content Security Policy to prevent XSS attacks
-        response['Content-Security-Policy'] = (
-            "default-src 'self'; "
-            "script-src 'self' 'unsafe-inline' https://cdn.tailwindcss.com https://unpkg.com; "
-            "style-src 'self' 'unsafe-inline' https://cdn.tailwindcss.com; "
-            "img-src 'self' data: https://res.cloudinary.com; "
-            "font-src 'self'; "
-            "connect-src 'self'; "
-            "frame-ancestors 'none';"
-        )
-        
-        # Additional security headers
-        response['X-Frame-Options'] = 'DENY'
-        response['X-Content-Type-Options'] = 'nosniff'
-        response['X-XSS-Protection'] = '1; mode=block'
-        
-        return response
+        if self.async_mode:
+            return self.__acall__(request)
+        match = self._match(request)
+        if match is None:
+            return self.get_response(request)
+        view = async_to_sync(match.func) if iscoroutinefunction(match.func) else match.func
+        return view(request, *match.args, **match.kwargs)
+
+    async def __acall__(self, request):
+        match = self._match(request)
+        if match is None:
+            return await self.get_response(request)
+        view = match.func if iscoroutinefunction(match.func) else sync_to_async(match.func)
+        return await view(request, *match.args, **match.kwargs)
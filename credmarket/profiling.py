@@ -0,0 +1,117 @@
+"""
+Per-middleware request timing, enabled with MIDDLEWARE_PROFILING=true.
+
+settings then puts a MiddlewareTimer before every middleware and before the
+view. Each timer measures everything below it, so a middleware's own cost
+(request and response phases together) is its timer's time minus the next
+timer's. Each request's breakdown is logged at DEBUG and left on
+request.middleware_timings; process-wide averages are shown on /health/.
+
+Profile under load, e.g. MIDDLEWARE_PROFILING=true with loadtest.py, then
+read /health/. Timers add a little overhead of their own, so leave it off in
+normal operation.
+"""
+import inspect
+import logging
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+logger = logging.getLogger(__name__)
+
+TIMER = 'credmarket.profiling.MiddlewareTimer'
+
+_lock = threading.Lock()
+_totals = {}  # label -> [requests, seconds]
+
+
+def profiled(middleware):
+    """The MIDDLEWARE list with a timer before each entry and before the view"""
+    return [entry for name in middleware for entry in (TIMER, name)] + [TIMER]
+
+
+def middleware_profile():
+    """Mean time per request spent in each middleware (and the view) in this process, slowest first"""
+    with _lock:
+        totals = {label: tuple(values) for label, values in _totals.items()}
+    rows = [
+        {'name': label, 'requests': requests, 'mean_ms': round(seconds / requests * 1000, 3)}
+        for label, (requests, seconds) in totals.items()
+    ]
+    return sorted(rows, key=lambda row: row['mean_ms'], reverse=True)
+
+
+def reset_profile():
+    with _lock:
+        _totals.clear()
+
+
+def _record(request, timings):
+    """Turn the timers' inclusive times into each middleware's own time"""
+    timings.sort()
+    breakdown = []
+    for index, (_, label, elapsed) in enumerate(timings):
+        inner = timings[index + 1][2] if index + 1 < len(timings) else 0.0
+        breakdown.append((label, elapsed - inner))
+    request.middleware_timings = breakdown
+
+    with _lock:
+        for label, seconds in breakdown:
+            totals = _totals.setdefault(label, [0, 0.0])
+            totals[0] += 1
+            totals[1] += seconds
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(
+            "Middleware timings %s %s: %s", request.method, request.path,
+            ', '.join(f"{label.rsplit('.', 1)[-1]}={seconds * 1000:.2f}ms" for label, seconds in breakdown),
+        )
+
+
+class MiddlewareTimer:
+    """Time everything below this point in the middleware chain (see module docstring)"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        # Django wraps each handler with functools.wraps, so __wrapped__ is the
+        # next middleware instance, or the handler's own method for the view
+        inner = getattr(get_response, '__wrapped__', get_response)
+        if inspect.ismethod(inner):
+            self.label = 'view'
+        else:
+            self.label = f'{type(inner).__module__}.{type(inner).__name__}'
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def _enter(self, request):
+        depth = getattr(request, '_middleware_depth', 0)
+        request._middleware_depth = depth + 1
+        if depth == 0:
+            request._middleware_timings = []
+        return depth
+
+    def _exit(self, request, depth, started):
+        request._middleware_timings.append((depth, self.label, time.perf_counter() - started))
+        if depth == 0:
+            _record(request, request._middleware_timings)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        depth = self._enter(request)
+        started = time.perf_counter()
+        try:
+            return self.get_response(request)
+        finally:
+            self._exit(request, depth, started)
+
+    async def __acall__(self, request):
+        depth = self._enter(request)
+        started = time.perf_counter()
+        try:
+            return await self.get_response(request)
+        finally:
+            self._exit(request, depth, started)
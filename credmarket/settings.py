@@ -60,6 +60,10 @@ MIDDLEWARE = [
     'credmarket.middleware.SecurityHeadersMiddleware',  # Security headers (CSP, XSS protection)
     'corsheaders.middleware.CorsMiddleware',  # CORS - must be before CommonMiddleware
     'credmarket.middleware.ErrorLoggingMiddleware',  # Custom error logging
+    'credmarket.metrics.MetricsMiddleware',  # /metrics counters, Server-Timing header
+    'credmarket.middleware.FastPathMiddleware',  # Health probes etc. skip everything below
+    'credmarket.tracing.TracingMiddleware',  # Trace ids; spans for sampled requests
+    'credmarket.middleware.PrimaryPinMiddleware',  # Read-your-writes for replica routing
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -77,7 +81,6 @@ TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.debug',
@@ -85,6 +88,13 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
             ],
+            # Compile each template once per process (runserver's autoreloader clears it on change)
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
         },
     },
 ]
@@ -94,14 +104,48 @@ WSGI_APPLICATION = 'credmarket.wsgi.application'
 # Database - Use PostgreSQL in production, SQLite for development
 import dj_database_url
 
+# Persistent connections: keep each connection for DB_CONN_MAX_AGE seconds
+# (0 closes it after every request). Behind a transaction-mode pooler such as
+# PgBouncer set DB_POOLER=pgbouncer: the pooler owns the server connections,
+# so server-side cursors and prepared statements, which are tied to one
+# server connection, are turned off.
+# Under ASGI (credmarket/asgi.py sets ASGI=true) connections belong to each
+# request's thread, so persistent ones pile up until the database refuses
+# more; the default there is 0. Run behind PgBouncer (DB_POOLER) to avoid
+# paying for a new server connection on every request.
+ASGI = config('ASGI', default=False, cast=bool)
+DB_CONN_MAX_AGE = config('DB_CONN_MAX_AGE', default=0 if ASGI else 600, cast=int)
+DB_POOLER = config('DB_POOLER', default='')
+
+
+def _database(database):
+    if DB_POOLER == 'pgbouncer' and database['ENGINE'] == 'django.db.backends.postgresql':
+        database['DISABLE_SERVER_SIDE_CURSORS'] = True
+        try:
+            import psycopg  # noqa: F401 - psycopg 3 prepares repeated queries server-side
+            database.setdefault('OPTIONS', {})['prepare_threshold'] = None
+        except ImportError:
+            pass
+    return database
+
+
 DATABASES = {
-    'default': dj_database_url.config(
+    'default': _database(dj_database_url.config(
         default='sqlite:///' + str(BASE_DIR / 'db.sqlite3'),
-        conn_max_age=600,
+        conn_max_age=DB_CONN_MAX_AGE,
         conn_health_checks=True,
-    )
+    ))
 }
 
+# Read replicas for browse and analytics pages (comma-separated database URLs).
+# Only views decorated with credmarket.db_router.use_read_replica read from them.
+REPLICA_DATABASE_URLS = [url.strip() for url in config('REPLICA_DATABASE_URLS', default='').split(',') if url.strip()]
+for index, url in enumerate(REPLICA_DATABASE_URLS, start=1):
+    DATABASES[f'replica{index}'] = _database(dj_database_url.parse(url, conn_max_age=DB_CONN_MAX_AGE, conn_health_checks=True))
+REPLICA_DATABASES = [alias for alias in DATABASES if alias != 'default']
+REPLICA_PIN_SECONDS = config('REPLICA_PIN_SECONDS', default=10, cast=int)  # reads stay on the primary after a write
+DATABASE_ROUTERS = ['credmarket.db_router.ReplicaRouter']
+
 # Custom User Model
 AUTH_USER_MODEL = 'accounts.User'
 
@@ -153,6 +197,10 @@ EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD', default='')
 DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL', default='noreply@credmarket.in')
 EMAIL_TIMEOUT = 10  # Timeout for email sending in seconds
 
+# Background jobs (emails etc.) run on an in-process worker thread; eager mode runs them inline
+BACKGROUND_JOBS_EAGER = config('BACKGROUND_JOBS_EAGER', default=False, cast=bool)
+BACKGROUND_DRAIN_SECONDS = config('BACKGROUND_DRAIN_SECONDS', default=30, cast=float)  # waited at exit for queued jobs
+
 # Site URL (for emails and absolute URLs)
 SITE_URL = config('SITE_URL', default='http://localhost:8000')
 
@@ -228,12 +276,51 @@ if not DEBUG:
     if 'debug_toolbar.middleware.DebugToolbarMiddleware' in MIDDLEWARE:
         MIDDLEWARE.remove('debug_toolbar.middleware.DebugToolbarMiddleware')
 
+# /ready/ and /health/ component checks - rerun at most this often per process
+HEALTH_CHECK_CACHE_SECONDS = config('HEALTH_CHECK_CACHE_SECONDS', default=5, cast=float)
+HEALTH_MAX_QUEUE_DEPTH = config('HEALTH_MAX_QUEUE_DEPTH', default=1000, cast=int)  # background jobs waiting
+
+# GET paths served without sessions/auth (see credmarket.middleware.FastPathMiddleware)
+MIDDLEWARE_BYPASS_PATHS = ['/health/', '/healthz', '/ready/', '/alive/', '/metrics', '/api/category-fields/']
+
+# Prometheus metrics (see credmarket.metrics). With several gunicorn workers,
+# set METRICS_DIR to a directory they share, emptied on each deploy
+METRICS_DIR = config('METRICS_DIR', default='')
+METRICS_FLUSH_SECONDS = config('METRICS_FLUSH_SECONDS', default=5, cast=float)
+METRICS_TOKEN = config('METRICS_TOKEN', default='')  # required as a Bearer token; without one /metrics is 404 unless DEBUG
+SERVER_TIMING = config('SERVER_TIMING', default=DEBUG, cast=bool)  # the header shows per-view query counts to anyone
+
+# Time each middleware per request (see credmarket.profiling); results on /health/
+MIDDLEWARE_PROFILING = config('MIDDLEWARE_PROFILING', default=False, cast=bool)
+if MIDDLEWARE_PROFILING:
+    from credmarket.profiling import profiled
+    MIDDLEWARE = profiled(MIDDLEWARE)
+
 # Login URLs
 LOGIN_URL = 'accounts:login'
 LOGIN_REDIRECT_URL = 'listings:home'
 LOGOUT_REDIRECT_URL = 'accounts:login'
 
 # Logging Configuration
+# Handlers run on a background thread behind a queue (see credmarket.log);
+# LOG_FORMAT=json writes one JSON object per line for log shippers
+LOGGING_CONFIG = 'credmarket.log.configure'
+LOG_QUEUE = config('LOG_QUEUE', default=True, cast=bool)
+LOG_FORMAT = config('LOG_FORMAT', default='detailed' if DEBUG else 'json')
+LOG_LEVEL = config('LOG_LEVEL', default='DEBUG' if DEBUG else 'INFO')
+
+# Fraction of DEBUG/INFO records kept per logger (and its children); warnings
+# and errors are always kept
+LOG_SAMPLING = {
+    'listings.access': config('LOG_ACCESS_SAMPLE_RATE', default=0.01, cast=float),
+}
+
+# Request tracing (see credmarket.tracing): fraction of requests recorded as
+# spans, exported as OTLP/JSON lines to TRACE_EXPORT_PATH (console if unset)
+TRACE_SAMPLE_RATE = config('TRACE_SAMPLE_RATE', default=0.0, cast=float)
+TRACE_EXPORT_PATH = config('TRACE_EXPORT_PATH', default='')
+TRACE_MAX_SPANS = config('TRACE_MAX_SPANS', default=1000, cast=int)  # per trace
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -250,13 +337,28 @@ LOGGING = {
             'format': '{levelname} {message}',
             'style': '{',
         },
+        'json': {
+            '()': 'credmarket.log.JsonFormatter',
+        },
+        'raw': {
+            'format': '%(message)s',
+        },
     },
     'handlers': {
         'console': {
             'class': 'logging.StreamHandler',
-            'formatter': 'detailed',
+            'formatter': LOG_FORMAT,
             'level': 'DEBUG',
         },
+        'traces': {
+            'class': 'logging.FileHandler',
+            'filename': TRACE_EXPORT_PATH,
+            'delay': True,
+            'formatter': 'raw',
+        } if TRACE_EXPORT_PATH else {
+            'class': 'logging.StreamHandler',
+            'formatter': 'raw',
+        },
     },
     'root': {
         'handlers': ['console'],
@@ -285,27 +387,32 @@ LOGGING = {
         },
         'django.template': {
             'handlers': ['console'],
-            'level': 'DEBUG',
+            'level': 'DEBUG' if DEBUG else 'INFO',
             'propagate': False,
         },
         'credmarket': {
             'handlers': ['console'],
-            'level': 'DEBUG',
+            'level': LOG_LEVEL,
             'propagate': False,
         },
         'accounts': {
             'handlers': ['console'],
-            'level': 'DEBUG',
+            'level': LOG_LEVEL,
             'propagate': False,
         },
         'listings': {
             'handlers': ['console'],
-            'level': 'DEBUG',
+            'level': LOG_LEVEL,
             'propagate': False,
         },
         'companies': {
             'handlers': ['console'],
-            'level': 'DEBUG',
+            'level': LOG_LEVEL,
+            'propagate': False,
+        },
+        'credmarket.traces': {
+            'handlers': ['traces'],
+            'level': 'INFO',
             'propagate': False,
         },
     },
@@ -366,9 +473,49 @@ CACHES = {
         'OPTIONS': {
             'MAX_ENTRIES': 1000,
         },
-    }
+    },
+    # {% cache %} fragments (listing cards); kept apart so they can't evict other entries
+    'template_fragments': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'credmarket-fragments',
+        'OPTIONS': {
+            'MAX_ENTRIES': config('TEMPLATE_FRAGMENT_CACHE_ENTRIES', default=10000, cast=int),
+        },
+    },
 }
 
+# Company directory - domain -> company lookups used by signup/login
+COMPANY_DIRECTORY_CACHE_TIMEOUT = config('COMPANY_DIRECTORY_CACHE_TIMEOUT', default=3600, cast=int)  # shared cache, seconds
+COMPANY_DIRECTORY_LOCAL_TTL = config('COMPANY_DIRECTORY_LOCAL_TTL', default=30, cast=int)  # per-process, seconds
+
+# Category tree - cached per process, rebuilt when invalidated or after this many seconds
+CATEGORY_TREE_MAX_AGE = config('CATEGORY_TREE_MAX_AGE', default=300, cast=int)
+CATEGORY_COUNTS_TTL = config('CATEGORY_COUNTS_TTL', default=60, cast=int)  # listing counts, read apart from the tree
+CATEGORY_FIELDS_API_MAX_AGE = config('CATEGORY_FIELDS_API_MAX_AGE', default=86400, cast=int)  # per-category API, seconds
+
+# Conversation pages poll messaging.views.poll_messages every MESSAGE_POLL_SECONDS.
+# MESSAGE_LONG_POLL makes each poll wait up to MESSAGE_POLL_TIMEOUT seconds for a
+# message instead (rechecking every MESSAGE_POLL_INTERVAL). Only enable it under
+# ASGI workers: under WSGI a waiting poll holds a whole gunicorn worker, and even
+# under ASGI the sync-only middleware (WhiteNoise, OTPMiddleware) keeps a thread
+# per waiting poll.
+MESSAGE_LONG_POLL = config('MESSAGE_LONG_POLL', default=False, cast=bool)
+MESSAGE_POLL_SECONDS = config('MESSAGE_POLL_SECONDS', default=10, cast=int)
+MESSAGE_POLL_TIMEOUT = config('MESSAGE_POLL_TIMEOUT', default=25, cast=int)
+MESSAGE_POLL_INTERVAL = config('MESSAGE_POLL_INTERVAL', default=1, cast=float)
+
+# Deployed release (e.g. the git SHA); part of page ETags, so a deploy with new templates invalidates them
+RELEASE = config('RELEASE', default='')
+
+# Listing lifecycle - see `manage.py expire_listings`
+LISTING_TTL_DAYS = config('LISTING_TTL_DAYS', default=60, cast=int)
+LISTING_ARCHIVE_AFTER_DAYS = config('LISTING_ARCHIVE_AFTER_DAYS', default=180, cast=int)
+
+# Search analytics - searches are buffered per process and bulk-inserted
+SEARCH_LOG_ENABLED = config('SEARCH_LOG_ENABLED', default=True, cast=bool)
+SEARCH_LOG_BUFFER_SIZE = config('SEARCH_LOG_BUFFER_SIZE', default=50, cast=int)
+SEARCH_LOG_FLUSH_INTERVAL = config('SEARCH_LOG_FLUSH_INTERVAL', default=30, cast=int)  # seconds
+
 # Rate limiting for login attempts
 RATELIMIT_ENABLE = not DEBUG  # Disable in development
 RATELIMIT_USE_CACHE = 'default'
@@ -0,0 +1,168 @@
+"""
+Benchmarks for the core marketplace flows (needs pytest-benchmark)
+
+Not part of the default test run. Run and save a baseline, then compare later runs:
+
+    pytest credmarket/test_benchmarks.py --no-cov --benchmark-autosave
+    pytest credmarket/test_benchmarks.py --no-cov --benchmark-compare --benchmark-compare-fail=median:25%
+
+BENCHMARK_SCALE multiplies the seeded dataset (default 1: 200 users,
+2,000 listings, 5,000 messages). Queries per request are recorded in each
+benchmark's extra_info and checked against QUERY_BUDGETS, so query-count
+regressions fail regardless of timing noise. The card-grid group compares
+rendering 48 listing cards with and without the fragment cache. For load at production scale
+use loadtest.py against a running server with a dataset from
+`manage.py generate_dataset`.
+"""
+import os
+import random
+import time
+
+import pytest
+from django.core.cache import caches
+from django.db import connection
+from django.template import engines
+from django.test.utils import CaptureQueriesContext
+
+pytest.importorskip('pytest_benchmark')
+
+from accounts.models import User  # noqa: E402
+from companies.models import Company  # noqa: E402
+from listings.models import Category, Listing  # noqa: E402
+from messaging.models import Conversation, Message  # noqa: E402
+
+SCALE = int(os.environ.get('BENCHMARK_SCALE', '1'))
+CITIES = ['Bangalore', 'Mumbai', 'Delhi', 'Hyderabad', 'Pune', 'Chennai']
+WORDS = ['iphone', 'laptop', 'sofa', 'bike', 'car', 'table', 'camera', 'bed', 'desk', 'chair']
+
+# Maximum queries per request for each page
+QUERY_BUDGETS = {
+    'home': 5,
+    'search': 4,
+    'category': 4,
+    'detail': 15,
+    'inbox': 9,
+    'conversation': 9,
+}
+
+CARD_GRID = "{% for listing in listings %}{% include 'listings/_listing_card.html' %}{% endfor %}"
+
+
+@pytest.fixture(scope='module')
+def dataset(django_db_setup, django_db_blocker):
+    """Seed the test database once for the whole module"""
+    rng = random.Random(42)
+    with django_db_blocker.unblock():
+        company = Company.objects.create(name='Bench Corp', domain='benchcorp.com', status='approved')
+        users = User.objects.bulk_create([
+            User(
+                username=f'bench{i}', email=f'bench{i}@benchcorp.com', company=company,
+                status='approved', email_verified=True, location=rng.choice(CITIES),
+                notify_new_company_listings=False,
+            )
+            for i in range(200 * SCALE)
+        ])
+        parent = Category.objects.create(name='Electronics', slug='electronics')
+        categories = [parent] + [
+            Category.objects.create(name=f'Electronics {i}', slug=f'electronics-{i}', parent=parent)
+            for i in range(5)
+        ]
+        listings = Listing.objects.bulk_create([
+            Listing(
+                seller=rng.choice(users), category=rng.choice(categories),
+                title=f'{rng.choice(WORDS).title()} {rng.choice(WORDS)} {i}', slug=f'bench-listing-{i}',
+                description=' '.join(rng.choice(WORDS) for _ in range(30)),
+                price=rng.randint(100, 100000), condition='good', location='Area',
+                city=rng.choice(CITIES), state='State', status='active',
+            )
+            for i in range(2000 * SCALE)
+        ])
+        conversations = Conversation.objects.bulk_create([
+            Conversation(listing=listing, buyer=buyer, seller=listing.seller)
+            for listing, buyer in {
+                (listing.id, buyer.id): (listing, buyer)
+                for listing, buyer in ((rng.choice(listings), rng.choice(users)) for _ in range(500 * SCALE))
+                if buyer.id != listing.seller_id
+            }.values()
+        ])
+        Message.objects.bulk_create([
+            Message(
+                conversation=conversation, sender=conversation.buyer, receiver=conversation.seller,
+                content=f'Message {i}', is_read=True,
+            )
+            for conversation in conversations
+            for i in range(5000 * SCALE // len(conversations))
+        ], batch_size=1000)
+    yield {'listing': listings[0], 'category': parent, 'conversation': conversations[0]}
+
+    with django_db_blocker.unblock():
+        Listing.objects.filter(seller__company=company).delete()
+        User.objects.filter(company=company).delete()
+        Category.objects.filter(id__in=[category.id for category in categories]).delete()
+        company.delete()
+
+
+def _measure(benchmark, client, page, url):
+    with CaptureQueriesContext(connection) as context:
+        response = client.get(url)
+    assert response.status_code == 200
+    queries = len(context)
+    benchmark.extra_info['queries'] = queries
+    benchmark(client.get, url)
+    assert queries <= QUERY_BUDGETS[page], f'{page} ran {queries} queries'
+
+
+def test_home(benchmark, client, dataset):
+    _measure(benchmark, client, 'home', '/')
+
+
+def test_search(benchmark, client, dataset):
+    _measure(benchmark, client, 'search', '/listings/?q=laptop&show_all=1')
+
+
+def test_category_browse(benchmark, client, dataset):
+    _measure(benchmark, client, 'category', f"/category/{dataset['category'].slug}/")
+
+
+def test_listing_detail(benchmark, client, dataset):
+    _measure(benchmark, client, 'detail', f"/listings/{dataset['listing'].slug}/")
+
+
+def test_inbox(benchmark, client, dataset):
+    client.force_login(dataset['conversation'].buyer)
+    _measure(benchmark, client, 'inbox', '/messages/')
+
+
+def test_conversation(benchmark, client, dataset):
+    conversation = dataset['conversation']
+    client.force_login(conversation.buyer)
+    _measure(benchmark, client, 'conversation', f'/messages/conversation/{conversation.pk}/')
+
+
+@pytest.fixture
+def card_grid(db, dataset):
+    """Render a 48-card grid, as on a full listings page"""
+    listings = list(
+        Listing.objects.select_related('seller__company', 'category').prefetch_related('images')[:48]
+    )
+    template = engines['django'].from_string(CARD_GRID)
+    return lambda: template.render({'listings': listings})
+
+
+@pytest.mark.benchmark(group='card-grid')
+def test_card_grid_uncached(benchmark, card_grid):
+    benchmark.pedantic(card_grid, setup=caches['template_fragments'].clear, rounds=50)
+
+
+@pytest.mark.benchmark(group='card-grid')
+def test_card_grid_cached(benchmark, card_grid):
+    fragments = caches['template_fragments']
+    uncached = []
+    for _ in range(10):
+        fragments.clear()
+        started = time.perf_counter()
+        card_grid()
+        uncached.append(time.perf_counter() - started)
+    benchmark(card_grid)
+    benchmark.extra_info['uncached_median'] = sorted(uncached)[len(uncached) // 2]
+    assert benchmark.stats.stats.median < benchmark.extra_info['uncached_median']
@@ -1,8 +1,10 @@
 """
 Tests for credmarket app views (error handlers) and link validity
 """
+import logging
+
 import pytest
-from django.test import Client, TestCase
+from django.test import Client, TestCase, override_settings
 from django.urls import reverse
 from accounts.models import User
 from companies.models import Company
@@ -204,3 +206,399 @@ class LinkValidityTests(TestCase):
         response = self.client.get('/health/')
         self.assertIn(response.status_code, [200, 404],  # May not be configured in all environments
                      f"Health endpoint returned unexpected status {response.status_code}")
+    
+    @override_settings(METRICS_TOKEN='s3cret')
+    def test_health_endpoint_reports_connections(self):
+        """Test that the health check includes database connection stats"""
+        response = self.client.get('/health/', HTTP_AUTHORIZATION='Bearer s3cret')
+        self.assertEqual(response.status_code, 200)
+        stats = response.json()['connections']
+        self.assertTrue(stats['databases']['default']['open'])
+        self.assertIn('background_queue', stats)
+
+
+class MiddlewareTests(TestCase):
+    """Tests for the slimmed middleware stack and its profiling mode"""
+    
+    def setUp(self):
+        company = Company.objects.create(name="Test Corp", domain="testcorp.com", status='approved')
+        self.user = User.objects.create_user(
+            username='mwuser', email='mw@testcorp.com', password='x', company=company, status='approved'
+        )
+    
+    def test_security_headers(self):
+        from credmarket.middleware import CONTENT_SECURITY_POLICY
+        
+        response = self.client.get('/alive/')
+        self.assertEqual(response['Content-Security-Policy'], CONTENT_SECURITY_POLICY)
+        self.assertIn("frame-ancestors 'none';", response['Content-Security-Policy'])
+        self.assertEqual(response['X-Content-Type-Options'], 'nosniff')
+    
+    def test_probes_skip_session_and_auth(self):
+        """Test that bypass paths never load the session, even for a logged-in browser"""
+        self.client.force_login(self.user)
+        with self.assertNumQueries(0):
+            response = self.client.get('/alive/')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(hasattr(response.wsgi_request, 'session'))
+        self.assertFalse(response.wsgi_request.user.is_authenticated)
+        self.assertEqual(self.client.get('/api/category-fields/').status_code, 200)
+    
+    def test_other_paths_use_full_stack(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('listings:home'))
+        self.assertTrue(response.wsgi_request.user.is_authenticated)
+    
+    def test_error_logging_does_not_load_user(self):
+        from django.test import RequestFactory
+        from django.utils.functional import SimpleLazyObject
+        from credmarket.middleware import ErrorLoggingMiddleware
+        
+        loaded = []
+        request = RequestFactory().get('/boom/')
+        request.user = SimpleLazyObject(lambda: loaded.append(True))
+        with self.assertLogs('credmarket.middleware', 'ERROR') as logs:
+            ErrorLoggingMiddleware(lambda r: None).process_exception(request, ValueError('boom'))
+        self.assertEqual(loaded, [])
+        self.assertIn('User: Not loaded', logs.output[0])
+    
+    def test_profiling_times_each_middleware(self):
+        from django.conf import settings
+        from credmarket.profiling import middleware_profile, profiled, reset_profile
+        
+        reset_profile()
+        with self.settings(MIDDLEWARE=profiled(settings.MIDDLEWARE), MIDDLEWARE_PROFILING=True, METRICS_TOKEN='s3cret'):
+            client = Client()
+            response = client.get(reverse('listings:home'))
+            timings = dict(response.wsgi_request.middleware_timings)
+            self.assertIn('view', timings)
+            self.assertIn('django.contrib.sessions.middleware.SessionMiddleware', timings)
+            self.assertTrue(all(seconds >= 0 for seconds in timings.values()))
+            
+            # The fast path stops the chain, so its time includes the probe's view
+            probe = dict(client.get('/alive/').wsgi_request.middleware_timings)
+            self.assertEqual(list(probe)[-1], 'credmarket.middleware.FastPathMiddleware')
+            
+            names = [row['name'] for row in client.get('/health/', HTTP_AUTHORIZATION='Bearer s3cret').json()['middleware']]
+        self.assertIn('view', names)
+        self.assertLessEqual(set(timings), {row['name'] for row in middleware_profile()})
+
+
+class HealthCheckTests(TestCase):
+    """Tests for the liveness probes and cached component checks"""
+    
+    def setUp(self):
+        from credmarket.health import reset_checks
+        reset_checks()
+    
+    def test_liveness_touches_nothing(self):
+        for url in ['/alive/', '/healthz']:
+            with self.assertNumQueries(0), self.assertNoLogs('credmarket.health'):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json(), {'status': 'alive'})
+    
+    def test_readiness_reports_components(self):
+        response = self.client.get('/ready/')
+        self.assertEqual(response.status_code, 200)
+        components = response.json()['components']
+        self.assertEqual(set(components), {'database', 'cache', 'email_queue', 'storage'})
+        for name, check in components.items():
+            self.assertEqual(check['status'], 'ok', name)
+            self.assertGreaterEqual(check['latency_ms'], 0)
+        self.assertNotIn('python_version', self.client.get('/health/').json())
+    
+    @override_settings(METRICS_TOKEN='s3cret', MIDDLEWARE_PROFILING=True)
+    def test_health_details_need_metrics_token(self):
+        """Test that anonymous callers only get the overall status"""
+        public = self.client.get('/health/')
+        self.assertEqual(public.status_code, 200)
+        self.assertEqual(set(public.json()), {'status', 'checked_at'})
+        self.assertEqual(set(self.client.get('/health/', HTTP_AUTHORIZATION='Bearer wrong').json()), {'status', 'checked_at'})
+        detailed = self.client.get('/health/', HTTP_AUTHORIZATION='Bearer s3cret').json()
+        self.assertIn('connections', detailed)
+        self.assertIn('middleware', detailed)
+    
+    def test_checks_are_cached(self):
+        self.client.get('/ready/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/health/')
+        self.assertEqual(response.status_code, 200)
+        with self.settings(HEALTH_CHECK_CACHE_SECONDS=0), self.assertNumQueries(1):
+            self.client.get('/ready/')
+    
+    def test_failing_critical_component_returns_503(self):
+        from unittest import mock
+        
+        with mock.patch('credmarket.health._check_database', side_effect=RuntimeError('down')), \
+                self.assertLogs('credmarket.health', 'ERROR'):
+            response = self.client.get('/ready/')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()['components']['database']['error'], 'down')
+    
+    def test_failing_optional_component_degrades(self):
+        from unittest import mock
+        
+        with mock.patch('credmarket.health._check_storage', side_effect=OSError('no bucket')), \
+                self.assertLogs('credmarket.health', 'ERROR'):
+            response = self.client.get('/ready/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], 'degraded')
+
+
+class LoggingPipelineTests(TestCase):
+    """Tests for the queued, sampled JSON logging in credmarket.log"""
+    
+    def _record(self, name='listings.access', level=logging.INFO, msg='Viewed %s', args=('home',), **extra):
+        record = logging.LogRecord(name, level, __file__, 1, msg, args, None)
+        record.__dict__.update(extra)
+        return record
+    
+    def test_json_formatter(self):
+        import json
+        import sys
+        from credmarket.log import JsonFormatter
+        
+        try:
+            raise ValueError('boom')
+        except ValueError:
+            record = self._record(user_id=7)
+            record.exc_info = sys.exc_info()
+        entry = json.loads(JsonFormatter().format(record))
+        self.assertEqual(entry['message'], 'Viewed home')
+        self.assertEqual(entry['level'], 'INFO')
+        self.assertEqual(entry['logger'], 'listings.access')
+        self.assertEqual(entry['user_id'], 7)
+        self.assertIn('ValueError: boom', entry['exception'])
+        self.assertNotIn('args', entry)
+    
+    def test_sampling_filter(self):
+        from unittest import mock
+        from credmarket.log import SamplingFilter
+        
+        sampling = SamplingFilter({'listings.access': 0.0, 'listings': 0.5})
+        self.assertFalse(sampling.filter(self._record()))
+        self.assertFalse(sampling.filter(self._record('listings.access.home')))
+        self.assertTrue(sampling.filter(self._record(level=logging.WARNING)))
+        self.assertTrue(sampling.filter(self._record('accounts.views')))
+        
+        record = self._record('listings.views')
+        with mock.patch('credmarket.log.random.random', return_value=0.1):
+            self.assertTrue(sampling.filter(record))
+        self.assertEqual(record.sample_rate, 0.5)
+    
+    def test_arguments_are_merged_before_queueing(self):
+        import json
+        import queue
+        import sys
+        from credmarket.log import BoundedQueueHandler, JsonFormatter
+        
+        handler = BoundedQueueHandler(queue.Queue())
+        items = ['sofa']
+        handler.emit(self._record(msg='Viewed %s', args=(items,), user_id=7))
+        items.append('desk')  # changed after the call; the queued message must not see it
+        try:
+            raise ValueError('boom')
+        except ValueError:
+            failed = logging.LogRecord('listings.views', logging.ERROR, __file__, 1, 'Failed %s', ('save',), sys.exc_info())
+        handler.emit(failed)
+        
+        queued = handler.queue.get_nowait()
+        self.assertEqual((queued.msg, queued.args, queued.user_id), ("Viewed ['sofa']", None, 7))
+        queued = handler.queue.get_nowait()
+        self.assertIsNone(queued.exc_info)
+        entry = json.loads(JsonFormatter().format(queued))
+        self.assertEqual(entry['message'], 'Failed save')
+        self.assertIn('ValueError: boom', entry['exception'])
+    
+    def test_full_queue_drops_and_counts(self):
+        import queue
+        from unittest import mock
+        from credmarket.log import BoundedQueueHandler, dropped_records
+        
+        handler = BoundedQueueHandler(queue.Queue(1))
+        dropped = dropped_records()
+        with mock.patch.object(handler, 'handleError') as handle_error:
+            handler.emit(self._record())
+            handler.emit(self._record())
+        handle_error.assert_not_called()
+        self.assertEqual(handler.queue.qsize(), 1)
+        self.assertEqual(dropped_records(), dropped + 1)
+    
+    def test_handlers_run_on_listener_thread(self):
+        import threading
+        from django.conf import settings
+        from credmarket.log import BoundedQueueHandler, configure
+        
+        seen = []
+        
+        class Capture(logging.Handler):
+            def emit(self, record):
+                seen.append((self.format(record), threading.current_thread()))
+        
+        config = {
+            'version': 1,
+            'disable_existing_loggers': False,
+            'handlers': {'capture': {'()': Capture, 'level': 'DEBUG'}},
+            'loggers': {'credmarket.logtest': {'handlers': ['capture'], 'level': 'DEBUG', 'propagate': False}},
+        }
+        logger = logging.getLogger('credmarket.logtest')
+        try:
+            configure(config, sample_rates={'credmarket.logtest.sampled': 0.0})
+            self.assertEqual([type(h) for h in logger.handlers], [BoundedQueueHandler])
+            logger.info('Sent %s emails', 3)
+            logging.getLogger('credmarket.logtest.sampled').info('dropped')
+        finally:
+            configure(settings.LOGGING)
+        self.assertEqual([message for message, _ in seen], ['Sent 3 emails'])
+        self.assertIsNot(seen[0][1], threading.current_thread())
+
+
+class TracingTests(TestCase):
+    """Tests for request trace ids and sampled span export"""
+    
+    def _export(self, logs):
+        import json
+        spans = json.loads(logs.records[0].getMessage())['resourceSpans'][0]['scopeSpans'][0]['spans']
+        return {s['name']: s for s in spans}
+    
+    def test_every_request_gets_a_trace_id(self):
+        response = self.client.get(reverse('listings:home'))
+        self.assertRegex(response.wsgi_request.trace_id, r'^[0-9a-f]{32}$')
+        
+        trace_id = '4bf92f3577b34da6a3ce929d0e0e4736'
+        response = self.client.get(reverse('listings:home'), HTTP_TRACEPARENT=f'00-{trace_id}-00f067aa0ba902b7-01')
+        self.assertEqual(response.wsgi_request.trace_id, trace_id)
+    
+    def test_sampled_request_exports_spans(self):
+        Category.objects.create(name='Traced', slug='traced')
+        with self.settings(TRACE_SAMPLE_RATE=1.0), self.assertLogs('credmarket.traces', 'INFO') as logs:
+            response = Client().get(reverse('listings:home'), HTTP_TRACEPARENT='00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01')
+        self.assertEqual(response.status_code, 200)
+        spans = self._export(logs)
+        
+        root = spans['GET /']
+        self.assertEqual(root['traceId'], '4bf92f3577b34da6a3ce929d0e0e4736')
+        self.assertEqual(root['parentSpanId'], '00f067aa0ba902b7')
+        view = spans['view listings:home']
+        self.assertEqual(view['parentSpanId'], root['spanId'])
+        queries = [s for s in spans.values() if s['name'].startswith('SELECT')]
+        self.assertTrue(queries)
+        self.assertEqual(spans['template.render']['parentSpanId'], view['spanId'])
+        self.assertTrue(all(s['traceId'] == root['traceId'] for s in spans.values()))
+    
+    def test_cache_and_email_spans(self):
+        from django.core.cache import cache
+        from django.core.mail import send_mail
+        from credmarket import tracing
+        
+        tracing.instrument()
+        root = tracing.Trace(tracing.new_trace_id(), 100).start_span('test')
+        with self.assertLogs('credmarket.traces', 'INFO') as logs:
+            with tracing.resume(root):
+                cache.get('tracing-test-missing')
+                send_mail('Subject', 'Body', 'from@example.com', ['to@example.com'])
+            root.finish()
+            root.trace.export()
+        spans = self._export(logs)
+        self.assertFalse(next(a['value']['boolValue'] for a in spans['cache.get']['attributes'] if a['key'] == 'cache.hit'))
+        self.assertEqual(spans['email.send']['parentSpanId'], root.span_id)
+    
+    def test_error_log_includes_trace_id(self):
+        from django.test import RequestFactory
+        from credmarket.middleware import ErrorLoggingMiddleware
+        
+        request = RequestFactory().get('/boom/')
+        request.trace_id = 'abc123'
+        with self.assertLogs('credmarket.middleware', 'ERROR') as logs:
+            ErrorLoggingMiddleware(lambda r: None).process_exception(request, ValueError('boom'))
+        self.assertIn('Trace: abc123', logs.output[0])
+        self.assertEqual(logs.records[0].trace_id, 'abc123')
+
+
+class MetricsTests(TestCase):
+    """Tests for /metrics and the Server-Timing header"""
+    
+    def setUp(self):
+        from credmarket import metrics
+        metrics.reset()
+    
+    @override_settings(SERVER_TIMING=True)
+    def test_server_timing_header(self):
+        response = self.client.get(reverse('listings:home'))
+        timing = response['Server-Timing']
+        self.assertRegex(timing, r'db;dur=[\d.]+;desc="\d+ queries"')
+        self.assertIn('render;dur=', timing)
+        self.assertIn('app;dur=', timing)
+    
+    @override_settings(SERVER_TIMING=False)
+    def test_server_timing_can_be_disabled(self):
+        self.assertNotIn('Server-Timing', self.client.get(reverse('listings:home')))
+    
+    @override_settings(METRICS_TOKEN='s3cret')
+    def test_metrics_endpoint(self):
+        from django.core.cache import cache
+        
+        self.client.get(reverse('listings:home'))
+        self.client.get(reverse('listings:home'))
+        cache.get('metrics-test-missing')
+        with self.assertNumQueries(0):
+            response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer s3cret')
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('credmarket_http_requests_total{method="GET",status="200",view="listings:home"} 2', body)
+        self.assertIn('credmarket_http_request_duration_seconds_count{view="listings:home"} 2', body)
+        self.assertIn('credmarket_http_request_duration_seconds_bucket{view="listings:home",le="+Inf"} 2', body)
+        self.assertIn('credmarket_db_queries_total{view="listings:home"}', body)
+        self.assertIn('credmarket_cache_requests_total{cache="default",result="miss"}', body)
+        self.assertIn('credmarket_background_queue_depth 0', body)
+        self.assertIn('credmarket_log_records_dropped_total ', body)
+        self.assertIn('credmarket_threads{name="MainThread"} 1', body)
+    
+    @override_settings(DEBUG=False, METRICS_TOKEN='')
+    def test_metrics_hidden_without_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+    
+    def test_metrics_token(self):
+        with self.settings(METRICS_TOKEN='s3cret'):
+            self.assertEqual(self.client.get('/metrics').status_code, 401)
+            response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer s3cret')
+        self.assertEqual(response.status_code, 200)
+    
+    def test_workers_are_aggregated(self):
+        import json
+        import tempfile
+        from pathlib import Path
+        
+        with tempfile.TemporaryDirectory() as directory:
+            # Another worker's snapshot, from a process that has since exited
+            Path(directory, '999999999.json').write_text(json.dumps({
+                'pid': 999999999,
+                'counters': [['credmarket_http_requests_total', [['method', 'GET'], ['status', '200'], ['view', 'listings:home']], 5]],
+                'histograms': [],
+                'gauges': [['credmarket_background_queue_depth', [], 7]],
+            }))
+            with self.settings(METRICS_DIR=directory, METRICS_TOKEN='s3cret'):
+                self.client.get(reverse('listings:home'))
+                body = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer s3cret').content.decode()
+                self.assertTrue(Path(directory, f'{__import__("os").getpid()}.json').exists())
+        self.assertIn('credmarket_http_requests_total{method="GET",status="200",view="listings:home"} 6', body)
+        self.assertIn('credmarket_background_queue_depth 0', body)
+
+
+class BackgroundQueueTests(TestCase):
+    """Tests for the background job queue"""
+    
+    def test_drain_waits_for_queued_jobs(self):
+        import threading
+        from credmarket.background import drain, enqueue
+        
+        release = threading.Event()
+        done = []
+        with self.settings(BACKGROUND_JOBS_EAGER=False):
+            enqueue(release.wait)
+            enqueue(done.append, 'sent')
+            self.assertFalse(drain(timeout=0.1))
+            release.set()
+            self.assertTrue(drain(timeout=5))
+        self.assertEqual(done, ['sent'])
@@ -0,0 +1,409 @@
+"""
+Lightweight request tracing.
+
+Every request gets a trace id (request.trace_id), taken from an incoming W3C
+traceparent header when there is one, so error logs can be matched with the
+proxy's and the client's. TRACE_SAMPLE_RATE of requests are also recorded as
+spans: the request and its view, and below them each SQL query, cache call,
+template render, storage call (Cloudinary) and email sent, including email
+sent later by background jobs the request queued.
+
+A recorded trace is written as one OTLP/JSON line (the format of the
+OpenTelemetry collector's file exporter) to TRACE_EXPORT_PATH, or to the
+console when that's unset. It's written by the 'credmarket.traces' logger,
+so serializing and writing happen on the logging thread (see credmarket.log).
+
+Spans live in a ContextVar, so only code running for a sampled request pays
+more than a lookup. The instrumentation itself (wrapping the cache, storage,
+template and email classes, and a database execute_wrapper on each
+connection) is only installed when TRACE_SAMPLE_RATE is above zero.
+"""
+import json
+import logging
+import random
+import re
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+export_logger = logging.getLogger('credmarket.traces')
+
+# OTLP span kinds and status codes
+INTERNAL, SERVER, CLIENT = 1, 2, 3
+STATUS_OK, STATUS_ERROR = 1, 2
+
+MAX_STATEMENT_LENGTH = 2000
+
+_TRACEPARENT = re.compile(r'^[0-9a-f]{2}-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$')
+
+_current = ContextVar('trace_span', default=None)
+_installed = False
+_wrappers = set()  # so a method inherited from an already-patched class isn't wrapped twice
+
+
+def new_trace_id():
+    return '%032x' % random.getrandbits(128)
+
+
+def new_span_id():
+    return '%016x' % random.getrandbits(64)
+
+
+def parse_traceparent(header):
+    """(trace id, parent span id) from a W3C traceparent header, or (None, None)"""
+    match = _TRACEPARENT.match(header.strip().lower()) if header else None
+    if match is None or match.group(1) == '0' * 32:
+        return None, None
+    return match.group(1), match.group(2)
+
+
+class Trace:
+    """The spans recorded for one sampled request"""
+
+    def __init__(self, trace_id, max_spans):
+        self.trace_id = trace_id
+        self.max_spans = max_spans
+        self.started = 0
+        self.dropped = 0
+        self.finished = []
+        self.exported = False
+
+    def start_span(self, name, parent_id=None, kind=INTERNAL, attributes=None):
+        if self.started >= self.max_spans:
+            self.dropped += 1
+            return None
+        self.started += 1
+        return Span(self, name, parent_id, kind, attributes)
+
+    def _finished(self, span):
+        if self.exported:
+            # Ended after the request was exported (a background job); send it alone
+            export([span])
+        else:
+            self.finished.append(span)
+
+    def export(self):
+        self.exported = True
+        export(self.finished)
+        self.finished = []
+
+
+class Span:
+    __slots__ = ('trace', 'span_id', 'parent_id', 'name', 'kind', 'start', 'end', 'attributes', 'status', 'message')
+
+    def __init__(self, trace, name, parent_id, kind, attributes):
+        self.trace = trace
+        self.span_id = new_span_id()
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.attributes = dict(attributes or {})
+        self.status = None
+        self.message = ''
+        self.start = time.time_ns()
+        self.end = None
+
+    def child(self, name, kind=INTERNAL, attributes=None):
+        return self.trace.start_span(name, self.span_id, kind, attributes)
+
+    def record_error(self, exc):
+        self.status = STATUS_ERROR
+        self.message = f'{type(exc).__name__}: {exc}'
+
+    def finish(self):
+        if self.end is None:
+            self.end = time.time_ns()
+            self.trace._finished(self)
+
+
+def current_span():
+    """The active span of a sampled trace, or None"""
+    return _current.get()
+
+
+@contextmanager
+def span(name, kind=INTERNAL, **attributes):
+    """Record the block as a child of the active span; a no-op outside a sampled trace"""
+    parent = _current.get()
+    child = parent.child(name, kind, attributes) if parent is not None else None
+    if child is None:
+        yield None
+        return
+    token = _current.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.record_error(e)
+        raise
+    finally:
+        _current.reset(token)
+        child.finish()
+
+
+@contextmanager
+def resume(parent):
+    """Continue a trace in another thread, e.g. a background job the request queued"""
+    if parent is None:
+        yield
+        return
+    token = _current.set(parent)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def _attribute(value):
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def _attributes(attributes):
+    return [{'key': key, 'value': _attribute(value)} for key, value in attributes.items()]
+
+
+def otlp(spans):
+    """OTLP/JSON ExportTraceServiceRequest for finished spans"""
+    resource = {'service.name': 'credmarket'}
+    if getattr(settings, 'RELEASE', ''):
+        resource['service.version'] = settings.RELEASE
+    rows = []
+    for s in spans:
+        row = {
+            'traceId': s.trace.trace_id,
+            'spanId': s.span_id,
+            'name': s.name,
+            'kind': s.kind,
+            'startTimeUnixNano': str(s.start),
+            'endTimeUnixNano': str(s.end),
+            'attributes': _attributes(s.attributes),
+            'status': {'code': s.status or STATUS_OK, 'message': s.message},
+        }
+        if s.parent_id:
+            row['parentSpanId'] = s.parent_id
+        rows.append(row)
+    return {'resourceSpans': [{
+        'resource': {'attributes': _attributes(resource)},
+        'scopeSpans': [{'scope': {'name': __name__}, 'spans': rows}],
+    }]}
+
+
+class _Export:
+    """Serialized when the logging thread formats the record, not on the request thread"""
+
+    def __init__(self, spans):
+        self.spans = spans
+
+    def __str__(self):
+        return json.dumps(otlp(self.spans), separators=(',', ':'))
+
+
+def export(spans):
+    if spans:
+        export_logger.info('%s', _Export(spans))
+
+
+# Instrumentation
+
+def _traced(func, name, kind=CLIENT, attributes=None):
+    """Wrap func in a span when called during a sampled trace; attributes(*args, **kwargs) -> dict"""
+    if func in _wrappers:
+        return func
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if _current.get() is None:
+            return func(*args, **kwargs)
+        with span(name, kind, **(attributes(*args, **kwargs) if attributes else {})):
+            return func(*args, **kwargs)
+    _wrappers.add(wrapper)
+    return wrapper
+
+
+def _query_span(execute, sql, params, many, context):
+    """Database execute_wrapper: one span per query"""
+    if _current.get() is None:
+        return execute(sql, params, many, context)
+    conn = context['connection']
+    operation = sql.split(None, 1)[0].upper() if sql.strip() else 'QUERY'
+    with span(f'{operation} {conn.alias}', CLIENT, **{
+        'db.system': conn.vendor,
+        'db.name': conn.alias,
+        'db.statement': sql[:MAX_STATEMENT_LENGTH],
+        'db.many': many,
+    }):
+        return execute(sql, params, many, context)
+
+
+def _add_query_wrapper(sender=None, connection=None, **kwargs):
+    if _query_span not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_query_span)
+
+
+def _cache_get(get):
+    if get in _wrappers:
+        return get
+
+    @wraps(get)
+    def wrapper(self, key, default=None, version=None):
+        if _current.get() is None:
+            return get(self, key, default, version)
+        with span('cache.get', CLIENT, **{'cache.backend': type(self).__name__, 'cache.key': str(key)}) as s:
+            value = get(self, key, default, version)
+            if s is not None:
+                s.attributes['cache.hit'] = value is not default
+            return value
+    _wrappers.add(wrapper)
+    return wrapper
+
+
+def _patch(cls, method, wrap):
+    setattr(cls, method, wrap(getattr(cls, method)))
+
+
+def instrument():
+    """Install the span hooks (once per process)"""
+    global _installed
+    if _installed:
+        return
+    _installed = True
+
+    from django.core.cache import caches
+    from django.core.files.storage import storages
+    from django.core.mail import EmailMessage
+    from django.db import connections
+    from django.db.backends.signals import connection_created
+    from django.template.base import Template
+
+    connection_created.connect(_add_query_wrapper, dispatch_uid='credmarket.tracing')
+    for conn in connections.all(initialized_only=True):
+        _add_query_wrapper(connection=conn)
+
+    cache_classes = {type(caches[alias]) for alias in settings.CACHES}
+    for cls in cache_classes:
+        _patch(cls, 'get', _cache_get)
+        for method in ('set', 'add', 'delete', 'get_many', 'set_many', 'delete_many', 'incr', 'touch', 'has_key'):
+            _patch(cls, method, lambda func, method=method: _traced(
+                func, f'cache.{method}', attributes=lambda self, *args, **kwargs: {'cache.backend': type(self).__name__},
+            ))
+
+    storage = type(storages['default'])
+    for method in ('save', 'open', 'delete', 'exists'):
+        _patch(storage, method, lambda func, method=method: _traced(
+            func, f'storage.{method}',
+            attributes=lambda self, name, *args, **kwargs: {'storage.backend': type(self).__name__, 'storage.name': str(name)},
+        ))
+
+    _patch(Template, 'render', lambda func: _traced(
+        func, 'template.render', INTERNAL,
+        attributes=lambda self, context: {'template.name': self.origin.template_name or self.name or '<string>'},
+    ))
+    _patch(EmailMessage, 'send', lambda func: _traced(
+        func, 'email.send',
+        attributes=lambda self, *args, **kwargs: {'email.recipients': len(self.recipients()), 'email.subject': self.subject},
+    ))
+
+
+class TracingMiddleware:
+    """
+    Give each request a trace id and record sampled requests (see module
+    docstring). Sits below FastPathMiddleware, so health probes aren't traced.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'TRACE_SAMPLE_RATE', 0.0)
+        self.max_spans = getattr(settings, 'TRACE_MAX_SPANS', 1000)
+        if self.sample_rate > 0:
+            instrument()
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def _start(self, request):
+        trace_id, parent_id = parse_traceparent(request.META.get('HTTP_TRACEPARENT'))
+        request.trace_id = trace_id or new_trace_id()
+        if not self.sample_rate or random.random() >= self.sample_rate:
+            return None
+        root = Trace(request.trace_id, self.max_spans).start_span(
+            f'{request.method} {request.path_info}', parent_id, SERVER,
+            {'http.request.method': request.method, 'url.path': request.path_info},
+        )
+        request._trace_span = root
+        return _current.set(root)
+
+    def _finish(self, request, response):
+        root = request._trace_span
+        view = getattr(request, '_trace_view', None)
+        if view is not None:
+            view.finish()
+        match = getattr(request, 'resolver_match', None)
+        if match is not None and match.route:
+            root.name = f'{request.method} /{match.route}'
+            root.attributes['http.route'] = match.route
+        if response is not None:
+            root.attributes['http.response.status_code'] = response.status_code
+            if response.status_code >= 500:
+                root.status = STATUS_ERROR
+        if root.trace.dropped:
+            root.attributes['trace.dropped_spans'] = root.trace.dropped
+        root.finish()
+        root.trace.export()
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        token = self._start(request)
+        if token is None:
+            return self.get_response(request)
+        response = None
+        try:
+            response = self.get_response(request)
+            return response
+        finally:
+            _current.reset(token)
+            self._finish(request, response)
+
+    async def __acall__(self, request):
+        token = self._start(request)
+        if token is None:
+            return await self.get_response(request)
+        response = None
+        try:
+            response = await self.get_response(request)
+            return response
+        finally:
+            _current.reset(token)
+            self._finish(request, response)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        root = getattr(request, '_trace_span', None)
+        if root is None:
+            return None
+        match = request.resolver_match
+        name = match.view_name if match is not None else f'{view_func.__module__}.{view_func.__name__}'
+        view = root.child(f'view {name}', attributes={'code.function': name})
+        if view is not None:
+            request._trace_view = view
+            # Queries and renders in the view nest under it (sync handlers; async
+            # ones run this hook in a thread, so their spans stay under the request)
+            _current.set(view)
+        return None
+
+    def process_exception(self, request, exception):
+        for attr in ('_trace_view', '_trace_span'):
+            s = getattr(request, attr, None)
+            if s is not None:
+                s.record_error(exception)
+        return None
@@ -8,6 +8,7 @@ from django.conf import settings
 from django.conf.urls.static import static
 from django.views.generic import TemplateView
 from .health import health_check, readiness_check, liveness_check
+from .metrics import metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -18,9 +19,10 @@ urlpatterns = [
     
     # Health check endpoints
     path('health/', health_check, name='health_check'),
-    path('healthz', health_check, name='healthz'),  # Render default health check
+    path('healthz', liveness_check, name='healthz'),  # Render default health check; probed constantly
     path('ready/', readiness_check, name='readiness'),
     path('alive/', liveness_check, name='liveness'),
+    path('metrics', metrics_view, name='metrics'),  # Prometheus scrape
     
     # Static pages
     path('how-it-works/', TemplateView.as_view(template_name='how_it_works.html'), name='how_it_works'),
@@ -4,16 +4,28 @@ from django.urls import reverse
 from django.utils import timezone
 from django.core.mail import send_mail
 from django.conf import settings
-from .models import Category, Listing, ListingImage, ListingReport
+from django.db.models import Count, Q
+from .models import Category, Listing, ListingImage, ListingReport, SavedSearch
+from .counters import recount_categories, touch_categories
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+class CategoryListFilter(admin.RelatedFieldListFilter):
+    """Category filter whose choices load parents in the same query (Category.__str__ shows the parent)"""
+    
+    def field_choices(self, field, request, model_admin):
+        ordering = self.field_admin_ordering(field, request, model_admin) or Category._meta.ordering
+        categories = Category.objects.select_related('parent').order_by(*ordering)
+        return [(category.pk, str(category)) for category in categories]
+
+
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
     list_display = ['name', 'parent', 'slug', 'listing_count', 'is_active', 'order']
-    list_filter = ['is_active', 'parent']
+    list_filter = ['is_active', ('parent', CategoryListFilter)]
+    list_select_related = ['parent']
     search_fields = ['name', 'slug']
     prepopulated_fields = {'slug': ('name',)}
     ordering = ['order', 'name']
@@ -26,6 +38,12 @@ class CategoryAdmin(admin.ModelAdmin):
             'fields': ('is_active', 'order')
         }),
     )
+    
+    def listing_count(self, obj):
+        """Maintained counter, so the changelist needs no aggregate"""
+        return obj.active_listing_count
+    listing_count.short_description = 'Active listings (incl. subcategories)'
+    listing_count.admin_order_field = 'active_listing_count'
 
 
 class ListingImageInline(admin.TabularInline):
@@ -37,7 +55,8 @@ class ListingImageInline(admin.TabularInline):
 @admin.register(Listing)
 class ListingAdmin(admin.ModelAdmin):
     list_display = ['title', 'seller', 'category', 'price', 'condition', 'status', 'views_count', 'created_at']
-    list_filter = ['status', 'condition', 'is_featured', 'category', 'created_at']
+    list_filter = ['status', 'condition', 'is_featured', ('category', CategoryListFilter), 'created_at']
+    list_select_related = ['seller', 'category', 'category__parent']
     search_fields = ['title', 'description', 'seller__email', 'location', 'city']
     readonly_fields = ['views_count', 'created_at', 'updated_at', 'slug']
     prepopulated_fields = {'slug': ('title',)}
@@ -66,22 +85,33 @@ class ListingAdmin(admin.ModelAdmin):
     actions = ['mark_as_sold', 'mark_as_active', 'mark_as_inactive', 'feature_listings']
     
     def mark_as_sold(self, request, queryset):
-        queryset.update(status='sold')
+        category_ids = set(queryset.values_list('category_id', flat=True))
+        queryset.update(status='sold', updated_at=timezone.now())  # update() skips auto_now; page ETags read updated_at
+        recount_categories()  # update() bypasses Listing.save()
+        touch_categories(category_ids)
         self.message_user(request, f"{queryset.count()} listings marked as sold.")
     mark_as_sold.short_description = "Mark as sold"
     
     def mark_as_active(self, request, queryset):
-        queryset.update(status='active')
+        category_ids = set(queryset.values_list('category_id', flat=True))
+        queryset.update(status='active', updated_at=timezone.now())
+        recount_categories()  # update() bypasses Listing.save()
+        touch_categories(category_ids)
         self.message_user(request, f"{queryset.count()} listings marked as active.")
     mark_as_active.short_description = "Mark as active"
     
     def mark_as_inactive(self, request, queryset):
-        queryset.update(status='inactive')
+        category_ids = set(queryset.values_list('category_id', flat=True))
+        queryset.update(status='inactive', updated_at=timezone.now())
+        recount_categories()  # update() bypasses Listing.save()
+        touch_categories(category_ids)
         self.message_user(request, f"{queryset.count()} listings marked as inactive.", messages.SUCCESS)
     mark_as_inactive.short_description = "Mark as inactive (Deactivate)"
     
     def feature_listings(self, request, queryset):
-        queryset.update(is_featured=True)
+        category_ids = set(queryset.values_list('category_id', flat=True))
+        queryset.update(is_featured=True, updated_at=timezone.now())
+        touch_categories(category_ids)
         self.message_user(request, f"{queryset.count()} listings featured.")
     feature_listings.short_description = "Feature selected listings"
 
@@ -90,6 +120,7 @@ class ListingAdmin(admin.ModelAdmin):
 class ListingReportAdmin(admin.ModelAdmin):
     list_display = ['id', 'listing_link', 'reporter_email', 'reason_display', 'status_badge', 'report_count', 'created_at', 'action_buttons']
     list_filter = ['status', 'reason', 'created_at']
+    list_select_related = ['listing', 'reporter', 'reviewed_by']
     search_fields = ['listing__title', 'reporter__email', 'description', 'admin_notes']
     readonly_fields = ['reporter', 'listing', 'reason', 'description', 'created_at', 'updated_at', 'report_count_display']
     
@@ -147,19 +178,25 @@ class ListingReportAdmin(admin.ModelAdmin):
         )
     status_badge.short_description = 'Status'
     
+    def _report_count(self, obj):
+        if hasattr(obj, '_report_count'):
+            return obj._report_count
+        return obj.get_report_count()
+    
     def report_count(self, obj):
         """Total reports for this listing"""
-        count = obj.get_report_count()
+        count = self._report_count(obj)
         if count > 3:
             return format_html('<span style="color: #dc2626; font-weight: bold;">⚠️ {}</span>', count)
         elif count > 1:
             return format_html('<span style="color: #ea580c; font-weight: bold;">{}</span>', count)
         return count
     report_count.short_description = 'Total Reports'
+    report_count.admin_order_field = '_report_count'
     
     def report_count_display(self, obj):
         """For detail view"""
-        return obj.get_report_count()
+        return self._report_count(obj)
     report_count_display.short_description = 'Total Reports for this Listing'
     
     def action_buttons(self, obj):
@@ -205,11 +242,25 @@ class ListingReportAdmin(admin.ModelAdmin):
     
     def get_queryset(self, request):
         qs = super().get_queryset(request)
-        return qs.select_related('listing', 'reporter', 'reviewed_by')
+        # Reports per listing come from the same query instead of one COUNT per row
+        return qs.select_related('listing', 'reporter', 'reviewed_by').annotate(
+            _report_count=Count('listing__reports')
+        )
 
 
 @admin.register(ListingImage)
 class ListingImageAdmin(admin.ModelAdmin):
     list_display = ['listing', 'caption', 'order', 'uploaded_at']
     list_filter = ['uploaded_at']
+    list_select_related = ['listing']
     search_fields = ['listing__title', 'caption']
+
+
+@admin.register(SavedSearch)
+class SavedSearchAdmin(admin.ModelAdmin):
+    list_display = ['user', 'describe', 'is_active', 'created_at', 'last_alerted_at']
+    list_filter = ['is_active', 'created_at']
+    list_select_related = ['user', 'category']
+    search_fields = ['user__email', 'query', 'city']
+    raw_id_fields = ['user']
+    readonly_fields = ['created_at', 'last_alerted_at']
@@ -2,6 +2,12 @@
 Category-specific field configurations for listings
 This defines what additional fields should be shown for each category
 """
+from datetime import date
+import hashlib
+import json
+import time
+
+from django.core.exceptions import ValidationError
 
 CATEGORY_FIELDS = {
     # VEHICLES
@@ -128,3 +134,191 @@ def get_field_label(category_name, field_name):
     if field_name in fields:
         return fields[field_name].get('label', field_name.replace('_', ' ').title())
     return field_name.replace('_', ' ').title()
+
+
+# Compiled schemas
+# CATEGORY_FIELDS is compiled once at import into per-category schemas that
+# validate and coerce attribute values, so numbers are stored as JSON numbers
+# (and can use the expression indexes on Listing.attributes) instead of strings.
+
+# Attribute keys with an expression index on Listing.attributes
+INDEXED_ATTRIBUTES = ['year', 'km_driven', 'bedrooms', 'brand']
+
+# Number fields with few distinct values, offered as facets like select fields
+FACET_NUMBER_ATTRIBUTES = {'year', 'bedrooms', 'bathrooms'}
+
+TEXT_MAX_LENGTH = 200
+
+
+class AttributeField:
+    """One compiled field of a category schema"""
+    
+    def __init__(self, name, config):
+        self.name = name
+        self.type = config.get('type', 'text')
+        self.label = config.get('label', name.replace('_', ' ').title())
+        self.required = config.get('required', False)
+        self.choices = list(config.get('options', []))
+        self.options = frozenset(self.choices)
+        self.facetable = self.type == 'select' or (self.type == 'number' and name in FACET_NUMBER_ATTRIBUTES)
+    
+    def coerce(self, value):
+        """Convert a raw (usually string) value to its stored type; raises ValueError"""
+        if isinstance(value, str):
+            value = value.strip()
+        if value in (None, ''):
+            return None
+        
+        if self.type == 'number':
+            if isinstance(value, bool):
+                raise ValueError(f"{self.label} must be a number.")
+            if isinstance(value, (int, float)):
+                number = value
+            else:
+                text = str(value).replace(',', '')
+                try:
+                    return int(text)
+                except ValueError:
+                    number = float(text)
+            if number != number or number in (float('inf'), float('-inf')):
+                raise ValueError(f"{self.label} must be a number.")
+            return int(number) if float(number).is_integer() else float(number)
+        
+        value = str(value)
+        if self.type == 'date':
+            return date.fromisoformat(value).isoformat()
+        if self.type == 'select':
+            if value not in self.options:
+                raise ValueError(f"{self.label}: '{value}' is not a valid choice.")
+            return value
+        return value[:TEXT_MAX_LENGTH]
+
+
+class CategorySchema:
+    """Compiled attribute schema for one category"""
+    
+    def __init__(self, category_name, fields):
+        self.category_name = category_name
+        self.fields = {name: AttributeField(name, config) for name, config in fields.items()}
+    
+    def clean(self, values):
+        """
+        Validate and coerce attribute values (e.g. from a form).
+        Unknown keys and empty values are dropped.
+        Raises ValidationError listing every problem.
+        """
+        attributes = {}
+        errors = {}
+        for name, field in self.fields.items():
+            try:
+                value = field.coerce(values.get(name))
+            except (TypeError, ValueError) as e:
+                message = str(e)
+                errors[name] = message if message.startswith(field.label) else f"{field.label} is not valid."
+                continue
+            if value is None:
+                if field.required:
+                    errors[name] = f"{field.label} is required."
+                continue
+            attributes[name] = value
+        if errors:
+            raise ValidationError(errors)
+        return attributes
+    
+    def coerce(self, attributes):
+        """
+        Best-effort typing for attributes saved outside a form.
+        Values that don't fit the schema, and keys it doesn't know, are kept as they are.
+        """
+        coerced = dict(attributes)
+        for name, value in attributes.items():
+            field = self.fields.get(name)
+            if field is None:
+                continue
+            try:
+                value = field.coerce(value)
+            except (TypeError, ValueError):
+                continue
+            if value is not None:
+                coerced[name] = value
+        return coerced
+    
+    @property
+    def facet_fields(self):
+        return [field for field in self.fields.values() if field.facetable]
+    
+    def form_values(self, data, prefix='attr_'):
+        """Pick this schema's fields out of submitted form data"""
+        return {name: data.get(f'{prefix}{name}') for name in self.fields}
+
+
+EMPTY_SCHEMA = CategorySchema('', {})
+SCHEMAS = {name: CategorySchema(name, fields) for name, fields in CATEGORY_FIELDS.items()}
+
+
+def get_category_schema(category):
+    """
+    Get the compiled schema for a category instance, id or slug
+    (looked up in the cached category tree). Returns an empty schema if the
+    category has no configured fields.
+    """
+    if category is None:
+        return EMPTY_SCHEMA
+    if not hasattr(category, 'name'):
+        from .category_tree import get_category_tree
+        category = get_category_tree().get(category)
+        if category is None:
+            return EMPTY_SCHEMA
+    return SCHEMAS.get(category.name, EMPTY_SCHEMA)
+
+
+# Precomputed API responses
+# The category fields API serves pre-serialized JSON bodies with strong ETags.
+# Blobs are rebuilt alongside the category tree, but a blob whose bytes didn't
+# change is reused so its ETag and Last-Modified stay stable.
+
+class JSONBlob:
+    """A serialized JSON response body and its validators"""
+    
+    def __init__(self, payload, previous=None):
+        self.body = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        self.etag = '"%s"' % hashlib.sha256(self.body).hexdigest()[:32]
+        if previous is not None and previous.etag == self.etag:
+            self.last_modified = previous.last_modified
+        else:
+            self.last_modified = int(time.time())
+
+
+_blobs = {'tree': None, 'by_id': {}, 'bulk': None}
+
+
+def _build_field_blobs(tree):
+    previous = _blobs['by_id']
+    by_id = {}
+    categories = {}
+    for category in tree.by_id.values():
+        payload = {
+            'success': True,
+            'category_name': category.name,
+            'fields': get_category_fields(category.name),
+        }
+        by_id[category.id] = JSONBlob(payload, previous.get(category.id))
+        categories[str(category.id)] = payload
+    
+    version = hashlib.sha256(
+        json.dumps(categories, sort_keys=True, ensure_ascii=False).encode('utf-8')
+    ).hexdigest()[:16]
+    bulk = JSONBlob({'version': version, 'categories': categories}, _blobs['bulk'])
+    bulk.version = version
+    return by_id, bulk
+
+
+def get_field_blobs():
+    """(blobs by category id, bulk blob) for the current category tree"""
+    from .category_tree import get_category_tree
+    
+    tree = get_category_tree()
+    if _blobs['tree'] is not tree:
+        by_id, bulk = _build_field_blobs(tree)
+        _blobs.update(tree=tree, by_id=by_id, bulk=bulk)
+    return _blobs['by_id'], _blobs['bulk']
@@ -0,0 +1,154 @@
+"""
+Process-wide cache of the category tree.
+
+The whole Category table is loaded with one query into id/slug/name maps,
+parent -> children lists and precomputed descendant id sets, and kept in
+process memory. A version token in the shared cache tells each process
+when to rebuild: Category saves/deletes call invalidate_category_tree().
+Listing counts are served separately (listings.counters.category_counts), so
+listing changes never rebuild the tree. With a per-process cache backend the
+version isn't shared between workers, so trees are also rebuilt after
+CATEGORY_TREE_MAX_AGE seconds.
+
+The tree's copies of active_listing_count are only as fresh as the tree;
+don't display them.
+
+Cached categories are ordinary model instances with `parent` already
+populated; treat them as read-only.
+"""
+import hashlib
+import time
+import uuid
+from collections import defaultdict
+from functools import cached_property
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+VERSION_KEY = 'category-tree:version'
+
+# Important top-level categories shown first on the home page, then alphabetical
+HOME_PRIORITY = ['Electronics', 'Vehicles', 'Real Estate', 'Rent', 'Furniture',
+                 'Home Appliances', 'Cars', 'Bikes', 'Apartments']
+
+_tree = None
+_tree_version = None
+_tree_loaded_at = 0.0
+
+
+class CategoryTree:
+    """Immutable snapshot of all categories"""
+
+    def __init__(self, categories):
+        from .models import Category
+
+        self.by_id = {category.id: category for category in categories}
+        self.by_slug = {category.slug: category for category in categories}
+        self.by_name = {}
+        self._children = defaultdict(list)
+
+        parent_field = Category._meta.get_field('parent')
+        for category in categories:
+            self.by_name.setdefault(category.name, category)
+            parent = self.by_id.get(category.parent_id)
+            # Pre-fill the FK cache so category.parent never queries
+            parent_field.set_cached_value(category, parent)
+            self._children[category.parent_id].append(category)
+
+        self._descendants = {}
+        for category in categories:
+            self._collect_descendants(category.id)
+
+    def _collect_descendants(self, category_id):
+        if category_id in self._descendants:
+            return self._descendants[category_id]
+        # Mark as visited first so a bad parent cycle can't recurse forever
+        self._descendants[category_id] = frozenset([category_id])
+        ids = {category_id}
+        for child in self._children.get(category_id, []):
+            ids.update(self._collect_descendants(child.id))
+        self._descendants[category_id] = frozenset(ids)
+        return self._descendants[category_id]
+
+    def get(self, key):
+        """Look a category up by slug or id; returns None if unknown"""
+        if key is None or key == '':
+            return None
+        category = self.by_slug.get(str(key))
+        if category is None:
+            try:
+                category = self.by_id.get(int(key))
+            except (TypeError, ValueError):
+                return None
+        return category
+
+    def descendant_ids(self, category_id):
+        """The category's id plus the ids of all of its subcategories"""
+        return self._descendants.get(category_id, frozenset())
+
+    def subcategories(self, category_id, active_only=True):
+        return [child for child in self._children.get(category_id, [])
+                if child.is_active or not active_only]
+
+    def roots(self, active_only=True):
+        """Top-level categories in display order"""
+        return self.subcategories(None, active_only=active_only)
+
+    def menu(self):
+        """(category, active subcategories) pairs for every active top-level category"""
+        return [(category, self.subcategories(category.id)) for category in self.roots()]
+
+    @cached_property
+    def fingerprint(self):
+        """Hash of the category data pages display; unlike the version token, equal across processes"""
+        state = sorted(
+            (c.id, c.parent_id, c.name, c.slug, c.icon, c.is_active, c.order)
+            for c in self.by_id.values()
+        )
+        return hashlib.sha1(repr(state).encode()).hexdigest()
+
+    def home_categories(self):
+        """Active top-level categories, priority categories first then alphabetical"""
+        priority = {name: index for index, name in enumerate(HOME_PRIORITY)}
+        return sorted(self.roots(), key=lambda category: (priority.get(category.name, 999), category.name))
+
+
+def _current_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # Evicted or never set: start a new version so nobody keeps an old tree
+        version = uuid.uuid4().hex
+        cache.add(VERSION_KEY, version, None)
+        version = cache.get(VERSION_KEY, version)
+    return version
+
+
+def get_category_tree():
+    """The current category tree, rebuilt only when it has been invalidated"""
+    global _tree, _tree_version, _tree_loaded_at
+    from .models import Category
+
+    version = _current_version()
+    max_age = getattr(settings, 'CATEGORY_TREE_MAX_AGE', 300)
+    tree = _tree
+    if tree is not None and _tree_version == version and time.monotonic() - _tree_loaded_at < max_age:
+        return tree
+
+    tree = CategoryTree(list(Category.objects.order_by('order', 'name')))
+    _tree, _tree_version, _tree_loaded_at = tree, version, time.monotonic()
+    return tree
+
+
+def _bump_version():
+    cache.set(VERSION_KEY, uuid.uuid4().hex, None)
+
+
+def invalidate_category_tree():
+    """
+    Make every process rebuild its tree on next use.
+    Bumps now (so this process sees its own uncommitted changes) and again on
+    commit, so another process can't cache a tree read before the commit.
+    """
+    _bump_version()
+    transaction.on_commit(_bump_version)
@@ -0,0 +1,125 @@
+"""
+Conditional GET for the listing pages.
+
+Each page describes what it shows with a cheap "state" function: when its
+listings last changed, plus anything else that changes the HTML (the
+category tree, counters). Category and listing pages read the per-category
+change times kept in the cache by listings.counters (touched by listing
+saves, status changes and image changes), so validating a page runs no
+scan over the listings. The ETag hashes that state with the viewer and
+the deployed RELEASE; Last-Modified is the newest of those timestamps.
+Django's condition() then answers a matching revalidation with 304 before
+the view runs. Pages are sent as private, no-cache so browsers revalidate
+on every visit instead of guessing a freshness lifetime.
+
+Pages with flash messages waiting are always rendered in full, so the
+messages are shown (and consumed).
+"""
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.contrib import messages
+from django.db.models import Max
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import condition
+
+from .category_tree import get_category_tree
+from .counters import category_ancestor_ids, category_counts, category_last_modified
+from .models import Listing
+
+
+def viewer_state(request):
+    """
+    What the page shows about the viewer. The session key changes on every
+    login, as does the CSRF secret, so a page holding a stale CSRF token is
+    never revalidated.
+    """
+    user = request.user
+    if not user.is_authenticated:
+        return None
+    return (user.pk, user.updated_at, request.session.session_key)
+
+
+def conditional_page(state_func):
+    """
+    Wrap a GET view with condition(). state_func(request, *args, **kwargs)
+    returns (last_modified, parts) describing the page, or None to skip
+    validation (e.g. for a 404).
+    """
+    def state(request, *args, **kwargs):
+        # condition() asks for the ETag and Last-Modified separately; compute once
+        if not hasattr(request, '_page_state'):
+            request._page_state = state_func(request, *args, **kwargs)
+        return request._page_state
+
+    def etag(request, *args, **kwargs):
+        page = state(request, *args, **kwargs)
+        if page is None:
+            return None
+        last_modified, parts = page
+        key = repr((getattr(settings, 'RELEASE', ''), viewer_state(request), last_modified, parts))
+        return hashlib.sha256(key.encode()).hexdigest()[:32]
+
+    def last_modified(request, *args, **kwargs):
+        page = state(request, *args, **kwargs)
+        if page is None:
+            return None
+        times = [page[0]]
+        if request.user.is_authenticated:
+            times.append(request.user.updated_at)
+        return max((t for t in times if t is not None), default=None)
+
+    def decorator(view):
+        conditional_view = condition(etag_func=etag, last_modified_func=last_modified)(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or len(messages.get_messages(request)):
+                return view(request, *args, **kwargs)
+            response = conditional_view(request, *args, **kwargs)
+            patch_cache_control(response, private=True, no_cache=True)
+            patch_vary_headers(response, ['Cookie'])
+            return response
+        return wrapper
+    return decorator
+
+
+def _newest(queryset):
+    return queryset.aggregate(last=Max('updated_at'))['last']
+
+
+def home_state(request):
+    """Any listing change can move the home grids; the category tiles show counts"""
+    counts = tuple(sorted(category_counts().items()))
+    return _newest(Listing.objects.all()), (get_category_tree().fingerprint, counts)
+
+
+def category_state(request, slug):
+    tree = get_category_tree()
+    category = tree.by_slug.get(slug)
+    if category is None:
+        return None
+    return category_last_modified(category.id), tree.fingerprint
+
+
+def listing_state(request, slug):
+    """
+    The listing and its seller, plus the candidates for its related listings.
+    Those (precomputed neighbors and the same category) all come from the
+    listing's top-level category, so its change time covers them.
+    views_count is left out: it changes on every view, so a revalidated page
+    shows the count as of its last full render, and 304s aren't counted as
+    views.
+    """
+    listing = (
+        Listing.objects.filter(slug=slug)
+        .values('id', 'updated_at', 'category_id', 'seller__updated_at')
+        .first()
+    )
+    if listing is None:
+        return None
+    root_id = category_ancestor_ids(listing['category_id'])[-1]
+    related = category_last_modified(root_id)
+    last = max(t for t in (listing['updated_at'], listing['seller__updated_at'], related) if t is not None)
+    return last, (listing['id'], listing['updated_at'], listing['seller__updated_at'], get_category_tree().fingerprint)
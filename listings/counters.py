@@ -0,0 +1,164 @@
+"""
+Maintained listing counters.
+
+Category.active_listing_count holds the number of active listings in a
+category *including all of its subcategories*. Listing.save() adjusts it
+with F() expressions in the same transaction as the status/category change,
+and `manage.py recount` rebuilds it from scratch if it ever drifts (e.g.
+after a queryset.update() that bypassed save()).
+
+Pages read the counts through category_counts(), not from the cached
+category tree: counts change with every listing status change, and the tree
+(with its descendant maps and field schemas) should only be rebuilt when a
+category itself changes. The counts map is one small query, cached for
+CATEGORY_COUNTS_TTL seconds and dropped whenever a count changes.
+
+The cache also holds when each category last had a listing change (its own
+or a subcategory's), for the page ETags in listings.conditional. Listing
+saves and deletes, image changes and adjust_category_count() touch it.
+Bulk queryset.update() callers must call touch_categories() themselves.
+With a per-process cache backend the other workers only notice after
+CATEGORY_COUNTS_TTL seconds, when their entry expires.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from .category_tree import get_category_tree
+
+COUNTS_KEY = 'category-counts'
+CHANGED_KEY = 'category-changed:%s'
+
+# Saving any of these can move a listing in or out of a category's count
+COUNTED_FIELDS = {'status', 'category', 'category_id'}
+
+
+def category_ancestor_ids(category_id):
+    """The category itself followed by its parents up to the root"""
+    tree = get_category_tree()
+    ids = []
+    while category_id is not None and category_id not in ids:
+        ids.append(category_id)
+        category = tree.by_id.get(category_id)
+        category_id = category.parent_id if category else None
+    return ids
+
+
+def category_counts():
+    """{category id: active listing count, including subcategories}"""
+    from .models import Category
+    
+    counts = cache.get(COUNTS_KEY)
+    if counts is None:
+        counts = dict(Category.objects.values_list('id', 'active_listing_count'))
+        cache.set(COUNTS_KEY, counts, getattr(settings, 'CATEGORY_COUNTS_TTL', 60))
+    return counts
+
+
+def invalidate_category_counts():
+    """Drop the cached counts now and again on commit (like invalidate_category_tree)"""
+    cache.delete(COUNTS_KEY)
+    transaction.on_commit(lambda: cache.delete(COUNTS_KEY))
+
+
+def category_last_modified(category_id):
+    """When a listing in the category or one of its subcategories last changed"""
+    key = CHANGED_KEY % category_id
+    changed = cache.get(key)
+    if changed is None:
+        # Expired or never set: treat it as changed now so no stale page validates
+        cache.add(key, timezone.now(), getattr(settings, 'CATEGORY_COUNTS_TTL', 60))
+        changed = cache.get(key) or timezone.now()
+    return changed
+
+
+def touch_categories(category_ids):
+    """
+    Record a listing change in these categories and all of their parents.
+    Touches now and again on commit, like invalidate_category_counts().
+    """
+    ids = set()
+    for category_id in set(category_ids):
+        ids.update(category_ancestor_ids(category_id))
+    if not ids:
+        return
+    
+    def touch():
+        now = timezone.now()
+        cache.set_many({CHANGED_KEY % category_id: now for category_id in ids}, getattr(settings, 'CATEGORY_COUNTS_TTL', 60))
+    touch()
+    transaction.on_commit(touch)
+
+
+def adjust_category_count(category_id, delta):
+    """Add delta to a category's active listing count and to all of its parents"""
+    from .models import Category
+    
+    if category_id is None or not delta:
+        return
+    Category.objects.filter(id__in=category_ancestor_ids(category_id)).update(
+        active_listing_count=F('active_listing_count') + delta
+    )
+    invalidate_category_counts()
+    touch_categories([category_id])
+
+
+def sync_listing_counters(listing, deleted=False):
+    """
+    Apply the counter change implied by a listing's save or delete.
+    Compares against the status/category the instance was loaded with.
+    """
+    loaded_status = getattr(listing, '_loaded_status', None)
+    loaded_category_id = getattr(listing, '_loaded_category_id', None)
+    
+    was_active = loaded_status == 'active'
+    is_active = listing.status == 'active' and not deleted
+    moved = loaded_category_id != listing.category_id
+    
+    leaving = was_active and (not is_active or moved)
+    entering = is_active and (not was_active or moved)
+    if leaving:
+        adjust_category_count(loaded_category_id, -1)
+    if entering:
+        adjust_category_count(listing.category_id, 1)
+    if not (leaving or entering):
+        # No count moved, but the category pages may still show the change
+        touch_categories([listing.category_id])
+    
+    listing._loaded_status = None if deleted else listing.status
+    listing._loaded_category_id = None if deleted else listing.category_id
+
+
+def recount_categories():
+    """
+    Rebuild every category's active listing count from the listings table.
+    Returns the number of categories whose stored count was wrong.
+    """
+    from .models import Category, Listing
+    
+    direct = dict(
+        Listing.objects.filter(status='active')
+        .values_list('category_id')
+        .annotate(count=Count('id'))
+        .order_by()
+    )
+    categories = list(Category.objects.only('id', 'parent_id', 'active_listing_count'))
+    parents = {category.id: category.parent_id for category in categories}
+    
+    totals = {category.id: 0 for category in categories}
+    for category_id, count in direct.items():
+        seen = set()
+        while category_id is not None and category_id not in seen:
+            seen.add(category_id)
+            totals[category_id] = totals.get(category_id, 0) + count
+            category_id = parents.get(category_id)
+    
+    stale = [category for category in categories if category.active_listing_count != totals[category.id]]
+    for category in stale:
+        category.active_listing_count = totals[category.id]
+    Category.objects.bulk_update(stale, ['active_listing_count'], batch_size=500)
+    if stale:
+        invalidate_category_counts()
+    return len(stale)
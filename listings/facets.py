@@ -0,0 +1,147 @@
+"""
+Faceted attribute filtering for category pages.
+
+Filters come in as `attr_<field>` query parameters (repeatable; values are
+ORed) plus `attr_<field>_min` / `attr_<field>_max` for number fields, and are
+mapped to JSON lookups on Listing.attributes using the category schema.
+
+Facet counts ("Diesel (42)") are read from CategoryFacetCount, which
+refresh_facet_counts() rebuilds periodically (`manage.py refresh_facets`).
+Counts are per category and city, over all active listings, so they don't
+narrow as other filters are applied.
+"""
+from collections import Counter, defaultdict
+
+from django.db import transaction
+
+from .category_fields import SCHEMAS, get_category_schema
+from .category_tree import get_category_tree
+from .models import CategoryFacetCount, Listing
+
+PARAM_PREFIX = 'attr_'
+
+
+def _city_key(city):
+    return (city or '').strip().lower()
+
+
+def _coerce_all(field, values):
+    coerced = []
+    for value in values:
+        try:
+            value = field.coerce(value)
+        except (TypeError, ValueError):
+            continue
+        if value is not None:
+            coerced.append(value)
+    return coerced
+
+
+def apply_attribute_filters(listings, schema, params):
+    """
+    Filter listings by the schema's attribute parameters.
+    Returns (queryset, active) where active maps field name -> selected values
+    (and '<field>_min'/'<field>_max' -> bound) for the template and search log.
+    Invalid values are ignored.
+    """
+    active = {}
+    for field in schema.fields.values():
+        values = _coerce_all(field, params.getlist(f'{PARAM_PREFIX}{field.name}'))
+        if values:
+            listings = listings.filter(**{f'attributes__{field.name}__in': values})
+            active[field.name] = values
+
+        if field.type != 'number':
+            continue
+        for suffix, lookup in (('min', 'gte'), ('max', 'lte')):
+            bound = _coerce_all(field, [params.get(f'{PARAM_PREFIX}{field.name}_{suffix}', '')])
+            if bound:
+                listings = listings.filter(**{f'attributes__{field.name}__{lookup}': bound[0]})
+                active[f'{field.name}_{suffix}'] = bound[0]
+    return listings, active
+
+
+def get_facets(category, city, active):
+    """
+    Facets for a category page from the precomputed counts (one query).
+    Falls back to the all-cities counts when the city has none.
+    """
+    schema = get_category_schema(category)
+    fields = schema.facet_fields
+    if not fields:
+        return []
+
+    counts = defaultdict(dict)
+    rows = CategoryFacetCount.objects.filter(
+        category_id=category.id, city__in={_city_key(city), ''}
+    ).values_list('city', 'attribute', 'value', 'count')
+    by_city = defaultdict(list)
+    for row_city, attribute, value, count in rows:
+        by_city[row_city].append((attribute, value, count))
+    for attribute, value, count in by_city.get(_city_key(city)) or by_city.get('', []):
+        counts[attribute][value] = count
+
+    facets = []
+    for field in fields:
+        field_counts = counts.get(field.name, {})
+        selected = {str(value) for value in active.get(field.name, [])}
+        if field.type == 'select':
+            values = [choice for choice in field.choices if choice in field_counts or choice in selected]
+        else:
+            values = sorted(set(field_counts) | selected, key=_number_sort_key, reverse=True)
+        options = [
+            {'value': value, 'count': field_counts.get(value, 0), 'selected': value in selected}
+            for value in values
+        ]
+        if options:
+            facets.append({'name': field.name, 'param': f'{PARAM_PREFIX}{field.name}', 'label': field.label, 'options': options})
+    return facets
+
+
+def _number_sort_key(value):
+    try:
+        return float(value)
+    except ValueError:
+        return float('-inf')
+
+
+def refresh_facet_counts(category_ids=None):
+    """
+    Rebuild CategoryFacetCount for every category with facetable fields (or
+    just the given ones). Each category's rows are replaced in one transaction.
+    Returns the number of rows written.
+    """
+    tree = get_category_tree()
+    written = 0
+    for category in tree.by_id.values():
+        if category_ids is not None and category.id not in category_ids:
+            continue
+        schema = SCHEMAS.get(category.name)
+        if schema is None or not schema.facet_fields:
+            continue
+
+        counts = Counter()
+        listings = Listing.objects.filter(
+            category_id__in=tree.descendant_ids(category.id), status='active'
+        ).values_list('city', 'attributes')
+        for city, attributes in listings.iterator(chunk_size=2000):
+            if not isinstance(attributes, dict):
+                continue
+            for field in schema.facet_fields:
+                value = attributes.get(field.name)
+                if value in (None, ''):
+                    continue
+                value = str(value)[:200]
+                counts[('', field.name, value)] += 1
+                if _city_key(city):
+                    counts[(_city_key(city)[:100], field.name, value)] += 1
+
+        rows = [
+            CategoryFacetCount(category_id=category.id, city=city, attribute=attribute, value=value, count=count)
+            for (city, attribute, value), count in counts.items()
+        ]
+        with transaction.atomic():
+            CategoryFacetCount.objects.filter(category_id=category.id).delete()
+            CategoryFacetCount.objects.bulk_create(rows, batch_size=1000)
+        written += len(rows)
+    return written
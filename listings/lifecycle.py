@@ -0,0 +1,126 @@
+"""
+Listing expiry and archival.
+
+expire_listings() flips active listings past their expires_at (or, for
+listings saved before expiry dates were set, older than LISTING_TTL_DAYS)
+to 'expired'. archive_listings() moves sold/deleted/expired listings that
+haven't changed for LISTING_ARCHIVE_AFTER_DAYS into ArchivedListing and
+deletes them from the hot table. Both work in bounded batches, each in its
+own short transaction, so they can run alongside normal traffic.
+
+Listings with conversations or reports are never archived: deleting them
+would cascade to message history and moderation records.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .counters import adjust_category_count
+from .models import ArchivedListing, Listing
+import logging
+
+logger = logging.getLogger(__name__)
+
+ARCHIVABLE_STATUSES = ['sold', 'deleted', 'expired']
+
+
+def expirable_listings(now=None):
+    now = now or timezone.now()
+    ttl_cutoff = now - timedelta(days=getattr(settings, 'LISTING_TTL_DAYS', 60))
+    return Listing.objects.filter(status='active').filter(
+        Q(expires_at__lte=now) | Q(expires_at__isnull=True, created_at__lte=ttl_cutoff)
+    )
+
+
+def expire_listings(batch_size=500, now=None, dry_run=False):
+    """Expire stale active listings; returns how many were (or would be) expired"""
+    now = now or timezone.now()
+    if dry_run:
+        return expirable_listings(now).count()
+
+    expired = 0
+    while True:
+        with transaction.atomic():
+            rows = list(
+                expirable_listings(now).select_for_update()
+                .order_by('id')
+                .values_list('id', 'category_id')[:batch_size]
+            )
+            if not rows:
+                break
+            ids = [listing_id for listing_id, _ in rows]
+            Listing.objects.filter(id__in=ids).update(status='expired', updated_at=now)
+
+            # update() bypasses Listing.save(), so move the category counters here
+            per_category = {}
+            for _, category_id in rows:
+                per_category[category_id] = per_category.get(category_id, 0) + 1
+            for category_id, count in per_category.items():
+                adjust_category_count(category_id, -count)
+
+        expired += len(rows)
+        if len(rows) < batch_size:
+            break
+
+    logger.info("Expired %s listings", expired)
+    return expired
+
+
+def archivable_listings(now=None):
+    now = now or timezone.now()
+    cutoff = now - timedelta(days=getattr(settings, 'LISTING_ARCHIVE_AFTER_DAYS', 180))
+    return Listing.objects.filter(
+        status__in=ARCHIVABLE_STATUSES,
+        updated_at__lte=cutoff,
+        conversations__isnull=True,
+        reports__isnull=True,
+    )
+
+
+def _archive_row(listing):
+    return ArchivedListing(
+        original_id=listing.id,
+        title=listing.title,
+        slug=listing.slug,
+        description=listing.description,
+        category_id=listing.category_id,
+        seller_id=listing.seller_id,
+        price=listing.price,
+        condition=listing.condition,
+        location=listing.location,
+        city=listing.city,
+        state=listing.state,
+        status=listing.status,
+        attributes=listing.attributes,
+        image_paths=[image.image.name for image in listing.images.all()],
+        views_count=listing.views_count,
+        created_at=listing.created_at,
+        updated_at=listing.updated_at,
+        expires_at=listing.expires_at,
+    )
+
+
+def archive_listings(batch_size=500, now=None, dry_run=False):
+    """Move old inactive listings to ArchivedListing; returns how many were (or would be) moved"""
+    now = now or timezone.now()
+    if dry_run:
+        return archivable_listings(now).count()
+
+    archived = 0
+    while True:
+        with transaction.atomic():
+            listings = list(archivable_listings(now).order_by('id').prefetch_related('images')[:batch_size])
+            if not listings:
+                break
+            ArchivedListing.objects.bulk_create([_archive_row(listing) for listing in listings], ignore_conflicts=True)
+            Listing.objects.filter(id__in=[listing.id for listing in listings]).delete()
+
+        archived += len(listings)
+        if len(listings) < batch_size:
+            break
+
+    logger.info("Archived %s listings", archived)
+    return archived
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from listings.recommendations import DEFAULT_K, compute_neighbors
+
+
+class Command(BaseCommand):
+    help = 'Precompute similar listings for every active listing (run nightly or hourly)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--k',
+            type=int,
+            default=DEFAULT_K,
+            help=f'Neighbors to keep per listing (default {DEFAULT_K})'
+        )
+
+    def handle(self, *args, **options):
+        processed, written = compute_neighbors(k=options['k'])
+        self.stdout.write(self.style.SUCCESS(f'✓ Stored {written} neighbors for {processed} active listings'))
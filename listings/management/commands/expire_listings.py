@@ -0,0 +1,42 @@
+"""
+Management command to expire stale listings and archive old inactive ones
+Run this with a daily cron job:
+0 3 * * * cd /path/to/credmarket && python manage.py expire_listings --archive
+"""
+from django.core.management.base import BaseCommand
+from listings.lifecycle import archive_listings, expire_listings
+
+
+class Command(BaseCommand):
+    help = 'Expire active listings past their expiry date, and optionally archive old sold/deleted/expired listings'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Listings changed per transaction (default 500)'
+        )
+        parser.add_argument(
+            '--archive',
+            action='store_true',
+            help='Also move sold/deleted/expired listings older than LISTING_ARCHIVE_AFTER_DAYS to the archive table'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report how many listings would change'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        dry_run = options['dry_run']
+        prefix = 'Would expire' if dry_run else 'Expired'
+        
+        expired = expire_listings(batch_size=batch_size, dry_run=dry_run)
+        self.stdout.write(self.style.SUCCESS(f'{prefix} {expired} listings'))
+        
+        if options['archive']:
+            archived = archive_listings(batch_size=batch_size, dry_run=dry_run)
+            prefix = 'Would archive' if dry_run else 'Archived'
+            self.stdout.write(self.style.SUCCESS(f'{prefix} {archived} listings'))
@@ -0,0 +1,390 @@
+"""
+Management command to generate a large synthetic dataset for performance work.
+Only works when DEBUG=True or PRELAUNCH_MODE=true to prevent accidental use in production.
+
+    python manage.py generate_dataset --users 10000 --listings 100000 --messages 1000000
+
+Rows are inserted with bulk_create in chunks, every user shares one password
+hash, no images are downloaded, and the same --seed always produces the same
+data. Signals don't fire for bulk inserts, so no emails are sent; the
+category and company counters are recounted at the end.
+"""
+from contextlib import contextmanager
+from datetime import timedelta
+import math
+import os
+import random
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.text import slugify
+
+from companies.counters import recount_companies
+from companies.models import Company
+from listings.category_fields import get_category_schema
+from listings.category_tree import get_category_tree, invalidate_category_tree
+from listings.counters import recount_categories
+from listings.models import Category, Listing
+from messaging.models import Conversation, Message
+
+User = get_user_model()
+
+# (city, state, weight)
+CITIES = [
+    ('Bangalore', 'Karnataka', 30), ('Hyderabad', 'Telangana', 15), ('Pune', 'Maharashtra', 12),
+    ('Mumbai', 'Maharashtra', 10), ('Chennai', 'Tamil Nadu', 10), ('Delhi', 'Delhi', 8),
+    ('Gurgaon', 'Haryana', 8), ('Noida', 'Uttar Pradesh', 7),
+]
+AREAS = ['Koramangala', 'Whitefield', 'HSR Layout', 'Indiranagar', 'Gachibowli', 'Hinjewadi',
+         'Andheri', 'Powai', 'Velachery', 'Sector 62', 'Cyber City', 'Electronic City']
+FIRST_NAMES = ['Aarav', 'Vivaan', 'Aditya', 'Ananya', 'Diya', 'Ishaan', 'Kavya', 'Priya', 'Rahul',
+               'Rohan', 'Sneha', 'Arjun', 'Meera', 'Karthik', 'Neha', 'Siddharth', 'Pooja', 'Varun']
+LAST_NAMES = ['Sharma', 'Iyer', 'Reddy', 'Patel', 'Nair', 'Gupta', 'Rao', 'Singh', 'Menon',
+              'Kulkarni', 'Das', 'Joshi', 'Chopra', 'Bhat', 'Verma', 'Pillai']
+
+# Used when the database has no categories yet: top-level category -> subcategories
+DEFAULT_CATEGORIES = {
+    'Vehicles': ['Cars', 'Bikes', 'Scooters', 'Bicycles'],
+    'Rent': ['1 BHK', '2 BHK', '3 BHK+', 'Single Room', 'PG/Hostel'],
+    'Real Estate': ['Apartments', 'Independent Houses', 'Plots/Land'],
+    'Electronics': ['Mobiles', 'Laptops', 'Cameras'],
+    'Furniture': [],
+    'Home Appliances': [],
+    'Books': [],
+}
+
+# Listing titles and price ranges by top-level category
+TITLES = {
+    'Vehicles': ['Honda City', 'Maruti Swift', 'Hyundai Creta', 'Royal Enfield Classic 350', 'Honda Activa',
+                 'Bajaj Pulsar', 'Toyota Innova', 'Tata Nexon', 'Hero Sprint cycle', 'Ather 450X'],
+    'Electronics': ['iPhone 13', 'MacBook Air M1', 'Samsung Galaxy S22', 'Dell XPS 13', 'Sony WH-1000XM4',
+                    'iPad Pro', 'OnePlus 11', 'Canon EOS 200D', 'LG 27 inch monitor', 'PS5 console'],
+    'Furniture': ['Sofa set', 'Study table', 'Queen size bed', 'Office chair', 'Bookshelf', 'Dining table'],
+    'Home Appliances': ['Washing machine', 'Refrigerator', 'Microwave oven', 'Split AC', 'Water purifier'],
+    'Books': ['GATE preparation books', 'Novel collection', 'UPSC study material', 'Programming books'],
+}
+PRICE_RANGES = {
+    'Vehicles': (3000, 1500000),
+    'Rent': (5000, 80000),
+    'Real Estate': (1500000, 30000000),
+    'Electronics': (1000, 200000),
+}
+DEFAULT_PRICE_RANGE = (200, 60000)
+NUMBER_RANGES = {
+    'year': (2008, 2024), 'km_driven': (500, 150000), 'bedrooms': (1, 5), 'bathrooms': (1, 4),
+    'deposit': (10000, 300000), 'carpet_area': (300, 3000), 'built_up_area': (600, 5000),
+    'plot_area': (600, 10000), 'plot_length': (20, 120), 'plot_width': (20, 100),
+    'total_floors': (1, 30), 'floor_number': (0, 30), 'floors': (1, 4),
+}
+
+STATUSES = [('active', 75), ('sold', 12), ('expired', 8), ('deleted', 5)]
+CONDITIONS = [('new', 10), ('like_new', 25), ('excellent', 25), ('good', 30), ('fair', 10)]
+MESSAGES = [
+    'Hi, is this still available?', 'What is your best price?', 'Can I see it this weekend?',
+    'Yes, it is available.', 'Is the price negotiable?', 'Where exactly is it?',
+    'Deal. Let us meet at the office lobby.', 'Sure, ping me on Monday.', 'Can you share more photos?',
+    'It is in very good condition.', 'Thanks!', 'I can pick it up tomorrow evening.',
+]
+MESSAGE_FIELDS = ['conversation', 'sender', 'receiver', 'content', 'is_read', 'read_at', 'email_reminder_sent', 'created_at']
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    """Let bulk_create keep the created_at/updated_at values we set instead of now()"""
+    fields = [
+        field for model in models for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def insert_rows(model, field_names, rows):
+    """
+    Plain executemany INSERT for rows whose primary keys aren't needed back.
+    Skips bulk_create's per-value field preparation, which dominates the
+    run time for millions of small rows. Datetime values must be aware.
+    """
+    fields = [model._meta.get_field(name) for name in field_names]
+    datetime_columns = [index for index, field in enumerate(fields) if field.get_internal_type() == 'DateTimeField']
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        connection.ops.quote_name(model._meta.db_table),
+        ', '.join(connection.ops.quote_name(field.column) for field in fields),
+        ', '.join(['%s'] * len(fields)),
+    )
+    adapt = connection.ops.adapt_datetimefield_value
+    params = []
+    for row in rows:
+        row = list(row)
+        for index in datetime_columns:
+            row[index] = adapt(row[index])
+        params.append(row)
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, params)
+
+
+def _chunks(total, size):
+    for start in range(0, total, size):
+        yield start, min(size, total - start)
+
+
+class Command(BaseCommand):
+    help = 'Generate a large deterministic synthetic dataset (users, listings, conversations, messages) with bulk inserts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000, help='Users to create (default 1000)')
+        parser.add_argument('--listings', type=int, default=10000, help='Listings to create (default 10000)')
+        parser.add_argument('--messages', type=int, default=50000, help='Messages to create (default 50000)')
+        parser.add_argument('--companies', type=int, default=50, help='Companies to spread users over (default 50)')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed; also tags the generated usernames')
+        parser.add_argument('--days', type=int, default=180, help='Spread listings over this many past days')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Rows per bulk insert/transaction')
+        parser.add_argument('--password', default='TestPass123!', help='Password for every generated user')
+
+    def handle(self, *args, **options):
+        # Safety check - only allow in DEBUG mode or PRELAUNCH_MODE
+        prelaunch_mode = os.getenv('PRELAUNCH_MODE', 'false').lower() == 'true'
+        if not settings.DEBUG and not prelaunch_mode:
+            raise CommandError('This command only works in DEBUG mode or when PRELAUNCH_MODE=true.')
+
+        self.rng = random.Random(options['seed'])
+        self.now = timezone.now()
+        self.chunk_size = options['chunk_size']
+        self.tag = f"gen{options['seed']}"
+        if User.objects.filter(username__startswith=f'{self.tag}_').exists():
+            raise CommandError(f'A dataset with seed {options["seed"]} already exists; use another --seed.')
+
+        started = time.perf_counter()
+        companies = self._phase('companies', self.create_companies, options['companies'])
+        categories = self._phase('categories', self.ensure_categories)
+        users = self._phase('users', self.create_users, options['users'], companies, options['password'])
+        listings = self._phase('listings', self.create_listings, options['listings'], users, categories, options['days'])
+        self._phase('messages', self.create_messages, options['messages'], listings)
+        self._phase('counters', self.recount)
+        self.stdout.write(self.style.SUCCESS(f'Dataset generated in {time.perf_counter() - started:.1f}s'))
+
+    def _phase(self, name, func, *args):
+        started = time.perf_counter()
+        result = func(*args)
+        count = len(result) if isinstance(result, (list, dict)) else result
+        self.stdout.write(f'  {name}: {count if count is not None else "done"} ({time.perf_counter() - started:.1f}s)')
+        return result
+
+    def create_companies(self, count):
+        """Companies with a long-tailed size: a few large employers, many small ones"""
+        domains = [f'company{i}.example.com' for i in range(count)]
+        Company.objects.bulk_create([
+            Company(name=f'Company {i}', domain=domain, status='approved')
+            for i, domain in enumerate(domains)
+        ], ignore_conflicts=True)
+        by_domain = Company.objects.in_bulk(domains, field_name='domain')
+        companies = [by_domain[domain] for domain in domains]
+        weights = [1 / (rank + 1) ** 0.8 for rank in range(len(companies))]
+        return list(zip(companies, weights))
+
+    def ensure_categories(self):
+        """Leaf categories with (root name, weight); creates a default tree on an empty database"""
+        if not Category.objects.exists():
+            for order, (name, children) in enumerate(DEFAULT_CATEGORIES.items()):
+                parent = Category.objects.create(name=name, slug=slugify(name), order=order)
+                for child_order, child in enumerate(children):
+                    Category.objects.create(name=child, slug=slugify(child), parent=parent, order=child_order)
+            invalidate_category_tree()
+
+        tree = get_category_tree()
+        leaves = []
+        for category in tree.by_id.values():
+            if not category.is_active or tree.subcategories(category.id):
+                continue
+            root = category
+            while root.parent is not None:
+                root = root.parent
+            leaves.append((category, root.name))
+        leaves.sort(key=lambda leaf: leaf[0].id)
+        return leaves
+
+    def create_users(self, count, companies, password):
+        if count == 0:
+            users = list(User.objects.filter(status='approved').values_list('id', 'location'))
+            if not users:
+                raise CommandError('No approved users to own listings; pass --users.')
+            return users
+
+        password_hash = make_password(password)  # hashing once per user would dominate the run
+        city_weights = [weight for _, _, weight in CITIES]
+        company_list = [company for company, _ in companies]
+        company_weights = [weight for _, weight in companies]
+        created = []
+        with explicit_timestamps(User):
+            for start, size in _chunks(count, self.chunk_size):
+                batch = []
+                for i in range(start, start + size):
+                    company = self.rng.choices(company_list, company_weights)[0]
+                    city = self.rng.choices(CITIES, city_weights)[0][0]
+                    joined = self.now - timedelta(days=self.rng.randint(0, 720))
+                    batch.append(User(
+                        username=f'{self.tag}_{i}',
+                        email=f'{self.tag}.{i}@{company.domain}',
+                        password=password_hash,
+                        first_name=self.rng.choice(FIRST_NAMES),
+                        last_name=self.rng.choice(LAST_NAMES),
+                        company=company,
+                        status='approved' if self.rng.random() < 0.95 else 'waitlist',
+                        email_verified=True,
+                        location=city,
+                        area=self.rng.choice(AREAS),
+                        notify_new_company_listings=False,
+                        notify_unread_messages=False,
+                        date_joined=joined,
+                        created_at=joined,
+                        updated_at=joined,
+                    ))
+                with transaction.atomic():
+                    User.objects.bulk_create(batch)
+                created.extend((user.id, user.location) for user in batch)
+        return created
+
+    def _attributes(self, category):
+        raw = {}
+        for field in get_category_schema(category).fields.values():
+            if field.type == 'select':
+                raw[field.name] = self.rng.choice(field.choices)
+            elif field.type == 'number':
+                low, high = NUMBER_RANGES.get(field.name, (1, 100))
+                raw[field.name] = self.rng.randint(low, high)
+            elif field.type == 'date':
+                raw[field.name] = (self.now + timedelta(days=self.rng.randint(0, 60))).date().isoformat()
+            elif field.name == 'brand':
+                raw[field.name] = self.rng.choice(['Honda', 'Maruti', 'Hyundai', 'Tata', 'Bajaj', 'TVS', 'Hero'])
+            else:
+                raw[field.name] = f'{field.label} {self.rng.randint(1, 20)}'
+        return get_category_schema(category).coerce(raw)
+
+    def _title(self, category, root_name, city):
+        if root_name in TITLES:
+            return self.rng.choice(TITLES[root_name])
+        return f'{category.name} in {self.rng.choice(AREAS)}, {city}'
+
+    def _price(self, root_name):
+        low, high = PRICE_RANGES.get(root_name, DEFAULT_PRICE_RANGE)
+        # Log-uniform: cheap items are far more common than expensive ones
+        price = math.exp(self.rng.uniform(math.log(low), math.log(high)))
+        return round(price, -2) or low
+
+    def create_listings(self, count, users, categories, days):
+        """Returns (id, seller id, status) for every listing created"""
+        # A minority of users sell most items
+        sellers = self.rng.sample(users, max(1, len(users) // 3))
+        seller_weights = [self.rng.paretovariate(1.2) for _ in sellers]
+        category_weights = [3 if root_name in ('Electronics', 'Vehicles', 'Rent') else 1 for _, root_name in categories]
+        states = {city: state for city, state, _ in CITIES}
+        statuses, status_weights = zip(*STATUSES)
+        conditions, condition_weights = zip(*CONDITIONS)
+        ttl = timedelta(days=getattr(settings, 'LISTING_TTL_DAYS', 60))
+
+        created = []
+        with explicit_timestamps(Listing):
+            for start, size in _chunks(count, self.chunk_size):
+                batch = []
+                for i in range(start, start + size):
+                    seller_id, seller_city = self.rng.choices(sellers, seller_weights)[0]
+                    category, root_name = self.rng.choices(categories, category_weights)[0]
+                    city = seller_city if seller_city in states else self.rng.choice(CITIES)[0]
+                    title = self._title(category, root_name, city)
+                    created_at = self.now - timedelta(seconds=self.rng.randint(0, days * 86400))
+                    status = self.rng.choices(statuses, status_weights)[0]
+                    batch.append(Listing(
+                        title=title,
+                        slug=f'{slugify(title)}-{self.tag}-{i}',
+                        description=f'{title} for sale. {self.rng.choice(MESSAGES)} Pickup from {city}.',
+                        category=category,
+                        seller_id=seller_id,
+                        price=self._price(root_name),
+                        is_negotiable=self.rng.random() < 0.7,
+                        condition=self.rng.choices(conditions, condition_weights)[0],
+                        location=self.rng.choice(AREAS),
+                        city=city,
+                        state=states.get(city, ''),
+                        status=status,
+                        is_featured=self.rng.random() < 0.02,
+                        attributes=self._attributes(category),
+                        views_count=int(self.rng.paretovariate(1.5) * 10),
+                        created_at=created_at,
+                        updated_at=created_at if status == 'active' else created_at + timedelta(days=self.rng.randint(1, 30)),
+                        expires_at=created_at + ttl,
+                    ))
+                with transaction.atomic():
+                    Listing.objects.bulk_create(batch)
+                created.extend((listing.id, listing.seller_id, listing.status) for listing in batch)
+        return created
+
+    def create_messages(self, count, listings):
+        """Conversations with geometric-ish lengths (mean ~8) until `count` messages exist"""
+        if count == 0 or not listings:
+            return 0
+        buyers = list(User.objects.filter(username__startswith=f'{self.tag}_').values_list('id', flat=True)) \
+            or list(User.objects.values_list('id', flat=True))
+        candidates = [listing for listing in listings if listing[2] in ('active', 'sold')] or listings
+        pairs = set()
+        written = 0
+        with explicit_timestamps(Conversation):
+            while written < count:
+                conversations = []
+                lengths = []
+                planned = written
+                while planned < count and len(conversations) < self.chunk_size // 4 + 1:
+                    listing_id, seller_id, _ = self.rng.choice(candidates)
+                    buyer_id = self.rng.choice(buyers)
+                    if buyer_id == seller_id or (listing_id, buyer_id) in pairs:
+                        if len(pairs) >= len(candidates) * len(buyers) // 2:
+                            break  # Nearly every pair is taken
+                        continue
+                    pairs.add((listing_id, buyer_id))
+                    length = min(count - planned, 1 + min(60, int(self.rng.expovariate(1 / 7))))
+                    started_at = self.now - timedelta(minutes=self.rng.randint(60, 90 * 24 * 60))
+                    conversations.append(Conversation(
+                        listing_id=listing_id, buyer_id=buyer_id, seller_id=seller_id,
+                        created_at=started_at, updated_at=started_at + timedelta(minutes=5 * length),
+                    ))
+                    lengths.append(length)
+                    planned += length
+                if not conversations:
+                    break
+
+                with transaction.atomic():
+                    Conversation.objects.bulk_create(conversations)
+                    messages = []
+                    for conversation, length in zip(conversations, lengths):
+                        at = conversation.created_at
+                        for position in range(length):
+                            from_buyer = position % 2 == 0
+                            at += timedelta(minutes=self.rng.randint(1, 10))
+                            unread = position == length - 1 and self.rng.random() < 0.3
+                            messages.append((
+                                conversation.id,
+                                conversation.buyer_id if from_buyer else conversation.seller_id,
+                                conversation.seller_id if from_buyer else conversation.buyer_id,
+                                self.rng.choice(MESSAGES),
+                                not unread,
+                                None if unread else at + timedelta(minutes=2),
+                                not unread,
+                                at,
+                            ))
+                    insert_rows(Message, MESSAGE_FIELDS, messages)
+                written = planned
+        return written
+
+    def recount(self):
+        recount_categories()
+        recount_companies()
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from companies.counters import recount_companies
+from listings.counters import recount_categories
+
+
+class Command(BaseCommand):
+    help = 'Rebuild maintained counters (category active listings, company approved employees)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--only',
+            choices=['categories', 'companies'],
+            help='Recount just one kind of counter'
+        )
+
+    def handle(self, *args, **options):
+        only = options.get('only')
+        
+        if only in (None, 'categories'):
+            with transaction.atomic():
+                fixed = recount_categories()
+            self.report('categories', fixed)
+        
+        if only in (None, 'companies'):
+            with transaction.atomic():
+                fixed = recount_companies()
+            self.report('companies', fixed)
+
+    def report(self, label, fixed):
+        if fixed:
+            self.stdout.write(self.style.WARNING(f'Corrected drifted counters on {fixed} {label}'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'All {label} counters were accurate'))
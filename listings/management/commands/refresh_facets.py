@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from listings.facets import refresh_facet_counts
+
+
+class Command(BaseCommand):
+    help = 'Rebuild precomputed facet counts for category pages (run periodically, e.g. every 15 minutes)'
+
+    def handle(self, *args, **options):
+        written = refresh_facet_counts()
+        self.stdout.write(self.style.SUCCESS(f'✓ Wrote {written} facet counts'))
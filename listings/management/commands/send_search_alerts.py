@@ -0,0 +1,23 @@
+"""
+Management command to email users about new listings matching their saved searches
+Run this with a cron job every 15 minutes:
+*/15 * * * * cd /path/to/credmarket && python manage.py send_search_alerts
+"""
+from django.core.management.base import BaseCommand
+from listings.saved_searches import run_alerts
+
+
+class Command(BaseCommand):
+    help = 'Match listings created since the last run against saved searches and send batched alerts'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Listings matched per batch (default 1000)'
+        )
+
+    def handle(self, *args, **options):
+        processed, sent = run_alerts(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Processed {processed} new listings, sent {sent} alert emails'))
@@ -0,0 +1,40 @@
+# Generated by Django 5.0.1 on 2026-10-19 05:42
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_active_listing_count(apps, schema_editor):
+    Category = apps.get_model('listings', 'Category')
+    Listing = apps.get_model('listings', 'Listing')
+    parents = dict(Category.objects.values_list('id', 'parent_id'))
+    direct = (
+        Listing.objects.filter(status='active')
+        .values_list('category_id')
+        .annotate(count=Count('id'))
+        .order_by()
+    )
+    # Each category counts its own listings plus those of its subcategories
+    totals = {}
+    for category_id, count in direct:
+        while category_id is not None:
+            totals[category_id] = totals.get(category_id, 0) + count
+            category_id = parents.get(category_id)
+    for category_id, total in totals.items():
+        Category.objects.filter(id=category_id).update(active_listing_count=total)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0005_add_performance_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='active_listing_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='active listings'),
+        ),
+        migrations.RunPython(backfill_active_listing_count, migrations.RunPython.noop),
+    ]
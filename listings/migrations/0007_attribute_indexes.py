@@ -0,0 +1,70 @@
+# Generated by Django 5.0.1 on 2026-10-19 05:51
+
+import django.db.models.fields.json
+from django.conf import settings
+from django.db import migrations, models
+
+
+GIN_INDEX_NAME = 'listing_attributes_gin_idx'
+
+
+def create_gin_index(apps, schema_editor):
+    # jsonb containment index for ad-hoc attribute filters; Postgres only
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS {GIN_INDEX_NAME} '
+        'ON listings_listing USING gin (attributes jsonb_path_ops)'
+    )
+
+
+def drop_gin_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'DROP INDEX IF EXISTS {GIN_INDEX_NAME}')
+
+
+def coerce_existing_attributes(apps, schema_editor):
+    # Rewrite string numbers etc. as typed values so the new indexes are usable
+    from listings.category_fields import SCHEMAS
+    
+    Listing = apps.get_model('listings', 'Listing')
+    changed = []
+    for listing in Listing.objects.exclude(attributes={}).select_related('category').iterator():
+        schema = SCHEMAS.get(listing.category.name)
+        if schema is None or not isinstance(listing.attributes, dict):
+            continue
+        attributes = schema.coerce(listing.attributes)
+        if attributes != listing.attributes:
+            listing.attributes = attributes
+            changed.append(listing)
+    Listing.objects.bulk_update(changed, ['attributes'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0006_category_active_listing_count'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(django.db.models.fields.json.KeyTransform('year', 'attributes'), name='listing_attr_year_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(django.db.models.fields.json.KeyTransform('km_driven', 'attributes'), name='listing_attr_km_driven_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(django.db.models.fields.json.KeyTransform('bedrooms', 'attributes'), name='listing_attr_bedrooms_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(django.db.models.fields.json.KeyTransform('brand', 'attributes'), name='listing_attr_brand_idx'),
+        ),
+        migrations.RunPython(coerce_existing_attributes, migrations.RunPython.noop),
+        migrations.RunPython(create_gin_index, drop_gin_index),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.0.1 on 2026-10-19 05:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0007_attribute_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryFacetCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('city', models.CharField(blank=True, help_text='Lowercased city, blank for all cities', max_length=100)),
+                ('attribute', models.CharField(max_length=50)),
+                ('value', models.CharField(max_length=200)),
+                ('count', models.IntegerField(default=0)),
+                ('refreshed_at', models.DateTimeField(auto_now=True)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='facet_counts', to='listings.category')),
+            ],
+            options={
+                'verbose_name': 'Category Facet Count',
+                'verbose_name_plural': 'Category Facet Counts',
+                'unique_together': {('category', 'city', 'attribute', 'value')},
+            },
+        ),
+    ]
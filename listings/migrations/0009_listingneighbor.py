@@ -0,0 +1,30 @@
+# Generated by Django 5.0.1 on 2026-10-19 05:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0008_categoryfacetcount'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ListingNeighbor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField()),
+                ('listing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbors', to='listings.listing')),
+                ('neighbor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbor_of', to='listings.listing')),
+            ],
+            options={
+                'verbose_name': 'Listing Neighbor',
+                'verbose_name_plural': 'Listing Neighbors',
+                'ordering': ['listing', 'rank'],
+                'unique_together': {('listing', 'rank')},
+            },
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.0.1 on 2026-10-19 06:04
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0010_savedsearch'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedListing',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('original_id', models.BigIntegerField(unique=True)),
+                ('title', models.CharField(max_length=200)),
+                ('slug', models.SlugField(blank=True, max_length=250)),
+                ('description', models.TextField()),
+                ('category_id', models.BigIntegerField(null=True)),
+                ('seller_id', models.BigIntegerField(db_index=True, null=True)),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('condition', models.CharField(max_length=20)),
+                ('location', models.CharField(max_length=100)),
+                ('city', models.CharField(max_length=100)),
+                ('state', models.CharField(max_length=100)),
+                ('status', models.CharField(max_length=20)),
+                ('attributes', models.JSONField(blank=True, default=dict)),
+                ('image_paths', models.JSONField(blank=True, default=list, help_text='Image files are left in storage')),
+                ('views_count', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('expires_at', models.DateTimeField(blank=True, null=True)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Archived Listing',
+                'verbose_name_plural': 'Archived Listings',
+                'ordering': ['-archived_at'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['status', 'expires_at'], name='listings_li_status_e126ae_idx'),
+        ),
+    ]
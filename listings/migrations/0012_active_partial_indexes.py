@@ -0,0 +1,55 @@
+# Generated by Django 5.0.1 on 2026-10-19 06:07
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0011_listing_expiry_archive'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='listing',
+            name='listings_li_status_f5055b_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='listing',
+            name='listings_li_categor_fcaf14_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='listing',
+            name='listings_li_city_3083b5_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='listing',
+            name='listings_li_is_feat_8b62c6_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='listing',
+            name='listings_li_status_e126ae_idx',
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(('status', 'active')), fields=['-created_at'], name='listing_active_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(('status', 'active')), fields=['category', '-created_at'], name='listing_active_category_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(('status', 'active')), fields=['city', '-created_at'], name='listing_active_city_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(('is_featured', True), ('status', 'active')), fields=['-created_at'], name='listing_active_featured_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(('status', 'active')), fields=['expires_at'], name='listing_active_expiry_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.0.1 on 2026-10-19 07:33
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0013_listing_updated_index'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='listing',
+            name='listing_active_city_idx',
+        ),
+    ]
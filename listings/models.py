@@ -1,4 +1,6 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Q
+from django.db.models.fields.json import KeyTransform
 from django.utils.text import slugify
 import json
 import bleach
@@ -23,6 +25,9 @@ class Category(models.Model):
     is_active = models.BooleanField(default=True)
     order = models.IntegerField(default=0, help_text='Display order')
     
+    # Maintained by listings.counters; includes listings in subcategories
+    active_listing_count = models.IntegerField('active listings', default=0, editable=False)
+    
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
@@ -38,10 +43,17 @@ class Category(models.Model):
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.name)
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            # Never write back a possibly stale counter from this instance
+            skip = self.get_deferred_fields() | {'active_listing_count'}
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.attname not in skip and field.name not in skip
+            ]
         super().save(*args, **kwargs)
     
     def listing_count(self):
-        """Get number of active listings in this category"""
+        """Get number of active listings in this category (live query, excludes subcategories)"""
         return self.listings.filter(status='active').count()
 
 
@@ -123,16 +135,31 @@ class Listing(models.Model):
         ordering = ['-created_at']
         indexes = [
             models.Index(fields=['-created_at']),
-            models.Index(fields=['status', '-created_at']),
-            models.Index(fields=['category', 'status']),
             models.Index(fields=['seller', 'status']),  # For user's own listings
-            models.Index(fields=['city', 'status']),  # For location-based queries
-            models.Index(fields=['is_featured', 'status']),  # For featured listings
+            # Browse pages only read active listings, so index just those rows
+            models.Index(fields=['-created_at'], condition=Q(status='active'), name='listing_active_recent_idx'),
+            models.Index(fields=['category', '-created_at'], condition=Q(status='active'), name='listing_active_category_idx'),
+            models.Index(fields=['-created_at'], condition=Q(status='active', is_featured=True), name='listing_active_featured_idx'),
+            models.Index(fields=['expires_at'], condition=Q(status='active'), name='listing_active_expiry_idx'),  # For the expiry job
+            models.Index(fields=['updated_at'], name='listing_updated_idx'),  # Newest change, for page ETags
+            # Frequently filtered category attributes (see category_fields.INDEXED_ATTRIBUTES)
+            models.Index(KeyTransform('year', 'attributes'), name='listing_attr_year_idx'),
+            models.Index(KeyTransform('km_driven', 'attributes'), name='listing_attr_km_driven_idx'),
+            models.Index(KeyTransform('bedrooms', 'attributes'), name='listing_attr_bedrooms_idx'),
+            models.Index(KeyTransform('brand', 'attributes'), name='listing_attr_brand_idx'),
         ]
     
     def __str__(self):
         return f"{self.title} - ₹{self.price}"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember loaded values so category counters can be adjusted on save
+        instance._loaded_status = instance.__dict__.get('status')
+        instance._loaded_category_id = instance.__dict__.get('category_id')
+        return instance
+    
     def save(self, *args, **kwargs):
         # Sanitize user input to prevent XSS attacks
         if self.title:
@@ -143,7 +170,30 @@ class Listing(models.Model):
         if not self.slug:
             import uuid
             self.slug = slugify(self.title) + '-' + str(uuid.uuid4())[:8]
-        super().save(*args, **kwargs)
+        
+        if self._state.adding and self.expires_at is None:
+            from datetime import timedelta
+            from django.conf import settings
+            from django.utils import timezone
+            self.expires_at = timezone.now() + timedelta(days=getattr(settings, 'LISTING_TTL_DAYS', 60))
+        
+        from .counters import COUNTED_FIELDS, sync_listing_counters, touch_categories
+        update_fields = kwargs.get('update_fields')
+        
+        if isinstance(self.attributes, dict) and self.attributes and (update_fields is None or 'attributes' in update_fields):
+            # Store typed values (numbers as numbers) so attribute indexes and range filters work
+            from .category_fields import get_category_schema
+            self.attributes = get_category_schema(self.category_id).coerce(self.attributes)
+        if update_fields is not None and not COUNTED_FIELDS.intersection(update_fields):
+            super().save(*args, **kwargs)
+            if set(update_fields) - {'views_count'}:  # view counts aren't part of page ETags
+                touch_categories([self.category_id])
+            return
+        
+        # Status or category may have changed: move the counters with the row
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            sync_listing_counters(self)
     
     def get_primary_image(self):
         """Get the first image as primary"""
@@ -239,3 +289,131 @@ class ListingReport(models.Model):
     def get_report_count(self):
         """Get total reports for this listing"""
         return ListingReport.objects.filter(listing=self.listing).count()
+
+
+class CategoryFacetCount(models.Model):
+    """
+    Precomputed number of active listings per attribute value, by category and city.
+    Rebuilt by `manage.py refresh_facets`; city '' holds the all-cities totals.
+    """
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='facet_counts')
+    city = models.CharField(max_length=100, blank=True, help_text='Lowercased city, blank for all cities')
+    attribute = models.CharField(max_length=50)
+    value = models.CharField(max_length=200)
+    count = models.IntegerField(default=0)
+    refreshed_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Category Facet Count'
+        verbose_name_plural = 'Category Facet Counts'
+        unique_together = ['category', 'city', 'attribute', 'value']
+    
+    def __str__(self):
+        return f"{self.category.name} / {self.city or 'all'}: {self.attribute}={self.value} ({self.count})"
+
+
+class ListingNeighbor(models.Model):
+    """
+    Precomputed "similar listings" for a listing, best first.
+    Rebuilt by `manage.py compute_related_listings`.
+    """
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='neighbors')
+    neighbor = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='neighbor_of')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+    
+    class Meta:
+        verbose_name = 'Listing Neighbor'
+        verbose_name_plural = 'Listing Neighbors'
+        ordering = ['listing', 'rank']
+        unique_together = ['listing', 'rank']
+    
+    def __str__(self):
+        return f"{self.listing_id} -> {self.neighbor_id} (#{self.rank}, {self.score:.2f})"
+
+
+class SavedSearch(models.Model):
+    """A listing_list search a user wants alerts for"""
+    
+    user = models.ForeignKey('accounts.User', on_delete=models.CASCADE, related_name='saved_searches')
+    name = models.CharField(max_length=100, blank=True)
+    query = models.CharField(max_length=200, blank=True, help_text='Normalized search text')
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, null=True, blank=True, related_name='saved_searches')
+    city = models.CharField(max_length=100, blank=True, help_text='Lowercased city')
+    min_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    max_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    condition = models.CharField(max_length=20, blank=True)
+    is_active = models.BooleanField(default=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_alerted_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        verbose_name = 'Saved Search'
+        verbose_name_plural = 'Saved Searches'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.user.email}: {self.describe()}"
+    
+    def describe(self):
+        """Short human-readable summary of the search"""
+        if self.name:
+            return self.name
+        parts = []
+        if self.query:
+            parts.append(f'"{self.query}"')
+        if self.category_id:
+            parts.append(self.category.name)
+        if self.city:
+            parts.append(f"in {self.city.title()}")
+        if self.min_price is not None or self.max_price is not None:
+            parts.append(f"₹{self.min_price or 0:,.0f}–{'' if self.max_price is None else f'{self.max_price:,.0f}'}")
+        return ' '.join(parts) or 'All listings'
+
+
+class SavedSearchAlertState(models.Model):
+    """Single-row watermark: the last listing id the alert engine has processed"""
+    last_listing_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"Alerts processed up to listing {self.last_listing_id}"
+
+
+class ArchivedListing(models.Model):
+    """
+    Sold, deleted or expired listings moved out of the hot Listing table by
+    `manage.py expire_listings --archive`. Ids are kept but not foreign keys,
+    so archiving never blocks on (or cascades to) other tables.
+    """
+    original_id = models.BigIntegerField(unique=True)
+    title = models.CharField(max_length=200)
+    slug = models.SlugField(max_length=250, blank=True)
+    description = models.TextField()
+    category_id = models.BigIntegerField(null=True)
+    seller_id = models.BigIntegerField(null=True, db_index=True)
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    condition = models.CharField(max_length=20)
+    location = models.CharField(max_length=100)
+    city = models.CharField(max_length=100)
+    state = models.CharField(max_length=100)
+    status = models.CharField(max_length=20)
+    attributes = models.JSONField(default=dict, blank=True)
+    image_paths = models.JSONField(default=list, blank=True, help_text='Image files are left in storage')
+    views_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    expires_at = models.DateTimeField(null=True, blank=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = 'Archived Listing'
+        verbose_name_plural = 'Archived Listings'
+        ordering = ['-archived_at']
+    
+    def __str__(self):
+        return f"{self.title} ({self.status}, archived)"
@@ -0,0 +1,165 @@
+"""
+Related-listings recommender.
+
+compute_neighbors() scores every active listing against candidates from the
+same top-level category and stores the top K in ListingNeighbor, so
+listing_detail can fetch related items with one join. Candidates are the
+listings closest in price within the same category plus listings sharing a
+title word (via an inverted index), which keeps the batch job well below
+all-pairs. Listings created since the last run fall back to "newest in the
+same category".
+"""
+import heapq
+import math
+import re
+from collections import defaultdict
+
+from django.db import transaction
+
+from .category_tree import get_category_tree
+from .counters import touch_categories
+from .models import Listing, ListingNeighbor
+
+DEFAULT_K = 8
+
+# Score weights
+SAME_CATEGORY = 1.0
+SIBLING_CATEGORY = 0.4
+PRICE = 1.0
+SAME_CITY = 0.75
+TITLE = 1.5
+
+# Same-category candidates are the listings nearest in price on each side
+PRICE_WINDOW = 50
+# Title words shared by more listings than this are too common to be useful
+MAX_TOKEN_POSTINGS = 300
+
+STOP_WORDS = {
+    'and', 'for', 'the', 'with', 'sale', 'good', 'new', 'used', 'old', 'in',
+    'of', 'to', 'a', 'an', 'condition', 'like', 'urgent', 'selling',
+}
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+
+def title_tokens(title):
+    return frozenset(
+        token for token in TOKEN_RE.findall((title or '').lower())
+        if len(token) > 1 and token not in STOP_WORDS
+    )
+
+
+class _Item:
+    __slots__ = ('id', 'category_id', 'root_id', 'price', 'city', 'tokens')
+
+    def __init__(self, row, root_id):
+        listing_id, category_id, price, city, title = row
+        self.id = listing_id
+        self.category_id = category_id
+        self.root_id = root_id
+        self.price = float(price or 0)
+        self.city = (city or '').strip().lower()
+        self.tokens = title_tokens(title)
+
+
+def similarity(a, b):
+    """Score how related listing b is to listing a"""
+    score = SAME_CATEGORY if a.category_id == b.category_id else SIBLING_CATEGORY
+
+    if a.price > 0 and b.price > 0:
+        # 1.0 for equal prices, 0 once one is 4x the other
+        score += PRICE * max(0.0, 1 - abs(math.log(a.price / b.price)) / math.log(4))
+
+    if a.city and a.city == b.city:
+        score += SAME_CITY
+
+    if a.tokens and b.tokens:
+        score += TITLE * len(a.tokens & b.tokens) / len(a.tokens | b.tokens)
+    return score
+
+
+def _root_of(tree, category_id):
+    category = tree.by_id.get(category_id)
+    while category is not None and category.parent_id is not None:
+        category = tree.by_id.get(category.parent_id)
+    return category.id if category is not None else category_id
+
+
+def compute_neighbors(k=DEFAULT_K, chunk_size=500):
+    """
+    Rebuild ListingNeighbor for all active listings.
+    Returns (listings processed, neighbor rows written).
+    """
+    tree = get_category_tree()
+    rows = Listing.objects.filter(status='active').values_list('id', 'category_id', 'price', 'city', 'title')
+    items = [_Item(row, _root_of(tree, row[1])) for row in rows.iterator(chunk_size=2000)]
+
+    by_category = defaultdict(list)
+    postings = defaultdict(list)
+    for item in items:
+        by_category[item.category_id].append(item)
+        for token in item.tokens:
+            postings[(item.root_id, token)].append(item)
+
+    price_position = {}
+    for group in by_category.values():
+        group.sort(key=lambda item: item.price)
+        for position, item in enumerate(group):
+            price_position[item.id] = position
+
+    processed = written = 0
+    for start in range(0, len(items), chunk_size):
+        chunk = items[start:start + chunk_size]
+        neighbors = []
+        for item in chunk:
+            group = by_category[item.category_id]
+            position = price_position[item.id]
+            candidates = {
+                candidate.id: candidate
+                for candidate in group[max(0, position - PRICE_WINDOW):position + PRICE_WINDOW + 1]
+            }
+            for token in item.tokens:
+                posting = postings[(item.root_id, token)]
+                if len(posting) <= MAX_TOKEN_POSTINGS:
+                    candidates.update((candidate.id, candidate) for candidate in posting)
+            candidates.pop(item.id, None)
+
+            best = heapq.nlargest(k, candidates.values(), key=lambda candidate: similarity(item, candidate))
+            for rank, candidate in enumerate(best):
+                neighbors.append(ListingNeighbor(
+                    listing_id=item.id, neighbor_id=candidate.id, rank=rank,
+                    score=round(similarity(item, candidate), 4),
+                ))
+
+        with transaction.atomic():
+            ListingNeighbor.objects.filter(listing_id__in=[item.id for item in chunk]).delete()
+            ListingNeighbor.objects.bulk_create(neighbors, batch_size=1000)
+        processed += len(chunk)
+        written += len(neighbors)
+
+    # Listings that are no longer active don't need neighbor lists
+    ListingNeighbor.objects.exclude(listing__status='active').delete()
+    # Related listings changed on every detail page
+    touch_categories(tree.by_id)
+    return processed, written
+
+
+def related_listings(listing, limit=4):
+    """
+    Related active listings for a detail page: the precomputed neighbors in
+    one query, topped up with the newest listings in the same category when
+    the listing is newer than the last batch run (or neighbors went inactive).
+    """
+    related = list(
+        Listing.objects.filter(neighbor_of__listing_id=listing.id, status='active')
+        .order_by('neighbor_of__rank')
+        .prefetch_related('images')[:limit]
+    )
+    if len(related) < limit:
+        exclude_ids = [listing.id] + [item.id for item in related]
+        related += list(
+            Listing.objects.filter(category_id=listing.category_id, status='active')
+            .exclude(id__in=exclude_ids)
+            .order_by('-created_at')
+            .prefetch_related('images')[:limit - len(related)]
+        )
+    return related
@@ -0,0 +1,234 @@
+"""
+Saved searches and the batched alert engine.
+
+Every run takes the active listings created since the watermark (the last
+processed listing id), matches them against all saved searches at once and
+sends each user one email with everything new for them.
+
+Searches match exactly as listing_list filters: the query is a
+case-insensitive substring of the title or the description, the city a
+case-insensitive substring of the listing's city, a category includes its
+subcategories. Instead of running each saved search as its own query,
+searches are indexed by a single anchor key, a three-letter slice of their
+query, else their category, else a slice of their city, else "everything".
+Each new listing only looks up the keys it could satisfy (the three-letter
+slices of its text and city, its category and parents). The few candidates
+found are then checked against the full search.
+
+The watermark only moves past a batch once its emails have been handed to
+the mail server; if sending fails the run stops and the next run retries the
+batch (so a user can occasionally get the same alert twice, but never lose
+one).
+"""
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.http import QueryDict
+from django.utils import timezone
+from datetime import timedelta
+
+from analytics.search_log import normalize_query
+from .category_tree import get_category_tree
+from .models import Listing, SavedSearch, SavedSearchAlertState
+import logging
+
+logger = logging.getLogger(__name__)
+
+MAX_LISTINGS_PER_EMAIL = 20
+
+# Only listings at least this old are processed, so a listing whose insert
+# commits after a higher id's can't slip behind the watermark
+SETTLE_SECONDS = 60
+
+
+def trigrams(text):
+    """Every three-character slice of text, lowercased"""
+    text = (text or '').lower()
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _anchor(text):
+    # Any slice works, since a match contains them all; take one from the longest word
+    return max(text.split(), key=len)[:3]
+
+
+def _decimal(value):
+    try:
+        return Decimal(value) if value not in (None, '') else None
+    except InvalidOperation:
+        return None
+
+
+def saved_search_from_params(user, params):
+    """Build an unsaved SavedSearch from listing_list query parameters"""
+    category = get_category_tree().get(params.get('category'))
+    return SavedSearch(
+        user=user,
+        query=normalize_query(params.get('q', '')),
+        category_id=category.id if category else None,
+        city=(params.get('city') or '').strip().lower()[:100],
+        min_price=_decimal(params.get('min_price')),
+        max_price=_decimal(params.get('max_price')),
+        condition=(params.get('condition') or '')[:20],
+    )
+
+
+def saved_search_from_querystring(user, querystring):
+    return saved_search_from_params(user, QueryDict(querystring or ''))
+
+
+class SearchIndex:
+    """Inverted index of active saved searches by anchor key"""
+
+    def __init__(self, searches):
+        self.postings = defaultdict(list)
+        for search in searches:
+            if len(search.query) >= 3 and len(_anchor(search.query)) == 3:
+                key = ('q', _anchor(search.query))
+            elif search.category_id:
+                key = ('category', search.category_id)
+            elif len(search.city) >= 3:
+                key = ('city', search.city[:3])
+            else:
+                key = ('all',)
+            self.postings[key].append(search)
+
+    def candidates(self, listing, ancestor_ids):
+        keys = [('all',)]
+        keys += [('city', gram) for gram in trigrams(listing.city)]
+        keys += [('category', category_id) for category_id in ancestor_ids]
+        keys += [('q', gram) for gram in trigrams(listing.title) | trigrams(listing.description)]
+        for key in keys:
+            yield from self.postings.get(key, ())
+
+    def matches(self, search, listing, ancestor_ids):
+        if search.user_id == listing.seller_id:
+            return False
+        if search.query and search.query not in (listing.title or '').lower() and search.query not in (listing.description or '').lower():
+            return False
+        if search.category_id and search.category_id not in ancestor_ids:
+            return False
+        if search.city and search.city not in (listing.city or '').lower():
+            return False
+        if search.min_price is not None and listing.price < search.min_price:
+            return False
+        if search.max_price is not None and listing.price > search.max_price:
+            return False
+        if search.condition and search.condition != listing.condition:
+            return False
+        return True
+
+
+def match_listings(listings, searches):
+    """Map user id -> list of (saved search, listing) for every match"""
+    tree = get_category_tree()
+    index = SearchIndex(searches)
+    matches = defaultdict(list)
+    for listing in listings:
+        ancestor_ids = set()
+        category = tree.by_id.get(listing.category_id)
+        while category is not None and category.id not in ancestor_ids:
+            ancestor_ids.add(category.id)
+            category = tree.by_id.get(category.parent_id)
+
+        seen = set()
+        for search in index.candidates(listing, ancestor_ids):
+            if search.id in seen or not index.matches(search, listing, ancestor_ids):
+                continue
+            seen.add(search.id)
+            matches[search.user_id].append((search, listing))
+    return matches
+
+
+def build_alert_email(user, matched):
+    """One email listing every new match for a user"""
+    listings = []
+    seen = set()
+    for search, listing in matched:
+        if listing.id not in seen:
+            seen.add(listing.id)
+            listings.append((search, listing))
+    shown = listings[:MAX_LISTINGS_PER_EMAIL]
+
+    subject = f"{len(listings)} new listing{'s' if len(listings) != 1 else ''} matching your saved searches"
+    lines = [
+        f"- {listing.title} (₹{listing.price:,.2f}, {listing.city}) for \"{search.describe()}\"\n"
+        f"  {settings.SITE_URL}/listings/{listing.slug}/"
+        for search, listing in shown
+    ]
+    if len(listings) > len(shown):
+        lines.append(f"...and {len(listings) - len(shown)} more on {settings.SITE_URL}/listings/")
+    message = f"""Hi {user.first_name},
+
+New items matching your saved searches on CredMarket:
+
+{chr(10).join(lines)}
+
+---
+Manage your saved searches: {settings.SITE_URL}/saved-searches/
+"""
+    return EmailMultiAlternatives(
+        subject=subject,
+        body=message,
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[user.personal_email or user.email],
+    )
+
+
+def run_alerts(batch_size=1000):
+    """
+    Process listings created since the watermark in batches of batch_size.
+    On the very first run the watermark starts at the newest listing, so old
+    listings aren't announced. Returns (listings processed, emails sent).
+    """
+    state = SavedSearchAlertState.objects.first()
+    if state is None:
+        newest = Listing.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        SavedSearchAlertState.objects.create(last_listing_id=newest)
+        return 0, 0
+
+    searches = list(
+        SavedSearch.objects.filter(is_active=True, user__is_active=True, user__status='approved')
+        .select_related('user', 'category')
+    )
+    users = {search.user_id: search.user for search in searches}
+    settled = timezone.now() - timedelta(seconds=SETTLE_SECONDS)
+    processed = sent = 0
+    connection = get_connection(timeout=10)
+
+    while True:
+        batch = list(
+            Listing.objects.filter(id__gt=state.last_listing_id, created_at__lte=settled)
+            .order_by('id')
+            .only('id', 'title', 'description', 'slug', 'price', 'city', 'condition', 'status', 'category_id', 'seller_id')[:batch_size]
+        )
+        if not batch:
+            break
+
+        active = [listing for listing in batch if listing.status == 'active']
+        matches = match_listings(active, searches) if searches else {}
+        emails = [build_alert_email(users[user_id], matched) for user_id, matched in matches.items()]
+        if emails:
+            # One SMTP connection for the whole batch; keep the watermark if it fails
+            try:
+                sent += connection.send_messages(emails) or 0
+            except Exception as e:
+                logger.error("Saved-search alerts: sending %s emails failed, will retry: %s", len(emails), e)
+                break
+
+        with transaction.atomic():
+            alerted = {search.id for matched in matches.values() for search, _ in matched}
+            if alerted:
+                SavedSearch.objects.filter(id__in=alerted).update(last_alerted_at=timezone.now())
+            state.last_listing_id = batch[-1].id
+            state.save(update_fields=['last_listing_id', 'updated_at'])
+
+        processed += len(batch)
+        if len(batch) < batch_size:
+            break
+
+    logger.info("Saved-search alerts: processed %s listings, sent %s emails", processed, sent)
+    return processed, sent
@@ -1,13 +1,40 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.core.mail import send_mail
 from django.conf import settings
-from .models import Listing
+from django.utils import timezone
+from .models import Category, Listing, ListingImage
+from .category_tree import invalidate_category_tree
+from credmarket.background import enqueue
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def refresh_category_tree(sender, instance, **kwargs):
+    """Make every process reload its cached category tree"""
+    invalidate_category_tree()
+
+
+@receiver(post_delete, sender=Listing)
+def release_category_counter(sender, instance, **kwargs):
+    """Deleting an active listing (directly or by cascade) frees its slot in the counters"""
+    from .counters import sync_listing_counters
+    sync_listing_counters(instance, deleted=True)
+
+
+@receiver(post_save, sender=ListingImage)
+@receiver(post_delete, sender=ListingImage)
+def touch_listing(sender, instance, **kwargs):
+    """Bump the listing's updated_at so its cached card (keyed on it) is rendered again"""
+    from .counters import touch_categories
+    listing = Listing.objects.filter(pk=instance.listing_id)
+    listing.update(updated_at=timezone.now())
+    touch_categories(listing.values_list('category_id', flat=True))
+
+
 @receiver(post_save, sender=Listing)
 def notify_company_members_new_listing(sender, instance, created, **kwargs):
     """
@@ -33,7 +60,7 @@ def notify_company_members_new_listing(sender, instance, created, **kwargs):
     ).exclude(id=instance.seller.id)
     
     if not users_to_notify.exists():
-        logger.info(f"No users to notify for new listing: {instance.title}")
+        logger.info("No users to notify for new listing: %s", instance.title)
         return
     
     # Email content
@@ -124,8 +151,6 @@ To stop receiving these notifications, update your preferences in your profile s
     """
     
     # Send to each user's personal email (async to avoid blocking)
-    import threading
-    
     def _send_notifications():
         for user in users_to_notify:
             try:
@@ -138,9 +163,9 @@ To stop receiving these notifications, update your preferences in your profile s
                     fail_silently=True,
                     timeout=10,
                 )
-                logger.info(f"Sent new listing notification to {user.personal_email} for listing: {instance.title}")
+                logger.info("Sent new listing notification to %s for listing: %s", user.personal_email, instance.title)
             except Exception as e:
-                logger.error(f"Failed to send new listing notification to {user.personal_email}: {str(e)}")
+                logger.error("Failed to send new listing notification to %s: %s", user.personal_email, e)
     
-    # Run in background thread
-    threading.Thread(target=_send_notifications, daemon=True).start()
+    # Run on the background worker
+    enqueue(_send_notifications)
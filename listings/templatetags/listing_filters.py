@@ -6,3 +6,9 @@ register = template.Library()
 def replace_with_space(value):
     """Replace underscores with spaces for better readability"""
     return value.replace('_', ' ')
+
+
+@register.filter
+def get_item(mapping, key):
+    """Look a key up in a dict: {{ counts|get_item:category.id }}"""
+    return mapping.get(key) if mapping else None
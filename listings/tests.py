@@ -1,10 +1,13 @@
 """
 Tests for the listings app.
 """
-from django.test import TestCase, Client
+import shutil
+import tempfile
+
+from django.test import TestCase, Client, override_settings
 from django.urls import reverse
 from django.contrib.auth import get_user_model
-from listings.models import Category, Listing
+from listings.models import Category, Listing, ListingReport, SavedSearch
 from companies.models import Company
 
 User = get_user_model()
@@ -612,11 +615,873 @@ class DatabaseIndexTests(TestCase):
             if hasattr(index, 'fields'):
                 index_fields.extend(index.fields)
         
-        # Should include seller, city, is_featured in indexes
+        # Should include seller, is_featured in indexes (city is matched with
+        # icontains, which no B-tree index can serve, so it has none)
         self.assertTrue(any('seller' in str(field) for field in index_fields),
                       "Should have index on seller field")
-        self.assertTrue(any('city' in str(field) for field in index_fields),
-                      "Should have index on city field")
-        self.assertTrue(any('is_featured' in str(field) for field in index_fields),
+        # Featured listings use a partial index conditioned on is_featured
+        index_conditions = [str(index.condition) for index in Listing._meta.indexes if index.condition]
+        self.assertTrue(any('is_featured' in condition for condition in index_conditions),
                       "Should have index on is_featured field")
 
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class AdminChangelistQueryTests(TestCase):
+    """Tests that listing admin changelists don't query per row."""
+    
+    def setUp(self):
+        """Set up an admin and a parent category."""
+        self.admin = User.objects.create_superuser(username='admin', email='admin@testcorp.com', password='AdminPass123!')
+        self.client.force_login(self.admin)
+        self.parent = Category.objects.create(name="Vehicles", slug="vehicles")
+    
+    def _queries(self, url):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+    
+    def _add_rows(self, count, offset=0):
+        for i in range(offset, offset + count):
+            category = Category.objects.create(name=f"Sub {i}", slug=f"sub-{i}", parent=self.parent)
+            listing = Listing.objects.create(
+                seller=self.admin, title=f"Item {i}", description="d", category=category,
+                price=10, condition='good', location='L', city='Pune', state='MH'
+            )
+            ListingReport.objects.create(listing=listing, reporter=self.admin, reason='spam', description='x')
+    
+    def test_category_changelist_query_count_is_constant(self):
+        """Test that listing counts come from the maintained counter."""
+        url = reverse('admin:listings_category_changelist')
+        self._add_rows(2)
+        baseline = self._queries(url)
+        self._add_rows(20, offset=2)
+        self.assertEqual(self._queries(url), baseline)
+    
+    def test_report_changelist_query_count_is_constant(self):
+        """Test that report counts and reporter/listing come from the same query."""
+        url = reverse('admin:listings_listingreport_changelist')
+        self._add_rows(2)
+        baseline = self._queries(url)
+        self._add_rows(20, offset=2)
+        self.assertEqual(self._queries(url), baseline)
+    
+    def test_listing_changelist_query_count_is_constant(self):
+        """Test that seller and category are selected with the listings."""
+        url = reverse('admin:listings_listing_changelist')
+        self._add_rows(2)
+        baseline = self._queries(url)
+        self._add_rows(20, offset=2)
+        self.assertEqual(self._queries(url), baseline)
+    
+    def test_bulk_actions_touch_updated_at(self):
+        """Test that admin bulk actions bump updated_at, which page ETags are built from."""
+        from datetime import timedelta
+        from django.utils import timezone
+        
+        self._add_rows(1)
+        listing = Listing.objects.get()
+        long_ago = timezone.now() - timedelta(days=1)
+        for action in ('mark_as_sold', 'mark_as_active', 'feature_listings'):
+            Listing.objects.update(updated_at=long_ago)
+            self.client.post(reverse('admin:listings_listing_changelist'), {
+                'action': action, '_selected_action': [listing.pk],
+            })
+            listing.refresh_from_db()
+            self.assertGreater(listing.updated_at, long_ago, action)
+
+
+class CategoryCounterTests(TestCase):
+    """Tests for the maintained Category.active_listing_count."""
+    
+    def setUp(self):
+        """Set up a parent category with two subcategories."""
+        self.user = User.objects.create_user(username='seller', email='seller@testcorp.com', password='x')
+        self.parent = Category.objects.create(name="Vehicles", slug="vehicles")
+        self.cars = Category.objects.create(name="Cars", slug="cars", parent=self.parent)
+        self.bikes = Category.objects.create(name="Bikes", slug="bikes", parent=self.parent)
+    
+    def _listing(self, category, status='active'):
+        return Listing.objects.create(
+            seller=self.user, title="Item", description="d", category=category, status=status,
+            price=10, condition='good', location='L', city='Pune', state='MH'
+        )
+    
+    def _counts(self):
+        return dict(Category.objects.values_list('slug', 'active_listing_count'))
+    
+    def test_counts_include_subcategories(self):
+        """Test that an active listing counts towards its category and parents."""
+        self._listing(self.cars)
+        self._listing(self.cars, status='draft')
+        self.assertEqual(self._counts(), {'vehicles': 1, 'cars': 1, 'bikes': 0})
+    
+    def test_status_transitions_adjust_counts(self):
+        """Test that counts follow status changes, category moves and deletes."""
+        listing = self._listing(self.cars)
+        
+        listing = Listing.objects.get(pk=listing.pk)
+        listing.category = self.bikes
+        listing.save()
+        self.assertEqual(self._counts(), {'vehicles': 1, 'cars': 0, 'bikes': 1})
+        
+        listing.status = 'sold'
+        listing.save()
+        self.assertEqual(self._counts(), {'vehicles': 0, 'cars': 0, 'bikes': 0})
+        
+        listing.status = 'active'
+        listing.save()
+        Listing.objects.get(pk=listing.pk).delete()
+        self.assertEqual(self._counts(), {'vehicles': 0, 'cars': 0, 'bikes': 0})
+    
+    def test_view_count_updates_skip_counters(self):
+        """Test that saving unrelated fields doesn't touch the counters."""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        
+        listing = Listing.objects.get(pk=self._listing(self.cars).pk)
+        with CaptureQueriesContext(connection) as context:
+            listing.increment_views()
+        self.assertEqual(len(context.captured_queries), 1)
+    
+    def test_stale_category_save_keeps_counter(self):
+        """Test that saving a category loaded before a count change doesn't overwrite it."""
+        category = Category.objects.get(pk=self.cars.pk)
+        self._listing(self.cars)
+        category.description = "Four wheels"
+        category.save()
+        self.assertEqual(self._counts()['cars'], 1)
+    
+    def test_recount_command_repairs_drift(self):
+        """Test that manage.py recount rebuilds counters after bulk updates."""
+        from io import StringIO
+        from django.core.management import call_command
+        
+        self._listing(self.cars)
+        self._listing(self.bikes)
+        Listing.objects.filter(category=self.bikes).update(status='sold')
+        self.assertEqual(self._counts()['vehicles'], 2)
+        
+        call_command('recount', stdout=StringIO())
+        self.assertEqual(self._counts(), {'vehicles': 1, 'cars': 1, 'bikes': 0})
+
+
+class CategoryTreeTests(TestCase):
+    """Tests for the cached category tree."""
+    
+    def setUp(self):
+        """Set up a parent with a subcategory and one listing in each."""
+        from django.core.cache import cache
+        cache.clear()
+        self.user = User.objects.create_user(username='seller', email='seller@testcorp.com', password='x')
+        self.parent = Category.objects.create(name="Vehicles", slug="vehicles")
+        self.cars = Category.objects.create(name="Cars", slug="cars", parent=self.parent)
+        for title, category in (("Scooter", self.parent), ("Sedan", self.cars)):
+            Listing.objects.create(
+                seller=self.user, title=title, description="d", category=category,
+                price=10, condition='good', location='L', city='Pune', state='MH'
+            )
+    
+    def test_tree_is_served_from_memory(self):
+        """Test that a built tree costs no queries until a category changes."""
+        from listings.category_tree import get_category_tree
+        
+        get_category_tree()
+        with self.assertNumQueries(0):
+            tree = get_category_tree()
+        self.assertEqual(tree.descendant_ids(self.parent.id), {self.parent.id, self.cars.id})
+        self.assertEqual(tree.by_slug['cars'].parent.name, "Vehicles")
+        
+        Category.objects.create(name="Bikes", slug="bikes", parent=self.parent)
+        self.assertIn('bikes', get_category_tree().by_slug)
+    
+    def test_listing_changes_keep_tree(self):
+        """Test that count changes reach the home page without rebuilding the tree."""
+        from listings.category_tree import get_category_tree
+        
+        tree = get_category_tree()
+        Listing.objects.create(
+            seller=self.user, title="Hatchback", description="d", category=self.cars,
+            price=10, condition='good', location='L', city='Pune', state='MH'
+        )
+        self.assertIs(get_category_tree(), tree)
+        response = self.client.get(reverse('listings:home'))
+        self.assertEqual(response.context['category_counts'][self.parent.id], 3)
+    
+    def test_parent_category_includes_subcategories(self):
+        """Test that browsing a parent category shows subcategory listings."""
+        response = self.client.get(reverse('listings:category_listings', args=['vehicles']))
+        self.assertEqual(response.context['listings_count'], 2)
+        
+        response = self.client.get(reverse('listings:category_listings', args=['cars']))
+        self.assertEqual([listing.title for listing in response.context['listings']], ["Sedan"])
+    
+    def test_listing_list_accepts_slug_or_id(self):
+        """Test that the category filter takes a slug or an id."""
+        for value in ('vehicles', str(self.parent.id)):
+            response = self.client.get(reverse('listings:listing_list'), {'category': value})
+            self.assertEqual(response.context['listings_count'], 2)
+        
+        response = self.client.get(reverse('listings:listing_list'), {'category': 'unknown'})
+        self.assertEqual(response.context['listings_count'], 0)
+
+
+class CategorySchemaTests(TestCase):
+    """Tests for compiled category attribute schemas."""
+    
+    def setUp(self):
+        """Set up an approved seller and a Cars category."""
+        from django.core.cache import cache
+        cache.clear()
+        company = Company.objects.create(name="Test Corp", domain="testcorp.com", status='approved')
+        self.user = User.objects.create_user(
+            username='seller', email='seller@testcorp.com', password='TestPass123!',
+            company=company, status='approved', email_verified=True
+        )
+        self.cars = Category.objects.create(name="Cars", slug="cars")
+        self.client.force_login(self.user)
+    
+    def _attrs(self, **overrides):
+        data = {
+            'attr_brand': ' Honda ', 'attr_model': 'City', 'attr_year': '2020', 'attr_km_driven': '15,000',
+            'attr_fuel_type': 'Petrol', 'attr_transmission': 'Manual', 'attr_owners': '1st Owner',
+        }
+        data.update(overrides)
+        return data
+    
+    def test_clean_coerces_and_validates(self):
+        """Test that values are typed and bad values are reported per field."""
+        from django.core.exceptions import ValidationError
+        from listings.category_fields import get_category_schema
+        
+        schema = get_category_schema('cars')
+        self.assertIs(schema, get_category_schema(self.cars.id))
+        attributes = schema.clean(schema.form_values(self._attrs()))
+        self.assertEqual(attributes['year'], 2020)
+        self.assertEqual(attributes['km_driven'], 15000)
+        self.assertEqual(attributes['brand'], 'Honda')
+        
+        with self.assertRaises(ValidationError) as context:
+            schema.clean(schema.form_values(self._attrs(attr_year='soon', attr_fuel_type='Steam', attr_model='')))
+        self.assertEqual(set(context.exception.message_dict), {'year', 'fuel_type', 'model'})
+    
+    def test_save_coerces_known_attributes(self):
+        """Test that attributes saved outside forms are still stored typed."""
+        listing = Listing.objects.create(
+            seller=self.user, title="Car", description="d", category=self.cars, price=10, condition='good',
+            location='L', city='Pune', state='MH', attributes={'year': '2018', 'colour': 'Red'}
+        )
+        listing.refresh_from_db()
+        self.assertEqual(listing.attributes, {'year': 2018, 'colour': 'Red'})
+        self.assertEqual(Listing.objects.filter(attributes__year__gte=2017).count(), 1)
+    
+    def test_edit_listing_updates_attributes(self):
+        """Test that editing a listing keeps its category attributes (previously dropped)."""
+        listing = Listing.objects.create(
+            seller=self.user, title="Car", description="d", category=self.cars, price=10, condition='good',
+            location='L', city='Pune', state='MH', attributes={'year': 2018}
+        )
+        data = {
+            'title': 'Car', 'description': 'd', 'category': self.cars.id, 'price': 10, 'condition': 'good',
+            'location': 'L', 'city': 'Pune', 'state': 'MH',
+        }
+        data.update(self._attrs(attr_year='2021'))
+        response = self.client.post(reverse('listings:edit_listing', args=[listing.slug]), data)
+        self.assertEqual(response.status_code, 302)
+        listing.refresh_from_db()
+        self.assertEqual(listing.attributes['year'], 2021)
+
+
+class FacetTests(TestCase):
+    """Tests for attribute facets on category pages."""
+    
+    def setUp(self):
+        """Set up cars in two cities."""
+        from django.core.cache import cache
+        cache.clear()
+        self.user = User.objects.create_user(username='seller', email='seller@testcorp.com', password='x')
+        self.cars = Category.objects.create(name="Cars", slug="cars")
+        for title, city, fuel, year in (
+            ("Diesel A", "Pune", "Diesel", "2018"),
+            ("Diesel B", "Mumbai", "Diesel", "2021"),
+            ("Petrol A", "Pune", "Petrol", "2021"),
+        ):
+            Listing.objects.create(
+                seller=self.user, title=title, description="d", category=self.cars, price=10, condition='good',
+                location='L', city=city, state='MH', attributes={'fuel_type': fuel, 'year': year}
+            )
+    
+    def _titles(self, params):
+        response = self.client.get(reverse('listings:category_listings', args=['cars']), params)
+        return sorted(listing.title for listing in response.context['listings']), response
+    
+    def test_attribute_filters(self):
+        """Test that facet params map to attribute lookups."""
+        self.assertEqual(self._titles({'attr_fuel_type': 'Diesel'})[0], ["Diesel A", "Diesel B"])
+        self.assertEqual(self._titles({'attr_fuel_type': ['Diesel', 'Petrol'], 'attr_year': '2021'})[0], ["Diesel B", "Petrol A"])
+        self.assertEqual(self._titles({'attr_year_min': '2020'})[0], ["Diesel B", "Petrol A"])
+        # Unknown choices are ignored rather than erroring
+        self.assertEqual(len(self._titles({'attr_fuel_type': 'Steam'})[0]), 3)
+    
+    def test_facet_counts_come_from_refreshed_table(self):
+        """Test that counts are served from CategoryFacetCount, per city."""
+        from listings.facets import refresh_facet_counts
+        
+        refresh_facet_counts()
+        _, response = self._titles({})
+        fuel = next(facet for facet in response.context['facets'] if facet['name'] == 'fuel_type')
+        self.assertEqual([(o['value'], o['count']) for o in fuel['options']], [('Petrol', 1), ('Diesel', 2)])
+        
+        _, response = self._titles({'city': 'pune'})
+        fuel = next(facet for facet in response.context['facets'] if facet['name'] == 'fuel_type')
+        self.assertEqual([(o['value'], o['count']) for o in fuel['options']], [('Petrol', 1), ('Diesel', 1)])
+
+
+class CategoryFieldsApiTests(TestCase):
+    """Tests for the cached category fields API."""
+    
+    def setUp(self):
+        """Set up a category with configured fields."""
+        from django.core.cache import cache
+        cache.clear()
+        self.cars = Category.objects.create(name="Cars", slug="cars")
+    
+    def test_revalidation_returns_304(self):
+        """Test that the per-category response carries validators and honours them."""
+        url = reverse('listings:category_fields_api', args=[self.cars.id])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['category_name'], "Cars")
+        self.assertIn('max-age=', response['Cache-Control'])
+        self.assertTrue(response['Last-Modified'])
+        
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        
+        response = self.client.get(reverse('listings:category_fields_api', args=[self.cars.id + 100]))
+        self.assertEqual(response.status_code, 404)
+    
+    def test_bulk_response_is_versioned(self):
+        """Test that the versioned bulk URL is immutable and changes with the schemas."""
+        from listings.views import category_fields_url
+        
+        url = category_fields_url()
+        response = self.client.get(url)
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn('brand', response.json()['categories'][str(self.cars.id)]['fields'])
+        
+        Category.objects.create(name="Bikes", slug="bikes")
+        self.assertNotEqual(category_fields_url(), url)
+        self.assertNotIn('immutable', self.client.get(url)['Cache-Control'])
+
+
+class RelatedListingsTests(TestCase):
+    """Tests for precomputed related listings."""
+    
+    def setUp(self):
+        """Set up phones and a laptop in one parent category."""
+        from django.core.cache import cache
+        cache.clear()
+        self.user = User.objects.create_user(username='seller', email='seller@testcorp.com', password='x')
+        electronics = Category.objects.create(name="Electronics", slug="electronics")
+        self.phones = Category.objects.create(name="Phones", slug="phones", parent=electronics)
+        laptops = Category.objects.create(name="Laptops", slug="laptops", parent=electronics)
+        self.listings = {}
+        for title, category, price, city in (
+            ("iPhone 13 128GB", self.phones, 40000, "Pune"),
+            ("iPhone 13 Pro", self.phones, 55000, "Pune"),
+            ("Nokia feature phone", self.phones, 1500, "Delhi"),
+            ("MacBook Air M1", laptops, 60000, "Pune"),
+        ):
+            self.listings[title] = Listing.objects.create(
+                seller=self.user, title=title, description="d", category=category,
+                price=price, condition='good', location='L', city=city, state='MH'
+            )
+    
+    def test_neighbors_are_ranked_by_similarity(self):
+        """Test that the batch job ranks close matches first."""
+        from listings.recommendations import compute_neighbors, related_listings
+        
+        processed, _ = compute_neighbors(k=3)
+        self.assertEqual(processed, 4)
+        related = related_listings(self.listings["iPhone 13 128GB"], limit=3)
+        self.assertEqual(related[0].title, "iPhone 13 Pro")
+        self.assertNotIn("iPhone 13 128GB", [item.title for item in related])
+    
+    def test_detail_page_uses_neighbors_with_fallback(self):
+        """Test that fresh listings fall back to the same category."""
+        response = self.client.get(reverse('listings:listing_detail', args=[self.listings["Nokia feature phone"].slug]))
+        self.assertEqual(
+            sorted(item.title for item in response.context['related_listings']),
+            ["iPhone 13 128GB", "iPhone 13 Pro"]
+        )
+
+
+class SavedSearchAlertTests(TestCase):
+    """Tests for saved searches and batched alerts."""
+    
+    def setUp(self):
+        """Set up a buyer, a seller and a category tree."""
+        from django.core.cache import cache
+        cache.clear()
+        company = Company.objects.create(name="Test Corp", domain="testcorp.com", status='approved')
+        self.buyer = User.objects.create_user(
+            username='buyer', email='buyer@testcorp.com', personal_email='buyer@gmail.com',
+            password='x', company=company, status='approved', email_verified=True,
+            notify_new_company_listings=False
+        )
+        self.seller = User.objects.create_user(username='seller', email='seller@testcorp.com', password='x', company=company)
+        self.electronics = Category.objects.create(name="Electronics", slug="electronics")
+        self.phones = Category.objects.create(name="Phones", slug="phones", parent=self.electronics)
+    
+    def _listing(self, title, category=None, city='Pune', price=100):
+        return Listing.objects.create(
+            seller=self.seller, title=title, description="d", category=category or self.phones,
+            price=price, condition='good', location='L', city=city, state='MH'
+        )
+    
+    def _run(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from listings.saved_searches import run_alerts
+        
+        # Listings must be older than the settle window to be processed
+        Listing.objects.update(created_at=timezone.now() - timedelta(minutes=5))
+        return run_alerts()
+    
+    def test_save_search_from_listing_filters(self):
+        """Test that the listing_list query string becomes a saved search."""
+        self.client.force_login(self.buyer)
+        response = self.client.post(reverse('listings:save_search'), {
+            'querystring': 'q=iPhone&category=electronics&city=Pune&max_price=500',
+        })
+        self.assertEqual(response.status_code, 302)
+        search = SavedSearch.objects.get(user=self.buyer)
+        self.assertEqual((search.query, search.category_id, search.city), ('iphone', self.electronics.id, 'pune'))
+    
+    def test_alerts_match_new_listings_in_one_batch(self):
+        """Test that new listings past the watermark are matched and batched per user."""
+        from django.core import mail
+        
+        self._listing("Old iPhone")
+        self.assertEqual(self._run(), (0, 0))  # first run only sets the watermark
+        
+        SavedSearch.objects.create(user=self.buyer, query='iphone', category=self.electronics, city='pune')
+        SavedSearch.objects.create(user=self.buyer, city='pune', max_price=150)
+        self._listing("iPhone 12")
+        self._listing("iPhone 13", city='Delhi')
+        self._listing("Pixel 7")
+        
+        processed, sent = self._run()
+        self.assertEqual((processed, sent), (3, 1))
+        self.assertEqual(mail.outbox[0].to, ['buyer@gmail.com'])
+        self.assertIn('iPhone 12', mail.outbox[0].body)
+        self.assertIn('Pixel 7', mail.outbox[0].body)
+        self.assertNotIn('iPhone 13', mail.outbox[0].body)
+        
+        self.assertEqual(self._run(), (0, 0))
+    
+    def test_alerts_match_like_listing_list(self):
+        """Test that alerts use the same substring matching as the listing search."""
+        from django.core import mail
+        
+        self._run()
+        SavedSearch.objects.create(user=self.buyer, query='phone 1')
+        SavedSearch.objects.create(user=self.buyer, city='pimpri')
+        self._listing("iPhone 12")
+        self._listing("Desk", city='Pimpri-Chinchwad')
+        self._listing("Headphones")
+        
+        for params, expected in (({'q': 'phone 1', 'show_all': '1'}, ['iPhone 12']), ({'city': 'pimpri'}, ['Desk'])):
+            response = self.client.get(reverse('listings:listing_list'), params)
+            self.assertEqual([listing.title for listing in response.context['listings']], expected)
+        self.assertEqual(self._run(), (3, 1))
+        self.assertIn('iPhone 12', mail.outbox[0].body)
+        self.assertIn('Desk', mail.outbox[0].body)
+        self.assertNotIn('Headphones', mail.outbox[0].body)
+    
+    def test_failed_send_keeps_watermark(self):
+        """Test that alerts are retried on the next run when sending fails."""
+        from unittest import mock
+        from django.core import mail
+        from django.core.mail.backends.locmem import EmailBackend
+        
+        self._run()
+        SavedSearch.objects.create(user=self.buyer, query='iphone')
+        self._listing("iPhone 12")
+        with mock.patch.object(EmailBackend, 'send_messages', side_effect=OSError('SMTP down')), \
+                self.assertLogs('listings.saved_searches', 'ERROR'):
+            self.assertEqual(self._run(), (0, 0))
+        self.assertEqual(self._run(), (1, 1))
+        self.assertIn('iPhone 12', mail.outbox[0].body)
+
+
+class ListingLifecycleTests(TestCase):
+    """Tests for listing expiry and archival."""
+    
+    def setUp(self):
+        """Set up a seller and a category."""
+        from django.core.cache import cache
+        cache.clear()
+        self.user = User.objects.create_user(username='seller', email='seller@testcorp.com', password='x')
+        self.category = Category.objects.create(name="Books", slug="books")
+    
+    def _listing(self, title, **fields):
+        return Listing.objects.create(
+            seller=self.user, title=title, description="d", category=self.category,
+            price=10, condition='good', location='L', city='Pune', state='MH', **fields
+        )
+    
+    def test_expire_in_batches_and_adjust_counters(self):
+        """Test that only listings past expiry are expired, across several batches."""
+        from datetime import timedelta
+        from django.utils import timezone
+        from listings.lifecycle import expire_listings
+        
+        past = timezone.now() - timedelta(days=1)
+        for i in range(5):
+            self._listing(f"Old {i}", expires_at=past)
+        fresh = self._listing("Fresh")
+        self.assertIsNotNone(fresh.expires_at)
+        
+        self.assertEqual(expire_listings(batch_size=2), 5)
+        self.assertEqual(Listing.objects.filter(status='expired').count(), 5)
+        self.assertEqual(Category.objects.get(pk=self.category.pk).active_listing_count, 1)
+    
+    def test_archive_moves_old_inactive_listings(self):
+        """Test that archival skips recent listings and listings with conversations."""
+        from datetime import timedelta
+        from django.utils import timezone
+        from listings.lifecycle import archive_listings
+        from listings.models import ArchivedListing
+        from messaging.models import Conversation
+        
+        old = timezone.now() - timedelta(days=365)
+        archivable = self._listing("Sold long ago", status='sold')
+        discussed = self._listing("Sold with chat", status='sold')
+        recent = self._listing("Sold yesterday", status='sold')
+        buyer = User.objects.create_user(username='buyer', email='buyer@testcorp.com', password='x')
+        Conversation.objects.create(listing=discussed, buyer=buyer, seller=self.user)
+        Listing.objects.filter(id__in=[archivable.id, discussed.id]).update(updated_at=old)
+        
+        self.assertEqual(archive_listings(), 1)
+        self.assertFalse(Listing.objects.filter(id=archivable.id).exists())
+        self.assertEqual(ArchivedListing.objects.get().original_id, archivable.id)
+        self.assertTrue(Listing.objects.filter(id__in=[discussed.id, recent.id]).count() == 2)
+
+
+class ActiveListingIndexTests(TestCase):
+    """EXPLAIN the listing queries the browse views actually run, to check they use the partial active-listing indexes."""
+    
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.user = User.objects.create_user(username='seller', email='seller@testcorp.com', password='x')
+        self.category = Category.objects.create(name="Books", slug="books")
+        self.novels = Category.objects.create(name="Novels", slug="novels", parent=self.category)
+        listings = [
+            Listing(
+                seller=self.user, title=f"Book {i}", slug=f"book-{i}", description="d",
+                category=self.novels if i % 3 else self.category,
+                price=10, condition='good', location='L', city='Pune' if i % 2 else 'Mumbai', state='MH',
+                status='active' if i % 10 == 0 else 'deleted', is_featured=i % 20 == 0,
+            )
+            for i in range(400)
+        ]
+        Listing.objects.bulk_create(listings)
+        from django.db import connection
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE' if connection.vendor == 'sqlite' else 'ANALYZE listings_listing')
+    
+    def _plans(self, url, params=None):
+        """EXPLAIN output for each SELECT of listings the view ran"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(self.client.get(url, params).status_code, 200)
+        explain = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
+        plans = []
+        for query in context.captured_queries:
+            sql = query['sql']
+            if sql.startswith('SELECT "listings_listing"."id"') and '"listings_listing"."status" = ' in sql:
+                with connection.cursor() as cursor:
+                    cursor.execute(explain + sql)
+                    plans.append(repr(cursor.fetchall()))
+        self.assertTrue(plans, f'no listing queries for {url}')
+        return plans
+    
+    def assertUsesIndex(self, plans, index_name):
+        self.assertTrue(any(index_name in plan for plan in plans), plans)
+    
+    def test_listing_list(self):
+        self.assertUsesIndex(self._plans(reverse('listings:listing_list')), 'listing_active_recent_idx')
+        # city is an icontains filter, which no index can serve; the recent index still bounds the scan
+        self.assertUsesIndex(self._plans(reverse('listings:listing_list'), {'city': 'pune'}), 'listing_active_recent_idx')
+    
+    def test_category_listings(self):
+        self.assertUsesIndex(self._plans(reverse('listings:category_listings', args=['novels'])), 'listing_active_category_idx')
+        # A parent category filters category_id IN (descendants); either active index avoids the inactive rows
+        self.assertUsesIndex(self._plans(reverse('listings:category_listings', args=['books'])), 'listing_active_')
+    
+    def test_home_recent(self):
+        self.assertUsesIndex(self._plans(reverse('listings:home')), 'listing_active_recent_idx')
+    
+    def test_home_featured(self):
+        # The home template doesn't render featured listings yet, so EXPLAIN the view's queryset directly
+        featured = Listing.objects.filter(status='active', is_featured=True)[:6]
+        self.assertUsesIndex([featured.explain()], 'listing_active_featured_idx')
+
+
+class ReplicaRoutingTests(TestCase):
+    """Tests for read-replica routing, with a second SQLite database as the replica."""
+    
+    databases = {'default', 'replica'}
+    
+    def setUp(self):
+        """Create a listing on the primary only, as if replication hadn't caught up."""
+        from django.core.cache import cache
+        cache.clear()
+        self.user = User.objects.create_user(username='seller', email='seller@testcorp.com', password='x')
+        self.category = Category.objects.create(name="Books", slug="books")
+        self.listing = Listing.objects.create(
+            seller=self.user, title="Fresh listing", description="d", category=self.category,
+            price=10, condition='good', location='L', city='Pune', state='MH'
+        )
+        self.url = reverse('listings:listing_detail', args=[self.listing.slug])
+    
+    def test_reads_use_primary_without_replicas(self):
+        with self.settings(REPLICA_DATABASES=[]):
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+    
+    @override_settings(REPLICA_DATABASES=['replica'])
+    def test_browse_views_read_from_replica(self):
+        """Test that routed views read from the replica, and writes still go to the primary."""
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        self.assertFalse(Listing.objects.using('replica').exists())
+        self.assertEqual(Listing.objects.count(), 1)
+    
+    @override_settings(REPLICA_DATABASES=['replica'])
+    def test_write_pins_reads_to_primary(self):
+        """Test that a write sets the pin cookie and pinned requests read from the primary."""
+        from credmarket.db_router import PIN_COOKIE
+        
+        response = self.client.post(reverse('listings:listing_list'))
+        self.assertIn(PIN_COOKIE, response.cookies)
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+    
+    @override_settings(REPLICA_DATABASES=['replica'])
+    def test_unrouted_reads_use_primary(self):
+        self.assertEqual(Listing.objects.get(pk=self.listing.pk).title, "Fresh listing")
+
+
+@override_settings(DEBUG=True)
+class GenerateDatasetTests(TestCase):
+    """Tests for the generate_dataset management command."""
+    
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+    
+    def _generate(self, seed=1):
+        from io import StringIO
+        from django.core.management import call_command
+        
+        call_command('generate_dataset', users=20, listings=100, messages=300, companies=5,
+                     seed=seed, chunk_size=40, stdout=StringIO())
+        return list(Listing.objects.filter(seller__username__startswith=f'gen{seed}_')
+                    .order_by('slug').values_list('title', 'price', 'city', 'status', 'attributes'))
+    
+    def test_generates_requested_rows(self):
+        from django.db.models import F
+        from messaging.models import Conversation, Message
+        
+        self._generate()
+        self.assertEqual(User.objects.filter(username__startswith='gen1_').count(), 20)
+        self.assertEqual(Listing.objects.count(), 100)
+        self.assertEqual(Message.objects.count(), 300)
+        self.assertFalse(Conversation.objects.filter(buyer=F('seller')).exists())
+        # Timestamps are spread out rather than all set to now
+        self.assertGreater(Listing.objects.dates('created_at', 'day').count(), 10)
+        active = Listing.objects.filter(status='active').count()
+        self.assertEqual(sum(c.active_listing_count for c in Category.objects.filter(parent=None)), active)
+    
+    def test_same_seed_same_data(self):
+        first = self._generate()
+        User.objects.filter(username__startswith='gen1_').delete()
+        self.assertEqual(self._generate(), first)
+    
+    def test_refuses_to_reuse_seed(self):
+        from django.core.management.base import CommandError
+        
+        self._generate()
+        with self.assertRaises(CommandError):
+            self._generate()
+
+
+class ListingCardCacheTests(TestCase):
+    """Tests for the cached listing card fragment."""
+    
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Uploaded test images go to a throwaway MEDIA_ROOT
+        media_root = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        cls.enterClassContext(override_settings(MEDIA_ROOT=media_root))
+    
+    def setUp(self):
+        from django.core.cache import caches
+        caches['template_fragments'].clear()
+        self.user = User.objects.create_user(username='seller', email='seller@testcorp.com', password='x')
+        self.category = Category.objects.create(name="Books", slug="books")
+        self.listing = Listing.objects.create(
+            seller=self.user, title="Original title", description="d", category=self.category,
+            price=10, condition='good', location='L', city='Pune', state='MH'
+        )
+        self.url = reverse('listings:category_listings', args=['books'])
+    
+    def test_unchanged_card_is_served_from_cache(self):
+        self.assertContains(self.client.get(self.url), "Original title")
+        # A bulk update doesn't touch updated_at, so the cached card is reused
+        Listing.objects.filter(pk=self.listing.pk).update(title="Bulk title")
+        self.assertContains(self.client.get(self.url), "Original title")
+    
+    def test_saving_listing_rerenders_card(self):
+        self.assertContains(self.client.get(self.url), "Original title")
+        self.listing.title = "New title"
+        self.listing.save()
+        response = self.client.get(self.url)
+        self.assertContains(response, "New title")
+        self.assertNotContains(response, "Original title")
+    
+    def test_image_change_rerenders_card(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from listings.models import ListingImage
+        
+        self.assertNotContains(self.client.get(self.url), "<img src=\"/media/listings/")
+        ListingImage.objects.create(
+            listing=self.listing, image=SimpleUploadedFile('card.jpg', b'x', content_type='image/jpeg')
+        )
+        self.assertContains(self.client.get(self.url), "<img src=\"/media/listings/")
+    
+    def test_category_and_company_renames_rerender_card(self):
+        company = Company.objects.create(name="Old Corp", domain="testcorp.com", status='approved')
+        self.user.company = company
+        self.user.save()
+        self.assertContains(self.client.get(self.url), "Old Corp")
+        self.category.name = "Used Books"
+        self.category.save()
+        company.name = "New Corp"
+        company.save()
+        response = self.client.get(self.url)
+        self.assertContains(response, "Used Books")
+        self.assertContains(response, "New Corp")
+        self.assertNotContains(response, "Old Corp")
+    
+    def test_grids_share_the_card(self):
+        for url in [reverse('listings:home'), reverse('listings:listing_list'), self.url]:
+            self.assertContains(self.client.get(url), reverse('listings:listing_detail', args=[self.listing.slug]))
+
+
+class ConditionalGetTests(TestCase):
+    """Tests for ETag/Last-Modified revalidation of the listing pages."""
+    
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Uploaded test images go to a throwaway MEDIA_ROOT
+        media_root = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        cls.enterClassContext(override_settings(MEDIA_ROOT=media_root))
+    
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.user = User.objects.create_user(username='seller', email='seller@testcorp.com', password='x')
+        self.category = Category.objects.create(name="Books", slug="books")
+        self.listing = Listing.objects.create(
+            seller=self.user, title="Novel", description="d", category=self.category,
+            price=10, condition='good', location='L', city='Pune', state='MH'
+        )
+        self.detail_url = reverse('listings:listing_detail', args=[self.listing.slug])
+        self.urls = [reverse('listings:home'), reverse('listings:category_listings', args=['books']), self.detail_url]
+    
+    def _revalidate(self, url, response):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+    
+    def test_unchanged_pages_return_304(self):
+        for url in self.urls:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('no-cache', response['Cache-Control'])
+            self.assertIn('Last-Modified', response)
+            self.assertEqual(self._revalidate(url, response).status_code, 304, url)
+    
+    def test_listing_change_invalidates(self):
+        responses = {url: self.client.get(url) for url in self.urls}
+        self.listing.price = 20
+        self.listing.save()
+        for url, response in responses.items():
+            self.assertEqual(self._revalidate(url, response).status_code, 200, url)
+    
+    def test_image_change_invalidates_detail(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from listings.models import ListingImage
+        
+        response = self.client.get(self.detail_url)
+        ListingImage.objects.create(
+            listing=self.listing, image=SimpleUploadedFile('etag.jpg', b'x', content_type='image/jpeg')
+        )
+        self.assertEqual(self._revalidate(self.detail_url, response).status_code, 200)
+    
+    def test_related_listing_change_invalidates(self):
+        """Test that a change anywhere under the top-level category invalidates its pages and listing pages."""
+        novels = Category.objects.create(name="Novels", slug="novels", parent=self.category)
+        other = Listing.objects.create(
+            seller=self.user, title="Poems", description="d", category=novels,
+            price=10, condition='good', location='L', city='Pune', state='MH'
+        )
+        responses = {url: self.client.get(url) for url in self.urls[1:]}
+        other.title = "Sonnets"
+        other.save()
+        for url, response in responses.items():
+            self.assertEqual(self._revalidate(url, response).status_code, 200, url)
+    
+    def test_revalidation_does_not_scan_listings(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        
+        for url in self.urls[1:]:
+            response = self.client.get(url)
+            with CaptureQueriesContext(connection) as context:
+                self.assertEqual(self._revalidate(url, response).status_code, 304, url)
+            self.assertFalse([q['sql'] for q in context.captured_queries if 'MAX(' in q['sql']], url)
+    
+    def test_etag_is_per_viewer(self):
+        anonymous = self.client.get(self.detail_url)
+        self.client.force_login(self.user)
+        response = self._revalidate(self.detail_url, anonymous)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], anonymous['ETag'])
+        self.assertEqual(self._revalidate(self.detail_url, response).status_code, 304)
+    
+    def test_pending_messages_render_page(self):
+        from django.contrib import messages
+        from django.contrib.messages.storage.fallback import FallbackStorage
+        from django.test import RequestFactory
+        from listings.views import listing_detail
+        
+        request = RequestFactory().get(self.detail_url, HTTP_IF_NONE_MATCH=self.client.get(self.detail_url)['ETag'])
+        request.user = self.user
+        request.session = self.client.session
+        request._messages = FallbackStorage(request)
+        messages.success(request, "Listing saved")
+        response = listing_detail(request, self.listing.slug)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response)
@@ -14,7 +14,11 @@ urlpatterns = [
     path('listings/<int:listing_id>/report/', views.report_listing, name='report_listing'),
     path('category/<slug:slug>/', views.category_listings, name='category_listings'),
     path('my-listings/', views.my_listings, name='my_listings'),
+    path('saved-searches/', views.saved_searches, name='saved_searches'),
+    path('saved-searches/save/', views.save_search, name='save_search'),
+    path('saved-searches/<int:search_id>/delete/', views.delete_saved_search, name='delete_saved_search'),
     path('company-listings/', views.company_listings, name='company_listings'),
+    path('api/category-fields/', views.category_fields_bulk_api, name='category_fields_bulk_api'),
     path('api/category-fields/<int:category_id>/', views.get_category_fields_api, name='category_fields_api'),
     path('api/delete-image/<int:image_id>/', views.delete_image, name='delete_image'),
 ]
@@ -1,21 +1,57 @@
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.core.exceptions import PermissionDenied
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.http import Http404, HttpResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.views.decorators.http import require_GET, require_POST
 from django.db.models import Q, Max
 from django.core.mail import send_mail
 from django.conf import settings
 from accounts.models import User
-from .models import Listing, Category, ListingImage, ListingReport
-from .category_fields import get_category_fields
+from credmarket.background import enqueue
+from credmarket.db_router import use_read_replica
+from analytics.search_log import record_search
+from .models import Listing, ListingImage, ListingReport, SavedSearch
+from .category_fields import get_category_schema, get_field_blobs
+from .category_tree import get_category_tree
+from .conditional import category_state, conditional_page, home_state, listing_state
+from .counters import category_counts
+from .facets import apply_attribute_filters, get_facets
+from .recommendations import related_listings as related_listings_for
+from .saved_searches import saved_search_from_querystring
 import logging
+import time
 
 logger = logging.getLogger(__name__)
+# One record per page view; sampled (see LOG_SAMPLING in settings)
+access_logger = logging.getLogger('listings.access')
 
+# Query-string filters recorded in the search log alongside `q`
+SEARCH_FILTER_PARAMS = ['category', 'city', 'location', 'min_price', 'max_price', 'condition']
 
+MAX_SAVED_SEARCHES = 20
+
+
+def _log_search(request, results, started, source, **extra_filters):
+    """Record a browse request in the search log if it carried a query or filter"""
+    query = request.GET.get('q', '')
+    filters = {name: request.GET.get(name, '') for name in SEARCH_FILTER_PARAMS}
+    if not query and not any(filters.values()) and not extra_filters.get('attributes'):
+        return
+    filters.update(extra_filters)
+    latency_ms = (time.perf_counter() - started) * 1000
+    record_search(query, filters, len(results), latency_ms, source=source)
+
+
+@use_read_replica
+@conditional_page(home_state)
 def home(request):
     """Homepage with featured and recent listings"""
-    logger.info(f"Home page accessed by user: {request.user if request.user.is_authenticated else 'Anonymous'}")
+    access_logger.info("Home page accessed", extra={'user_id': request.user.pk})
     # Get user's city from location field
     user_city = None
     if request.user.is_authenticated and request.user.location:
@@ -25,7 +61,7 @@ def home(request):
     featured_listings = Listing.objects.filter(
         status='active',
         is_featured=True
-    ).select_related('seller', 'category', 'seller__company')
+    ).select_related('seller', 'category', 'seller__company').prefetch_related('images')
     if user_city:
         # Show listings from user's city first, then others
         city_featured = featured_listings.filter(city__icontains=user_city)[:4]
@@ -35,7 +71,7 @@ def home(request):
         featured_listings = featured_listings[:6]
     
     # Recent listings - prioritize user's city if logged in
-    recent_listings = Listing.objects.filter(status='active').select_related('seller', 'category', 'seller__company')
+    recent_listings = Listing.objects.filter(status='active').select_related('seller', 'category', 'seller__company').prefetch_related('images')
     if user_city:
         # Show listings from user's city first
         city_recent = recent_listings.filter(city__icontains=user_city)[:8]
@@ -44,35 +80,24 @@ def home(request):
     else:
         recent_listings = recent_listings[:12]
     
-    # Show only top-level active categories (no subcategories)
-    from django.db.models import Case, When, Value, IntegerField
-    
-    # Define priority order for important categories
-    priority_categories = ['Electronics', 'Vehicles', 'Real Estate', 'Rent', 'Furniture', 
-                          'Home Appliances', 'Cars', 'Bikes', 'Apartments']
-    
-    # Create ordering: priority categories first, then alphabetical
-    when_clauses = [When(name=cat, then=Value(i)) for i, cat in enumerate(priority_categories)]
-    categories = Category.objects.filter(is_active=True, parent__isnull=True).annotate(
-        priority=Case(
-            *when_clauses,
-            default=Value(999),
-            output_field=IntegerField()
-        )
-    ).order_by('priority', 'name')
+    # Top-level active categories, priority categories first (from the cached tree)
+    categories = get_category_tree().home_categories()
     
     context = {
         'featured_listings': featured_listings,
         'recent_listings': recent_listings,
         'categories': categories,
+        'category_counts': category_counts(),
         'user_city': user_city,
     }
     return render(request, 'listings/home.html', context)
 
 
+@use_read_replica
 def listing_list(request):
     """List all active listings with search and filters"""
-    listings = Listing.objects.filter(status='active').select_related('seller', 'category', 'seller__company')
+    started = time.perf_counter()
+    listings = Listing.objects.filter(status='active').select_related('seller', 'category', 'seller__company').prefetch_related('images')
     
     # Get user's city for smart filtering
     user_city = None
@@ -87,10 +112,15 @@ def listing_list(request):
             Q(description__icontains=query)
         )
     
-    # Category filter
-    category_slug = request.GET.get('category')
-    if category_slug:
-        listings = listings.filter(category__slug=category_slug)
+    # Category filter (slug or id); a parent category includes its subcategories
+    tree = get_category_tree()
+    category_param = request.GET.get('category')
+    if category_param:
+        category = tree.get(category_param)
+        if category is None:
+            listings = listings.none()
+        else:
+            listings = listings.filter(category_id__in=tree.descendant_ids(category.id))
     
     # Price filter
     min_price = request.GET.get('min_price')
@@ -135,10 +165,15 @@ def listing_list(request):
     else:
         listings = listings.order_by(sort)
     
-    categories = Category.objects.filter(parent=None, is_active=True)
+    # Evaluate once so the result count is known without a separate COUNT query
+    listings = list(listings)
+    _log_search(request, listings, started, source='listing_list')
+    
+    categories = tree.roots()
     
     context = {
         'listings': listings,
+        'listings_count': len(listings),
         'categories': categories,
         'user_city': user_city,
         'showing_city_only': bool(user_city and not city_filter and not request.GET.get('show_all')),
@@ -146,6 +181,8 @@ def listing_list(request):
     return render(request, 'listings/listing_list.html', context)
 
 
+@use_read_replica
+@conditional_page(listing_state)
 def listing_detail(request, slug):
     """Display single listing detail"""
     listing = get_object_or_404(Listing, slug=slug)
@@ -153,11 +190,8 @@ def listing_detail(request, slug):
     # Increment view count
     listing.increment_views()
     
-    # Related listings
-    related_listings = Listing.objects.filter(
-        category=listing.category,
-        status='active'
-    ).exclude(id=listing.id)[:4]
+    # Related listings (precomputed neighbors, newest in category as fallback)
+    related_listings = related_listings_for(listing)
     
     context = {
         'listing': listing,
@@ -166,10 +200,18 @@ def listing_detail(request, slug):
     return render(request, 'listings/listing_detail.html', context)
 
 
+@use_read_replica
+@conditional_page(category_state)
 def category_listings(request, slug):
     """Display listings in a specific category"""
-    category = get_object_or_404(Category, slug=slug)
-    listings = Listing.objects.filter(category=category, status='active').select_related('seller', 'category', 'seller__company')
+    started = time.perf_counter()
+    tree = get_category_tree()
+    category = tree.by_slug.get(slug)
+    if category is None:
+        raise Http404("No Category matches the given query.")
+    listings = Listing.objects.filter(
+        category_id__in=tree.descendant_ids(category.id), status='active'
+    ).select_related('seller', 'category', 'seller__company').prefetch_related('images')
     
     # Get user's city for filtering
     user_city = None
@@ -197,6 +239,10 @@ def category_listings(request, slug):
     if condition:
         listings = listings.filter(condition=condition)
     
+    # Attribute facets (fuel type, year, furnishing...) from the category's field schema
+    schema = get_category_schema(category)
+    listings, attribute_filters = apply_attribute_filters(listings, schema, request.GET)
+    
     # Sorting
     sort = request.GET.get('sort', '-created_at')
     if user_city and sort == '-created_at' and not city_filter:
@@ -212,11 +258,17 @@ def category_listings(request, slug):
     else:
         listings = listings.order_by(sort)
     
+    listings = list(listings)
+    _log_search(request, listings, started, source='category_listings', category=category.slug, attributes=attribute_filters)
+    
+    showing_city_only = bool(user_city and not city_filter and not request.GET.get('show_all'))
     context = {
         'category': category,
         'listings': listings,
+        'listings_count': len(listings),
+        'facets': get_facets(category, city_filter or (user_city if showing_city_only else ''), attribute_filters),
         'user_city': user_city,
-        'showing_city_only': bool(user_city and not city_filter and not request.GET.get('show_all')),
+        'showing_city_only': showing_city_only,
     }
     return render(request, 'listings/category_listings.html', context)
 
@@ -227,10 +279,8 @@ def create_listing(request):
     if not request.user.can_create_listing():
         # Add detailed error message for debugging
         logger.error(
-            f"User {request.user.email} cannot create listing - "
-            f"email_verified: {request.user.email_verified}, "
-            f"status: {request.user.status}, "
-            f"is_active: {request.user.is_active}"
+            "User %s cannot create listing - email_verified: %s, status: %s, is_active: %s",
+            request.user.email, request.user.email_verified, request.user.status, request.user.is_active,
         )
         
         # Provide clear message based on the issue
@@ -258,22 +308,25 @@ def create_listing(request):
     
     if request.method == 'POST':
         # Get category to extract its specific fields
-        category_id = request.POST.get('category')
-        category = Category.objects.get(id=category_id)
+        category = get_category_tree().get(request.POST.get('category'))
+        if category is None:
+            messages.error(request, 'Please choose a valid category.')
+            return redirect('listings:create_listing')
         
-        # Build attributes dict from category-specific fields
-        attributes = {}
-        category_fields = get_category_fields(category.name)
-        for field_name in category_fields.keys():
-            value = request.POST.get(f'attr_{field_name}')
-            if value:
-                attributes[field_name] = value
+        # Validate and type category-specific fields
+        schema = get_category_schema(category)
+        try:
+            attributes = schema.clean(schema.form_values(request.POST))
+        except ValidationError as e:
+            for message in e.messages:
+                messages.error(request, message)
+            return redirect('listings:create_listing')
         
         # Create listing
         listing = Listing.objects.create(
             title=request.POST.get('title'),
             description=request.POST.get('description'),
-            category_id=category_id,
+            category_id=category.id,
             seller=request.user,
             price=request.POST.get('price'),
             is_negotiable=request.POST.get('is_negotiable') == 'on',
@@ -301,13 +354,12 @@ def create_listing(request):
         messages.success(request, 'Listing created successfully!')
         return redirect('listings:listing_detail', slug=listing.slug)
     
-    # Get all categories - both parent and subcategories
-    parent_categories = Category.objects.filter(parent=None, is_active=True).prefetch_related('subcategories')
-    categories = Category.objects.filter(is_active=True)
-    
+    # Both parent and subcategories, from the cached tree
+    tree = get_category_tree()
     context = {
-        'parent_categories': parent_categories,
-        'categories': categories,
+        'category_menu': tree.menu(),
+        'parent_categories': tree.roots(),
+        'category_fields_url': category_fields_url(),
     }
     return render(request, 'listings/create_listing.html', context)
 
@@ -319,13 +371,17 @@ def edit_listing(request, slug):
     
     # Check if user is the owner
     if listing.seller != request.user:
-        logger.warning(f"User {request.user.email} attempted to edit listing {slug} owned by {listing.seller.email}")
+        logger.warning("User %s attempted to edit listing %s owned by %s", request.user.email, slug, listing.seller.email)
         raise PermissionDenied("You don't have permission to edit this listing.")
     
     if request.method == 'POST':
         listing.title = request.POST.get('title')
         listing.description = request.POST.get('description')
-        listing.category_id = request.POST.get('category')
+        category = get_category_tree().get(request.POST.get('category'))
+        if category is None:
+            messages.error(request, 'Please choose a valid category.')
+            return redirect('listings:edit_listing', slug=slug)
+        listing.category_id = category.id
         listing.price = request.POST.get('price')
         listing.is_negotiable = request.POST.get('is_negotiable') == 'on'
         listing.condition = request.POST.get('condition')
@@ -335,16 +391,14 @@ def edit_listing(request, slug):
         listing.pincode = request.POST.get('pincode', '')
         
         # Handle category-specific attributes
-        category = Category.objects.get(id=listing.category_id)
-        category_fields = get_category_fields(category.id)
-        
-        if category_fields:
-            attributes = {}
-            for field_name in category_fields.keys():
-                field_value = request.POST.get(f'attr_{field_name}')
-                if field_value:
-                    attributes[field_name] = field_value
-            listing.attributes = attributes
+        schema = get_category_schema(category)
+        if schema.fields:
+            try:
+                listing.attributes = schema.clean(schema.form_values(request.POST))
+            except ValidationError as e:
+                for message in e.messages:
+                    messages.error(request, message)
+                return redirect('listings:edit_listing', slug=slug)
         
         listing.save()
         
@@ -356,7 +410,7 @@ def edit_listing(request, slug):
                 listing=listing
             ).delete()[0]
             if deleted_count > 0:
-                logger.info(f"User {request.user.email} deleted {deleted_count} images from listing {slug}")
+                logger.info("User %s deleted %s images from listing %s", request.user.email, deleted_count, slug)
         
         # Handle new image uploads
         new_images = request.FILES.getlist('new_images')
@@ -380,7 +434,7 @@ def edit_listing(request, slug):
                 )
             
             if new_images:
-                logger.info(f"User {request.user.email} added {len(new_images)} images to listing {slug}")
+                logger.info("User %s added %s images to listing %s", request.user.email, len(new_images), slug)
                 messages.success(request, f'{len(new_images)} image(s) added successfully!')
         
         # Handle image reordering
@@ -393,19 +447,19 @@ def edit_listing(request, slug):
                         id=image_id,
                         listing=listing
                     ).update(order=new_order)
-                logger.info(f"User {request.user.email} reordered images for listing {slug}")
+                logger.info("User %s reordered images for listing %s", request.user.email, slug)
             except (ValueError, TypeError) as e:
-                logger.error(f"Error reordering images for listing {slug}: {e}")
+                logger.error("Error reordering images for listing %s: %s", slug, e)
         
         messages.success(request, 'Listing updated successfully!')
         return redirect('listings:listing_detail', slug=listing.slug)
     
-    parent_categories = Category.objects.filter(parent__isnull=True, is_active=True).order_by('order')
-    categories = Category.objects.filter(is_active=True)
+    tree = get_category_tree()
     context = {
         'listing': listing,
-        'parent_categories': parent_categories,
-        'categories': categories,
+        'category_menu': tree.menu(),
+        'parent_categories': tree.roots(),
+        'category_fields_url': category_fields_url(),
     }
     return render(request, 'listings/edit_listing.html', context)
 
@@ -424,7 +478,7 @@ def delete_image(request, image_id):
         
         # Check if user is the owner
         if listing.seller != request.user:
-            logger.warning(f"User {request.user.email} attempted to delete image {image_id} from listing owned by {listing.seller.email}")
+            logger.warning("User %s attempted to delete image %s from listing owned by %s", request.user.email, image_id, listing.seller.email)
             return JsonResponse({'success': False, 'error': 'Permission denied'}, status=403)
         
         # Prevent deletion if it's the last image (optional - can be removed if you want to allow 0 images)
@@ -432,7 +486,7 @@ def delete_image(request, image_id):
             return JsonResponse({'success': False, 'error': 'Cannot delete the last image'}, status=400)
         
         image.delete()
-        logger.info(f"User {request.user.email} deleted image {image_id} from listing {listing.slug}")
+        logger.info("User %s deleted image %s from listing %s", request.user.email, image_id, listing.slug)
         
         return JsonResponse({
             'success': True,
@@ -440,7 +494,7 @@ def delete_image(request, image_id):
         })
     
     except Exception as e:
-        logger.error(f"Error deleting image {image_id}: {str(e)}")
+        logger.error("Error deleting image %s: %s", image_id, e)
         return JsonResponse({'success': False, 'error': str(e)}, status=500)
 
 
@@ -451,7 +505,7 @@ def delete_listing(request, slug):
     
     # Check if user is the owner
     if listing.seller != request.user:
-        logger.warning(f"User {request.user.email} attempted to delete listing {slug} owned by {listing.seller.email}")
+        logger.warning("User %s attempted to delete listing %s owned by %s", request.user.email, slug, listing.seller.email)
         raise PermissionDenied("You don't have permission to delete this listing.")
     
     if request.method == 'POST':
@@ -470,13 +524,13 @@ def mark_sold(request, slug):
     
     # Check if user is the owner
     if listing.seller != request.user:
-        logger.warning(f"User {request.user.email} attempted to mark listing {slug} as sold, owned by {listing.seller.email}")
+        logger.warning("User %s attempted to mark listing %s as sold, owned by %s", request.user.email, slug, listing.seller.email)
         raise PermissionDenied("You don't have permission to modify this listing.")
     
     if request.method == 'POST':
         listing.status = 'sold'
         listing.save()
-        logger.info(f"Listing {slug} marked as sold by owner {request.user.email}")
+        logger.info("Listing %s marked as sold by owner %s", slug, request.user.email)
         messages.success(request, 'Listing marked as SOLD! The item has been deactivated.')
         return redirect('listings:listing_detail', slug=slug)
     
@@ -493,6 +547,40 @@ def my_listings(request):
     return render(request, 'listings/my_listings.html', context)
 
 
+@login_required
+def saved_searches(request):
+    """List the user's saved searches"""
+    searches = SavedSearch.objects.filter(user=request.user).select_related('category')
+    return render(request, 'listings/saved_searches.html', {'searches': searches})
+
+
+@login_required
+@require_POST
+def save_search(request):
+    """Save the current listing_list filters for alerts"""
+    search = saved_search_from_querystring(request.user, request.POST.get('querystring', ''))
+    search.name = request.POST.get('name', '').strip()[:100]
+    
+    if SavedSearch.objects.filter(user=request.user, is_active=True).count() >= MAX_SAVED_SEARCHES:
+        messages.error(request, f'You can save up to {MAX_SAVED_SEARCHES} searches. Delete one to save another.')
+        return redirect('listings:saved_searches')
+    
+    search.save()
+    logger.info("User %s saved search %s: %s", request.user.email, search.id, search.describe())
+    messages.success(request, "Search saved! We'll email you when new listings match it.")
+    return redirect('listings:saved_searches')
+
+
+@login_required
+@require_POST
+def delete_saved_search(request, search_id):
+    """Delete one of the user's saved searches"""
+    deleted, _ = SavedSearch.objects.filter(id=search_id, user=request.user).delete()
+    if deleted:
+        messages.success(request, 'Saved search deleted.')
+    return redirect('listings:saved_searches')
+
+
 @login_required
 def company_listings(request):
     """Display listings from user's company"""
@@ -503,7 +591,7 @@ def company_listings(request):
     listings = Listing.objects.filter(
         seller__company=request.user.company,
         status='active'
-    ).exclude(seller=request.user).select_related('seller', 'category', 'seller__company')
+    ).exclude(seller=request.user).select_related('seller', 'category', 'seller__company').prefetch_related('images')
     
     context = {
         'listings': listings,
@@ -514,21 +602,50 @@ def company_listings(request):
 
 from django.http import JsonResponse
 
-def get_category_fields_api(request, category_id):
+def _blob_response(request, blob, cache_control):
+    """Serve a precomputed JSON blob, answering revalidation with 304"""
+    response = get_conditional_response(request, etag=blob.etag, last_modified=blob.last_modified)
+    if response is None:
+        response = HttpResponse(blob.body, content_type='application/json')
+    response['ETag'] = blob.etag
+    response['Last-Modified'] = http_date(blob.last_modified)
+    response['Cache-Control'] = cache_control
+    return response
+
+
+@require_GET
+async def get_category_fields_api(request, category_id):
     """API endpoint to get category-specific fields configuration"""
-    try:
-        category = Category.objects.get(id=category_id)
-        fields = get_category_fields(category.name)
-        return JsonResponse({
-            'success': True,
-            'category_name': category.name,
-            'fields': fields
-        })
-    except Category.DoesNotExist:
+    blobs, _ = await sync_to_async(get_field_blobs)()
+    blob = blobs.get(category_id)
+    if blob is None:
         return JsonResponse({
             'success': False,
             'error': 'Category not found'
         }, status=404)
+    max_age = getattr(settings, 'CATEGORY_FIELDS_API_MAX_AGE', 86400)
+    return _blob_response(request, blob, f'public, max-age={max_age}')
+
+
+@require_GET
+async def category_fields_bulk_api(request):
+    """
+    All category field schemas in one response, keyed by category id.
+    Requested as ?v=<version> (see category_fields_url), the response is
+    immutable and cached for a year; any other URL must revalidate.
+    """
+    _, blob = await sync_to_async(get_field_blobs)()
+    if request.GET.get('v') == blob.version:
+        cache_control = 'public, max-age=31536000, immutable'
+    else:
+        cache_control = 'public, max-age=0, must-revalidate'
+    return _blob_response(request, blob, cache_control)
+
+
+def category_fields_url():
+    """Versioned URL of the bulk category fields API, for the listing forms"""
+    _, blob = get_field_blobs()
+    return f"{reverse('listings:category_fields_bulk_api')}?v={blob.version}"
 
 
 @login_required
@@ -563,7 +680,7 @@ def report_listing(request, listing_id):
             status='pending'
         )
         
-        logger.info(f"Listing #{listing.id} reported by {request.user.email} - Reason: {reason}")
+        logger.info("Listing #%s reported by %s - Reason: %s", listing.id, request.user.email, reason)
         
         # Send email notification to admins
         try:
@@ -592,7 +709,6 @@ CredMarket Admin System
                 """
                 
                 # Send email async to avoid blocking
-                import threading
                 def _send():
                     try:
                         send_mail(
@@ -603,13 +719,13 @@ CredMarket Admin System
                             fail_silently=True,
                             timeout=10,
                         )
-                        logger.info(f"Report notification email sent to {len(admin_emails)} admins")
+                        logger.info("Report notification email sent to %s admins", len(admin_emails))
                     except Exception as email_err:
-                        logger.error(f"Failed to send report notification email: {email_err}")
+                        logger.error("Failed to send report notification email: %s", email_err)
                 
-                threading.Thread(target=_send, daemon=True).start()
+                enqueue(_send)
         except Exception as e:
-            logger.error(f"Failed to prepare report notification: {e}")
+            logger.error("Failed to prepare report notification: %s", e)
         
         messages.success(
             request,
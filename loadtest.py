@@ -0,0 +1,236 @@
+"""
+HTTP load generator for the core marketplace flows
+
+Run it on the machine serving the app, against the same database (SQLite or
+a local Postgres), with a reasonably large dataset loaded:
+
+    python manage.py generate_dataset --users 10000 --listings 100000 --messages 1000000
+    gunicorn credmarket.wsgi -w 4
+    python loadtest.py --scenario marketplace -c 50 -d 30 --save baseline.json
+
+Each simulated user repeatedly picks a step (home, search, category browse,
+listing detail, inbox, conversation) by weight. Targets are sampled from the
+database, and inbox/conversation steps use sessions minted directly in the
+session store for sampled users, so no login flow is needed. Plain URLs can
+be given instead of a scenario:
+
+    python loadtest.py http://localhost:8000/api/category-fields/ -c 50 -d 20
+
+Reports throughput, errors and p50/p95/p99 latency per step. --save writes
+the results as JSON; --compare checks a run against a saved baseline and
+exits non-zero if any step's p95 regressed by more than --tolerance. Use it
+to compare deployments too (e.g. the WSGI run above vs
+`gunicorn credmarket.asgi -k uvicorn.workers.UvicornWorker`).
+Queries per request are measured by the pytest-benchmark suite in
+credmarket/test_benchmarks.py.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from importlib import import_module
+
+# (step, weight); inbox and conversation requests are made as a logged-in participant
+SCENARIOS = {
+    'marketplace': [
+        ('home', 20),
+        ('search', 20),
+        ('category', 20),
+        ('detail', 25),
+        ('inbox', 5),
+        ('conversation', 10),
+    ],
+    'browse': [
+        ('home', 30),
+        ('search', 25),
+        ('category', 25),
+        ('detail', 20),
+    ],
+}
+
+SEARCH_TERMS = ['iphone', 'laptop', 'sofa', 'bike', 'car', 'table', 'phone', 'camera', 'bed', 'flat']
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def load_targets(sample_size):
+    """Sample paths for every step (and sessions for logged-in steps) from the database"""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'credmarket.settings')
+    import django
+    django.setup()
+
+    from django.conf import settings
+    from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+    from django.urls import reverse
+    from accounts.models import User
+    from listings.models import Category, Listing
+    from messaging.models import Conversation
+
+    SessionStore = import_module(settings.SESSION_ENGINE).SessionStore
+
+    slugs = list(Listing.objects.filter(status='active').order_by('?').values_list('slug', flat=True)[:sample_size])
+    categories = list(Category.objects.filter(is_active=True).values_list('slug', flat=True))
+    conversations = list(
+        Conversation.objects.order_by('?').values_list('id', 'buyer_id', 'seller_id')[:sample_size]
+    )
+
+    sessions = {}
+    users = User.objects.in_bulk({user_id for _, buyer_id, seller_id in conversations for user_id in (buyer_id, seller_id)})
+    for user in users.values():
+        session = SessionStore()
+        session[SESSION_KEY] = str(user.pk)
+        session[BACKEND_SESSION_KEY] = 'django.contrib.auth.backends.ModelBackend'
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.create()
+        sessions[user.pk] = f'{settings.SESSION_COOKIE_NAME}={session.session_key}'
+
+    return {
+        'home': [(reverse('listings:home'), None)],
+        'search': [(f"{reverse('listings:listing_list')}?q={term}", None) for term in SEARCH_TERMS],
+        'category': [(reverse('listings:category_listings', args=[slug]), None) for slug in categories],
+        'detail': [(reverse('listings:listing_detail', args=[slug]), None) for slug in slugs],
+        'inbox': [(reverse('messaging:inbox'), cookie) for cookie in sessions.values()],
+        'conversation': [
+            (reverse('messaging:conversation_detail', args=[pk]), sessions[random.choice([buyer_id, seller_id])])
+            for pk, buyer_id, seller_id in conversations
+        ],
+    }
+
+
+def run(pick, concurrency, duration, timeout):
+    """
+    Call pick() -> (step, url, cookie) and request it from `concurrency`
+    threads for `duration` seconds. Returns ({step: [latencies]}, {step: errors}, elapsed).
+    """
+    latencies = {}
+    errors = {}
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def client():
+        while time.monotonic() < deadline:
+            step, url, cookie = pick()
+            request = urllib.request.Request(url, headers={'Cookie': cookie} if cookie else {})
+            started = time.perf_counter()
+            failed = False
+            try:
+                with urllib.request.urlopen(request, timeout=timeout) as response:
+                    response.read()
+            except urllib.error.HTTPError as e:
+                failed = e.code >= 500
+            except Exception:
+                failed = True
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.setdefault(step, []).append(elapsed)
+                if failed:
+                    errors[step] = errors.get(step, 0) + 1
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=client, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors, time.monotonic() - started
+
+
+def summarize(latencies, errors, elapsed):
+    results = {}
+    steps = dict(latencies, all=[value for values in latencies.values() for value in values])
+    for step, values in steps.items():
+        values = sorted(values)
+        results[step] = {
+            'requests': len(values),
+            'rps': round(len(values) / elapsed, 1),
+            'errors': sum(errors.values()) if step == 'all' else errors.get(step, 0),
+            'p50_ms': round(percentile(values, 0.50) * 1000, 1),
+            'p95_ms': round(percentile(values, 0.95) * 1000, 1),
+            'p99_ms': round(percentile(values, 0.99) * 1000, 1),
+        }
+    return results
+
+
+def report(results):
+    print(f"{'step':<14}{'requests':>10}{'req/s':>9}{'errors':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for step, row in results.items():
+        print(
+            f"{step:<14}{row['requests']:>10}{row['rps']:>9}{row['errors']:>8}"
+            f"{row['p50_ms']:>9}{row['p95_ms']:>9}{row['p99_ms']:>9}"
+        )
+
+
+def compare(results, baseline, tolerance):
+    """Print p95 changes against the baseline; returns the steps that regressed"""
+    regressed = []
+    for step, row in results.items():
+        before = baseline.get(step)
+        if not before or not before['p95_ms']:
+            continue
+        change = row['p95_ms'] / before['p95_ms'] - 1
+        flag = ''
+        if change > tolerance:
+            regressed.append(step)
+            flag = '  REGRESSION'
+        print(f"{step:<14} p95 {before['p95_ms']:>8} -> {row['p95_ms']:>8} ms ({change:+.0%}){flag}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('urls', nargs='*', help='URLs to request (instead of a scenario)')
+    parser.add_argument('--scenario', choices=sorted(SCENARIOS), help='Weighted marketplace flow to simulate')
+    parser.add_argument('--base-url', default='http://localhost:8000', help='Server for --scenario')
+    parser.add_argument('--sample', type=int, default=500, help='Listings/conversations to sample for --scenario')
+    parser.add_argument('-c', '--concurrency', type=int, default=20, help='Concurrent clients (default 20)')
+    parser.add_argument('-d', '--duration', type=float, default=10, help='Seconds to run (default 10)')
+    parser.add_argument('--timeout', type=float, default=30, help='Per-request timeout in seconds')
+    parser.add_argument('--save', help='Write results to this JSON file')
+    parser.add_argument('--compare', help='Baseline JSON file to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed p95 regression (default 0.25 = 25%%)')
+    args = parser.parse_args()
+
+    if args.scenario:
+        targets = load_targets(args.sample)
+        steps = [(step, weight) for step, weight in SCENARIOS[args.scenario] if targets[step]]
+        if not steps:
+            parser.error('No data to test against; seed the database first')
+        names = [step for step, _ in steps]
+        weights = [weight for _, weight in steps]
+        base_url = args.base_url.rstrip('/')
+
+        def pick():
+            step = random.choices(names, weights)[0]
+            path, cookie = random.choice(targets[step])
+            return step, base_url + path, cookie
+    elif args.urls:
+        def pick():
+            return 'url', random.choice(args.urls), None
+    else:
+        parser.error('Give URLs or --scenario')
+
+    results = summarize(*run(pick, args.concurrency, args.duration, args.timeout))
+    report(results)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressed = compare(results, json.load(f), args.tolerance)
+        if regressed:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -6,6 +6,7 @@ from .models import Conversation, Message
 class ConversationAdmin(admin.ModelAdmin):
     list_display = ['id', 'listing', 'buyer', 'seller', 'created_at', 'updated_at']
     list_filter = ['created_at', 'updated_at']
+    list_select_related = ['listing', 'buyer', 'seller']
     search_fields = ['listing__title', 'buyer__email', 'seller__email']
     readonly_fields = ['created_at', 'updated_at']
     ordering = ['-updated_at']
@@ -15,6 +16,8 @@ class ConversationAdmin(admin.ModelAdmin):
 class MessageAdmin(admin.ModelAdmin):
     list_display = ['id', 'conversation', 'sender', 'receiver', 'is_read', 'created_at']
     list_filter = ['is_read', 'created_at']
+    # Conversation.__str__ reads the buyer, seller and listing
+    list_select_related = ['sender', 'receiver', 'conversation__buyer', 'conversation__seller', 'conversation__listing']
     search_fields = ['sender__email', 'receiver__email', 'content']
     readonly_fields = ['created_at', 'read_at']
     ordering = ['-created_at']
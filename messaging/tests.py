@@ -293,3 +293,53 @@ class MessagingFormTests(TestCase):
         # Check that textarea exists for message content
         self.assertContains(response, '<textarea')
         self.assertContains(response, 'name="content"')
+
+
+class MessagePollTests(TestCase):
+    """Tests for the async message poll endpoint."""
+    
+    def setUp(self):
+        """Set up a conversation with one message."""
+        self.seller = User.objects.create_user(username='seller', email='seller@testcorp.com', password='x')
+        self.buyer = User.objects.create_user(username='buyer', email='buyer@testcorp.com', password='x')
+        category = Category.objects.create(name="Books", slug="books")
+        listing = Listing.objects.create(
+            seller=self.seller, title="Novel", description="d", category=category,
+            price=10, condition='good', location='L', city='Pune', state='MH'
+        )
+        self.conversation = Conversation.objects.create(listing=listing, buyer=self.buyer, seller=self.seller)
+        self.first = Message.objects.create(
+            conversation=self.conversation, sender=self.buyer, receiver=self.seller, content="Is it available?"
+        )
+        self.url = reverse('messaging:poll_messages', args=[self.conversation.pk])
+    
+    def test_poll_returns_new_messages_and_marks_them_read(self):
+        self.client.force_login(self.seller)
+        response = self.client.get(self.url, {'after': 0})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertIn("Is it available?", data['html'])
+        self.assertEqual(data['last_id'], self.first.id)
+        self.first.refresh_from_db()
+        self.assertTrue(self.first.is_read)
+    
+    def test_poll_times_out_with_no_messages(self):
+        self.client.force_login(self.seller)
+        with self.settings(MESSAGE_LONG_POLL=True, MESSAGE_POLL_TIMEOUT=0):
+            data = self.client.get(self.url, {'after': self.first.id}).json()
+        self.assertEqual(data, {'html': '', 'last_id': self.first.id})
+    
+    def test_short_poll_by_default(self):
+        """Without MESSAGE_LONG_POLL a poll returns at once, and the page waits between polls."""
+        self.client.force_login(self.seller)
+        with self.settings(MESSAGE_LONG_POLL=False, MESSAGE_POLL_TIMEOUT=60, MESSAGE_POLL_SECONDS=10):
+            data = self.client.get(self.url, {'after': self.first.id}).json()
+            response = self.client.get(reverse('messaging:conversation_detail', args=[self.conversation.pk]))
+        self.assertEqual(data, {'html': '', 'last_id': self.first.id})
+        self.assertContains(response, 'const pollDelay = 10000;')
+    
+    def test_poll_requires_participant(self):
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+        outsider = User.objects.create_user(username='outsider', email='outsider@testcorp.com', password='x')
+        self.client.force_login(outsider)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
@@ -6,5 +6,6 @@ app_name = 'messaging'
 urlpatterns = [
     path('', views.inbox, name='inbox'),
     path('conversation/<int:pk>/', views.conversation_detail, name='conversation_detail'),
+    path('conversation/<int:pk>/poll/', views.poll_messages, name='poll_messages'),
     path('start/<slug:listing_slug>/', views.start_conversation, name='start_conversation'),
 ]
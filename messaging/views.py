@@ -1,9 +1,16 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages as django_messages
+from django.conf import settings
 from django.db.models import Q
+from django.http import Http404, JsonResponse
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.views.decorators.http import require_GET
 from .models import Conversation, Message
 from listings.models import Listing
+import asyncio
+import time
 
 
 @login_required
@@ -21,7 +28,7 @@ def inbox(request):
 def conversation_detail(request, pk):
     """Display conversation detail and handle new messages"""
     conversation = get_object_or_404(
-        Conversation,
+        Conversation.objects.select_related('listing', 'buyer__company', 'seller__company'),
         pk=pk
     )
     
@@ -56,11 +63,15 @@ def conversation_detail(request, pk):
             # Don't show a success message for sending messages
             # Just stay on the same page without redirect to avoid popup
     
-    messages = conversation.messages.all()
+    # Not called 'messages', which base.html uses for flash messages
+    chat_messages = list(conversation.messages.select_related('sender'))
     
     context = {
         'conversation': conversation,
-        'messages': messages,
+        'chat_messages': chat_messages,
+        'last_message_id': chat_messages[-1].id if chat_messages else 0,
+        # A long poll waits server-side, so the next one can start straight away
+        'poll_delay_ms': 0 if getattr(settings, 'MESSAGE_LONG_POLL', False) else getattr(settings, 'MESSAGE_POLL_SECONDS', 10) * 1000,
     }
     return render(request, 'messaging/conversation_detail.html', context)
 
@@ -94,3 +105,48 @@ def start_conversation(request, listing_slug):
             )
     
     return redirect('messaging:conversation_detail', pk=conversation.pk)
+
+
+@require_GET
+async def poll_messages(request, pk):
+    """
+    Poll for messages newer than ?after=<message id>: returns the rendered
+    messages (possibly none) and the id to poll after next. With
+    MESSAGE_LONG_POLL (ASGI only) it first waits up to MESSAGE_POLL_TIMEOUT
+    seconds for one to arrive.
+    """
+    user = await request.auser()
+    if not user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+    try:
+        conversation = await Conversation.objects.aget(Q(buyer=user) | Q(seller=user), pk=pk)
+    except Conversation.DoesNotExist:
+        raise Http404('Conversation not found')
+    try:
+        after = int(request.GET.get('after', 0))
+    except ValueError:
+        after = 0
+
+    timeout = getattr(settings, 'MESSAGE_POLL_TIMEOUT', 25) if getattr(settings, 'MESSAGE_LONG_POLL', False) else 0
+    interval = getattr(settings, 'MESSAGE_POLL_INTERVAL', 1)
+    deadline = time.monotonic() + timeout
+    new_messages = conversation.messages.filter(id__gt=after).select_related('sender')
+    while True:
+        messages = [message async for message in new_messages]
+        if messages or time.monotonic() >= deadline:
+            break
+        await asyncio.sleep(interval)
+
+    if messages:
+        await conversation.messages.filter(
+            id__in=[message.id for message in messages], receiver=user, is_read=False
+        ).aupdate(is_read=True, read_at=timezone.now())
+
+    html = ''.join(
+        render_to_string('messaging/_message.html', {'message': message, 'user': user})
+        for message in messages
+    )
+    return JsonResponse({
+        'html': html,
+        'last_id': messages[-1].id if messages else after,
+    })